@@ -0,0 +1,69 @@
+"""Report the memory used per device by the database items.
+
+Compares the current NetconMonDbItem to the previous representation (attrs class with a __dict__, datetime objects
+and string ips), for items built the way they are loaded from the json database.
+
+Usage: python benchmarks/bench_db_memory.py [devices]
+"""
+import gc
+import sys
+import tracemalloc
+from datetime import datetime
+
+import attr
+
+from netcon_monitor.monitor.db import NetconMonDbItem
+from netcon_monitor.monitor.input import MacAddress
+
+MANUFACTURERS = [
+    "Apple, Inc.", "Samsung Electronics Co.,Ltd", "ASUSTek COMPUTER INC.", "Intel Corporate", "Espressif Inc."
+]
+
+
+@attr.s
+class LegacyDbItem:
+    mac = attr.ib(type=MacAddress)
+    ip = attr.ib(type=str)
+    hostname = attr.ib(default=None, type=str)
+    manufacturer = attr.ib(default=None, type=str)
+    last_seen = attr.ib(default=None, type=datetime)
+    alarm_timestamp = attr.ib(default=None, type=datetime)
+    allowed = attr.ib(default=False, type=bool)
+
+
+def raw_devices(count):
+    for i in range(count):
+        yield {
+            "mac": MacAddress(0x001122000000 + i),
+            "ip": f"10.{(i >> 16) & 0xFF}.{(i >> 8) & 0xFF}.{i & 0xFF}",
+            "hostname": f"host-{i}",
+            # Rebuild the strings as the json decoder does, instead of sharing the constants
+            "manufacturer": "".join(MANUFACTURERS[i % len(MANUFACTURERS)]),
+            "last_seen": datetime.fromisoformat(f"2023-01-01 00:{i % 60:02}:00.{i % 1000000:06}"),
+            "alarm_timestamp": datetime.fromisoformat("2023-01-01 00:00:00") if i % 10 == 0 else None,
+        }
+
+
+def bytes_per_device(item_class, count):
+    gc.collect()
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    items = [item_class(**raw) for raw in raw_devices(count)]
+    gc.collect()
+    end, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del items
+    return (end - start) / count
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    legacy = bytes_per_device(LegacyDbItem, count)
+    current = bytes_per_device(NetconMonDbItem, count)
+    print(f"{count} devices")
+    print(f"before (dict, datetime, str ip): {legacy:8.1f} bytes/device")
+    print(f"after  (slots, epoch, packed ip): {current:8.1f} bytes/device ({100 * (1 - current / legacy):.0f}% less)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Compare the monitored networks matcher to a linear scan of the networks.
+
+Usage: python benchmarks/bench_netmatch.py [networks] [ips]
+"""
+import random
+import sys
+import timeit
+from ipaddress import IPv4Address, ip_network
+
+from netcon_monitor.monitor.netmatch import NetconMonNetworkMatcher
+
+
+def main():
+    networks_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    ips_count = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    random.seed(0)
+    included = [f"10.{i}.0.0/16" for i in range(networks_count)]
+    excluded = [f"10.{i}.255.0/24" for i in range(0, networks_count, 5)]
+    ips = [IPv4Address(random.randint(0x0A000000, 0x0AFFFFFF)) for _ in range(ips_count)]
+
+    included_nets = [ip_network(net) for net in included]
+    excluded_nets = [ip_network(net) for net in excluded]
+    matcher = NetconMonNetworkMatcher(included, excluded)
+
+    def linear():
+        return sum(
+            1 for ip in ips
+            if any(ip in net for net in included_nets) and not any(ip in net for net in excluded_nets)
+        )
+
+    def compiled():
+        return sum(1 for ip in ips if ip in matcher)
+
+    assert linear() == compiled()
+    linear_time = min(timeit.repeat(linear, number=1, repeat=3))
+    compiled_time = min(timeit.repeat(compiled, number=1, repeat=3))
+    print(f"{ips_count} ips, {len(included)} included and {len(excluded)} excluded networks")
+    print(f"linear scan: {linear_time * 1e9 / ips_count:8.0f} ns/ip")
+    print(f"matcher:     {compiled_time * 1e9 / ips_count:8.0f} ns/ip ({linear_time / compiled_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Profile full monitor poll cycles offline, replaying recorded command outputs.
+
+Without a recording, a synthetic one is generated: devices joining, changing ip and leaving over the cycles. Record
+a real one with REPLAY_RECORD_FILE. The stage durations are read from the monitor metrics.
+
+Usage: python benchmarks/bench_replay.py [recording.jsonl.gz] [cycles] [speed]
+       python benchmarks/bench_replay.py --synthetic [devices] [cycles]
+"""
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from netcon_monitor.config import Config
+from netcon_monitor.monitor import metrics
+from netcon_monitor.monitor.input import NetconMonAsusCommandResolver, NetconMonIpCommandInput
+from netcon_monitor.monitor.monitor import NetconMonMonitor
+from netcon_monitor.monitor.replay import NetconMonCommandRecorder, NetconMonReplayInput, NetconMonReplayResolver
+
+
+def synthetic_recording(path, devices, cycles):
+    """Record cycles of ip neigh outputs where a few percent of the devices change at each cycle."""
+    random.seed(0)
+    recorder = NetconMonCommandRecorder(path)
+    online = {i: i for i in range(devices)}
+    start = time.time()
+    for cycle in range(cycles):
+        for i in random.sample(range(devices * 2), devices // 20):
+            if i in online and random.random() < 0.5:
+                del online[i]
+            else:
+                online[i] = random.randrange(devices * 2)
+        lines = [
+            f"10.0.{ip >> 8 & 0xFF}.{ip & 0xFF} dev br0 lladdr 00:11:22:{i >> 16 & 0xFF:02x}:{i >> 8 & 0xFF:02x}:"
+            f"{i & 0xFF:02x} REACHABLE\n"
+            for i, ip in online.items()
+        ]
+        recorder.record("local", NetconMonIpCommandInput.SHELL_COMMAND, start + cycle, 0.05, "".join(lines), "")
+    hosts = "".join(f"<host-{i}>00:11:22:00:{i >> 8 & 0xFF:02x}:{i & 0xFF:02x}>>" for i in range(0, devices, 3))
+    for command, output in [
+        (NetconMonAsusCommandResolver.SHELL_COMMAND_NMP, "{}"),
+        (NetconMonAsusCommandResolver.SHELL_COMMAND_DNS_CFG, ""),
+        (NetconMonAsusCommandResolver.SHELL_COMMAND_CLI_CFG, hosts),
+    ]:
+        recorder.record("local", command, start, 0.01, output, "")
+    recorder.close()
+
+
+def main():
+    tmp_dir = tempfile.mkdtemp(prefix="bench_replay")
+    if len(sys.argv) > 1 and sys.argv[1] != "--synthetic":
+        path = sys.argv[1]
+        cycles = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+        speed = float(sys.argv[3]) if len(sys.argv) > 3 else 0
+    else:
+        devices = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+        cycles = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+        speed = 0
+        path = os.path.join(tmp_dir, "recording.jsonl.gz")
+        synthetic_recording(path, devices, cycles)
+
+    logging.basicConfig(level=logging.WARNING)
+    config = {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+    config.update(
+        {
+            "DATABASE_PATH": tmp_dir,
+            "REMOTE_HOSTNAME": None,
+            "MONITORED_NETWORKS": ["0.0.0.0/0"],
+            "REPLAY_FILE": path,
+            "REPLAY_SPEED": speed,
+            "ENABLE_TELEGRAM": False,
+            "ENABLE_DISCORD": False,
+            "ENABLE_IFTT": False,
+        }
+    )
+    monitor = NetconMonMonitor(NetconMonReplayInput, NetconMonReplayResolver, config)
+
+    durations = []
+    for cycle in range(cycles):
+        start = time.perf_counter()
+        monitor._poll_targets(cycle % config["MONITOR_HOSTS_PERIODS"] == 0)
+        durations.append(time.perf_counter() - start)
+    monitor.stop()
+
+    print(f"{cycles} cycles, {len(monitor.db.store)} devices in the database")
+    print(f"cycle:    mean {statistics.mean(durations) * 1000:8.2f} ms, max {max(durations) * 1000:8.2f} ms")
+    for stage in ("fetch", "resolve", "process"):
+        count = metrics.STAGE_SECONDS.count(stage=stage, target="local")
+        if count:
+            total = metrics.STAGE_SECONDS.total(stage=stage, target="local")
+            print(f"{stage + ':':9} mean {total / count * 1000:8.2f} ms over {count} runs")
+    count = metrics.DB_SAVE_SECONDS.count(backend=type(monitor.db._backend).__name__)
+    total = metrics.DB_SAVE_SECONDS.total(backend=type(monitor.db._backend).__name__)
+    print(f"db save:  mean {total / max(count, 1) * 1000:8.2f} ms over {count} saves")
+
+
+if __name__ == "__main__":
+    main()
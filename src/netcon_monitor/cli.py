@@ -4,7 +4,10 @@ import sys
 
 from netcon_monitor.dashboard.app import NetconMonApp
 from netcon_monitor.monitor.db import NetconMonDb
+from netcon_monitor.monitor.input import MacAddress, NetconMonCommand
 from netcon_monitor.monitor.monitor import NetconMonMonitor
+from netcon_monitor.monitor.replay import NetconMonCommandRecorder
+from netcon_monitor.monitor.vendor import NetconMonOuiRegistry, NetconMonVendorCache
 
 # Next steps:
 # create ui
@@ -28,6 +31,25 @@ def main() -> None:
     """Main entry point."""
     dashboard = NetconMonApp(None, "netcon_monitor.config.Config", ENVVAR_CONFIG)
     setup_logging(logfile=dashboard.config["LOG_FILE"], loglevel=dashboard.config.get("LOG_LEVEL"))
+    vendor_cache = None
+    if dashboard.config.get("VENDOR_REMOTE_LOOKUP", True):
+        vendor_cache = NetconMonVendorCache(dashboard.config)
+    MacAddress.set_vendor_lookup(NetconMonOuiRegistry.from_config(dashboard.config), vendor_cache)
+    if vendor_cache:
+        vendor_cache.start()
+    try:
+        run(dashboard)
+    finally:
+        # The vendor lookup is global to the MacAddress class, don't leave it to the next runs in the same process
+        MacAddress.set_vendor_lookup()
+        if vendor_cache:
+            vendor_cache.stop()
+
+
+def run(dashboard: NetconMonApp) -> None:
+    if dashboard.config.get("REPLAY_RECORD_FILE"):
+        NetconMonCommand.recorder = NetconMonCommandRecorder(dashboard.config["REPLAY_RECORD_FILE"])
+        log.info(f"Recording the commands outputs in {dashboard.config['REPLAY_RECORD_FILE']}")
     database = NetconMonDb(dashboard.config)
     monitor = NetconMonMonitor(
         dashboard.config["CONNECTION_DETECTION_CLASS"],
@@ -38,13 +60,15 @@ def main() -> None:
 
     def signal_handler(sig, frame):
         monitor.stop()
+        if NetconMonCommand.recorder:
+            NetconMonCommand.recorder.close()
         sys.exit(0)
 
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGILL, signal_handler)
 
     monitor.start()
-    dashboard.run(database)
+    dashboard.run(database, monitor.bus)
 
 
 if __name__ == "__main__":
@@ -1,4 +1,7 @@
 import logging
+from typing import Any, Dict, List
+
+import netcon_monitor.monitor.db as netdb
 import netcon_monitor.monitor.input as netinput
 
 
@@ -28,6 +31,9 @@ class Config(object):
     # List networks to monitor (leave empty to monitor all connections on all networks)
     MONITORED_NETWORKS = ["192.168.0.0/24", "192.168.13.0/24"]
 
+    # List networks to exclude from the monitored networks, IPv4 or IPv6 (e.g. ["192.168.13.128/25"])
+    EXCLUDED_NETWORKS: List[str] = []
+
     # To get connection from a remote host (e.g. router), REMOTE_HOSTNAME must be specified, as well as
     # credentials (either, REMOTE_PASS, REMOTE_PRIVATE_KEY, or REMOTE_PRIVATE_KEY_FILE, or have them
     # in the user's .ssh folder
@@ -38,26 +44,106 @@ class Config(object):
     REMOTE_PRIVATE_KEY = None  # Use private key to connect
     REMOTE_PRIVATE_KEY_FILE = None  # Use the private key in the specified file to connect
 
+    # The connection to the remote host is kept open and shared by all commands
+    SSH_TIMEOUT_SECS = 10  # Timeout to connect and execute commands
+    SSH_KEEPALIVE_SECS = 30  # Period of keepalive packets
+    SSH_RECONNECT_MAX_BACKOFF_SECS = 300  # Maximum delay between two attempts when the connection failed
+    SSH_MAX_CHANNELS = 4  # Maximum number of commands executed concurrently on the remote host, besides ip monitor
+
     # Path where to store the database
     DATABASE_PATH = "/Users/viv/dev/netcon_monitor/etc/dev/config"
 
-    # Method to use to detect new connection on the devices. Must extend NetconMonInput
+    # Storage to use for the database. Must extend NetconMonDbBackend. NetconMonSqliteDbBackend keeps the devices in
+    # an indexed sqlite database, importing the json database on first start
+    DATABASE_BACKEND_CLASS = netdb.NetconMonJsonDbBackend
+
+    # Minimum delay in seconds between two database writes. Changes are always written at the end of a monitor
+    # cycle or dashboard action once this delay is elapsed, and on exit. 0 writes every change immediately.
+    DATABASE_FLUSH_INTERVAL_SECS = 0
+
+    # Minimum delay in seconds between two writes of the last seen times only, e.g. of the devices unchanged since the
+    # previous poll. The dashboard gets the new last seen times with these writes
+    DATABASE_TOUCH_FLUSH_SECS = 30
+
+    # IEEE registry csv files used to resolve devices manufacturer offline, e.g. downloaded from
+    # https://standards-oui.ieee.org/oui/oui.csv, https://standards-oui.ieee.org/oui28/mam.csv and
+    # https://standards-oui.ieee.org/oui36/oui36.csv
+    OUI_DATABASE_FILES: List[str] = []
+
+    # Fallback to api.macvendors.com for manufacturers not found in OUI_DATABASE_FILES. Results are cached by prefix in
+    # DATABASE_PATH, for VENDOR_CACHE_TTL_SECS when found, and VENDOR_CACHE_NEGATIVE_TTL_SECS when unknown. Prefixes
+    # are resolved in background by batches of VENDOR_LOOKUP_BATCH_SIZE, with VENDOR_LOOKUP_RATE_SECS between requests.
+    # Without OUI_DATABASE_FILES, this is the only way manufacturers are resolved, set to False to never query the api
+    VENDOR_REMOTE_LOOKUP = True
+    VENDOR_CACHE_TTL_SECS = 30 * 86400
+    VENDOR_CACHE_NEGATIVE_TTL_SECS = 86400
+    VENDOR_LOOKUP_BATCH_SIZE = 32
+    VENDOR_LOOKUP_RATE_SECS = 1.0
+
+    # Method to use to detect new connection on the devices. Must extend NetconMonInput. NetconMonIpMonitorInput also
+    # follows `ip monitor neigh` to detect devices within seconds, between the polls. For local monitoring,
+    # netcon_monitor.monitor.kernel.NetconMonNetlinkInput and NetconMonProcArpInput read the kernel neighbor table
+    # directly, without executing any command
     CONNECTION_DETECTION_CLASS=netinput.NetconMonIpCommandInput
 
     # Method to use to detect devices hostnames. Must extend NetconMonResolver
     HOSTNAME_DETECTION_CLASS=netinput.NetconMonAsusCommandResolver
 
+    # Delay in seconds between two manufacturer lookups of the devices unchanged since the previous poll, when it was
+    # not found
+    MONITOR_MANUFACTURER_RETRY_SECS = 3600
+
+    # Outputs of the commands are appended to REPLAY_RECORD_FILE when set, e.g. "/data/recording.jsonl.gz". To replay
+    # them without any network, set CONNECTION_DETECTION_CLASS to netcon_monitor.monitor.replay.NetconMonReplayInput,
+    # HOSTNAME_DETECTION_CLASS to NetconMonReplayResolver and REPLAY_FILE to the recording. The outputs are parsed with
+    # REPLAY_INPUT_CLASS and REPLAY_RESOLVER_CLASS, at REPLAY_SPEED times the recorded pace, or as fast as possible if 0
+    REPLAY_RECORD_FILE = None
+    REPLAY_FILE = None
+    REPLAY_SPEED = 1.0
+    REPLAY_INPUT_CLASS = netinput.NetconMonIpCommandInput
+    REPLAY_RESOLVER_CLASS = netinput.NetconMonAsusCommandResolver
+
+    # Hosts to monitor concurrently. Each target is a dict overriding the settings above for this host, named by its
+    # NAME key. e.g. [{"NAME": "site1", "REMOTE_HOSTNAME": "10.0.1.1"}, {"NAME": "site2", "REMOTE_HOSTNAME": "10.0.2.1",
+    # "REMOTE_USER": "admin", "CONNECTION_DETECTION_CLASS": netinput.NetconMonArpCommandInput}]
+    # Leave empty to only monitor the host configured above
+    MONITOR_TARGETS: List[Dict[str, Any]] = []
+
+    # Maximum number of targets polled at the same time
+    MONITOR_MAX_WORKERS = 8
+
+    # Time in seconds after which a running target poll is abandoned, so that unreachable targets don't delay the
+    # others. Targets waiting for a worker are cancelled if they could not start within MONITOR_DELAY_SECS
+    MONITOR_TARGET_TIMEOUT_SECS = 60
+
+    # Devices connection sessions are kept in DATABASE_PATH for PRESENCE_HISTORY_RETENTION_SECS, and at most
+    # PRESENCE_HISTORY_MAX_SESSIONS sessions
+    PRESENCE_HISTORY_RETENTION_SECS = 90 * 86400
+    PRESENCE_HISTORY_MAX_SESSIONS = 1000000
+
     ###################################################################################################
     # Network alarm settings
     ###################################################################################################
     ALARM_TTL_SECS = 1800
 
+    # Alarms are sent in background. Failed sends are retried after ALARM_RETRY_SECS, doubled at each failure up to
+    # ALARM_MAX_RETRY_SECS, and undelivered alarms are kept in DATABASE_PATH until the next start
+    ALARM_RETRY_SECS = 5
+    ALARM_MAX_RETRY_SECS = 600
+
+    # Alarms raised within ALARM_COALESCE_SECS are sent as a single message, listing at most ALARM_DIGEST_MAX_DEVICES
+    # devices followed by ALARM_MESSAGE_MORE. Messages too long for the provider are split
+    ALARM_COALESCE_SECS = 30
+    ALARM_DIGEST_MAX_DEVICES = 50
+    ALARM_MESSAGE_MORE = "... and {} more devices\n"
+
     # To enable telegram notifications, both keys must be filled
     ENABLE_TELEGRAM = False
     TELEGRAM_BOT_KEY = "1110478838:AAGZVZdZqjUPffFTIxpgLVIKI5r7yg5h_8g"
     TELEGRAM_CHAT_ID = "-489391168"
     TELEGRAM_MESSAGE = "<b>{} new connections to Dwarfnet</b>:\n\n{}"
     TELEGRAM_MESSAGE_DEVICE = "- {}, {}, {}, {}\n"
+    TELEGRAM_RATE_LIMIT_SECS = 3  # Minimum time between two messages
 
     # To enable telegram notifications, both keys must be filled
     ENABLE_DISCORD = True
@@ -65,6 +151,7 @@ class Config(object):
     DISCORD_WEBHOOK_USER = "Network connections monitor"
     DISCORD_MESSAGE = "**{} new connections to Dwarfnet**:\n\n{}"
     DISCORD_MESSAGE_DEVICE = "- {}, {}, {}, {}\n"
+    DISCORD_RATE_LIMIT_SECS = 2  # Minimum time between two messages
 
     ###################################################################################################
     # Dashboard server settings
@@ -73,7 +160,19 @@ class Config(object):
     # Server config
     HOST = "0.0.0.0"  # use 0.0.0.0 to bind to all interfaces
     PORT = 9333  # ports < 1024 need root
-    DEBUG = True  # if True, enable reloader and debugger
+    DEBUG = False  # if True, enable reloader and debugger, with the development server
+
+    # "threaded" serves the dashboard with waitress when installed, else with the embedded multi-threaded wsgiref
+    # server, "development" with the flask one. Waitress uses DASHBOARD_THREADS threads, plus one per event stream
+    DASHBOARD_SERVER = "threaded"
+    DASHBOARD_THREADS = 8
 
     # Preset refresh times in seconds
     REFRESH_TIMES = [30, 60, 300, 600]
+
+    # Devices changes are pushed to the browsers as they happen. Browsers too slow to follow SSE_CLIENT_QUEUE_SIZE
+    # events are disconnected, and changes of more than SSE_MAX_PATCH_DEVICES devices reload the displayed page
+    SSE_CLIENT_QUEUE_SIZE = 256
+    SSE_MAX_CLIENTS = 32
+    SSE_MAX_PATCH_DEVICES = 100
+    SSE_KEEPALIVE_SECS = 15
@@ -1,9 +1,19 @@
+import json
+import mimetypes
 import os
 from importlib import metadata
+from typing import Any, Dict, Iterator, Optional
 
-from flask import Blueprint, Flask, current_app, render_template
+from flask import Blueprint, Flask, Response, current_app, render_template, request, stream_with_context
 
-from netcon_monitor.monitor.db import NetconMonDb
+from netcon_monitor.dashboard import server
+from netcon_monitor.dashboard.events import NetconMonEventClient, NetconMonEventStream
+from netcon_monitor.dashboard.server import NetconMonStaticAssets
+from netcon_monitor.dashboard.table import NetconMonDeviceTable
+from netcon_monitor.monitor.db import NetconMonDb, NetconMonDbItem
+from netcon_monitor.monitor.input import MacAddress
+from netcon_monitor.monitor.metrics import registry
+from netcon_monitor.monitor.presence import EVENT_DEVICES_CHANGED, EVENT_LEAVE, NetconMonEventBus
 
 # from pyweblogalyzer.dataset.weblogdata import WebLogData
 
@@ -11,10 +21,16 @@ appblueprint = Blueprint("dashboard", __name__)
 
 
 class NetconMonApp(Flask):
-    def __init__(self, dataset, config_class, config_env: None):
+    # Fingerprinted static files never change
+    STATIC_MAX_AGE_SECS = 365 * 86400
+
+    def __init__(self, dataset, config_class, config_env: Optional[str]):
         super().__init__(__name__)
         # self._dataset = dataset
         self._load_config(config_class, config_env)
+        self._assets = NetconMonStaticAssets(self.static_folder or os.path.join(self.root_path, "static"))
+        self.url_defaults(self._fingerprint_static)
+        self.after_request(self._static_cache_headers)
         self.register_blueprint(appblueprint)
 
     def _load_config(self, config_class, config_env):
@@ -23,24 +39,171 @@ class NetconMonApp(Flask):
             self.config.from_envvar(config_env)
         self.config["VERSION"] = metadata.version("netcon_monitor")
 
-    def run(self, database: NetconMonDb):
-        """Start the web app."""
+    def run(self, database: NetconMonDb, bus: Optional[NetconMonEventBus] = None):
+        """Start the web app, pushing the events of the bus to the browsers if given."""
         # Don't use the reloader as it restarts the app dynamically, creating a new collector
         self._db = database
-        super().run(host=self.config["HOST"], port=self.config["PORT"], debug=self.config["DEBUG"], use_reloader=False)
-        self.logger.info("Dashboard started, listening on port {self.config['PORT']}")
+        self._table = NetconMonDeviceTable(database)
+        self._events: Optional[NetconMonEventStream] = None
+        if bus:
+            self._events = NetconMonEventStream(
+                bus, self.config.get("SSE_CLIENT_QUEUE_SIZE", 256), self.config.get("SSE_MAX_CLIENTS", 32)
+            )
+        self._assets.precompress()
+        if self.config.get("DASHBOARD_SERVER", "threaded") == "threaded" and not self.config["DEBUG"]:
+            # Each event stream holds a thread
+            threads = self.config.get("DASHBOARD_THREADS", 8) + (self.config.get("SSE_MAX_CLIENTS", 32) if bus else 0)
+            server.serve(self, self.config["HOST"], self.config["PORT"], threads)
+        else:
+            super().run(
+                host=self.config["HOST"], port=self.config["PORT"], debug=self.config["DEBUG"], use_reloader=False
+            )
+
+    def _fingerprint_static(self, endpoint: str, values: Dict[str, Any]) -> None:
+        """Add the content hash of the static files to their urls."""
+        if endpoint == "static" and "filename" in values and "v" not in values:
+            file_hash = self._assets.hash(values["filename"])
+            if file_hash:
+                values["v"] = file_hash
+
+    def _static_cache_headers(self, response: Response) -> Response:
+        if request.endpoint == "static" and response.status_code in (200, 304):
+            response.vary.add("Accept-Encoding")
+            if request.args.get("v"):
+                response.cache_control.public = True
+                response.cache_control.max_age = self.STATIC_MAX_AGE_SECS
+                response.cache_control.immutable = True
+        return response
+
+    def send_static_file(self, filename: str) -> Response:
+        """Send a static file, compressed if accepted by the client."""
+        encoding = request.accept_encodings.best_match(self._assets.encodings)
+        if not encoding or not self._assets.compressible(filename):
+            return super().send_static_file(filename)
+
+        response = Response(self._assets.compressed(filename, encoding), mimetype=mimetypes.guess_type(filename)[0])
+        response.content_encoding = encoding
+        response.set_etag(f"{self._assets.hash(filename)}-{encoding}")
+        response.make_conditional(request)
+        return response
 
     def render_index(self):
-        return render_template("index.html", config=self.config, db=self._db)
-
-    def allow_device(self, mac_str: str, allow: bool) -> bool:
+        # The devices are loaded by the page, it only changes with the version and the config, reloaded at start
+        etag = f"{self.config['VERSION']}-{self._db.epoch}"
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers={"ETag": f'"{etag}"'})
+        response = Response(render_template("index.html", config=self.config))
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response
+
+    def device_json(self, device: NetconMonDbItem) -> Dict[str, Any]:
+        data = device.to_dict()
+        data["key"] = str(device.mac).replace(":", "")
+        data[NetconMonDbItem.DICT_KEY_ALARMTS] = str(device.alarm_timestamp) if device.in_alarm() else None
+        data["online"] = device.is_online(self._db.online_ttl)
+        return data
+
+    def get_devices(self, epoch: str, since: int):
+        """Get the number of devices changed since a revision, or of all the devices if the revision is from another
+        run. The dashboard only uses it to know whether to redraw the table, which fetches its own page of devices.
+
+        Requests with the ETag of the current revision get a 304 response.
+        """
+        snapshot = self._db.snapshot
+        etag = f"{snapshot.epoch}-{snapshot.revision}"
+        if request.if_none_match.contains(etag):
+            return "", 304, {"ETag": f'"{etag}"'}
+
+        full = epoch != snapshot.epoch or since > snapshot.revision
+        if full:
+            changed = len(snapshot.items)
+        else:
+            _, keys = snapshot.changes_since(since)
+            changed = len(keys)
+        response = {"epoch": snapshot.epoch, "revision": snapshot.revision, "full": full, "changed": changed}
+        return response, 200, {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+
+    def get_devices_table(self, args) -> Dict[str, Any]:
+        """Get a page of the devices table, following the DataTables server side processing protocol."""
+        # The page is at this revision or a later one
+        snapshot = self._db.snapshot
+        total, count, devices = self._table.query(
+            start=args.get("start", 0, type=int),
+            length=args.get("length", 20, type=int),
+            column=args.get("order[0][column]", 1, type=int),
+            descending=args.get("order[0][dir]", "desc") == "desc",
+            search=args.get("search[value]", ""),
+            show_offline=args.get("show_offline") == "true",
+        )
+        return {
+            "draw": args.get("draw", 0, type=int),
+            "recordsTotal": total,
+            "recordsFiltered": count,
+            "data": [self.device_json(device) for device in devices],
+            "epoch": snapshot.epoch,
+            "revision": snapshot.revision,
+        }
+
+    def _event_data(self, event: str, payload: Any) -> Dict[str, Any]:
+        if event == EVENT_DEVICES_CHANGED:
+            if len(payload["keys"]) > self.config.get("SSE_MAX_PATCH_DEVICES", 100):
+                return {"revision": payload["revision"], "resync": True}
+            items = self._db.snapshot.items
+            devices = [items[key] for key in payload["keys"] if key in items]
+            return {"revision": payload["revision"], "devices": [self.device_json(device) for device in devices]}
+        if event == EVENT_LEAVE:
+            return {"key": str(payload.mac).replace(":", ""), "mac": str(payload.mac)}
+        # Device events are published by the monitor before the changes are committed, send the committed device
+        return self.device_json(self._db.snapshot.get(payload.mac) or payload.copy())
+
+    def stream_events(self, client: NetconMonEventClient, keepalive: float) -> Iterator[str]:
+        """Stream the events of a client as server-sent events."""
+        if not self._events:
+            return
+        yield f"retry: {int(keepalive * 1000)}\n\n"
+        for item in self._events.events(client, keepalive):
+            if item is None:
+                # Comments keep the connection open, and detect the closed ones
+                yield ": keepalive\n\n"
+            else:
+                event, payload = item
+                yield f"event: {event}\ndata: {json.dumps(self._event_data(event, payload))}\n\n"
+
+    def get_events(self):
+        events = self._events
+        if not events:
+            return "", 204
+        keepalive = self.config.get("SSE_KEEPALIVE_SECS", 15)
+        client = events.connect()
+        if not client:
+            # Browsers don't reconnect after an error, the dashboard follows the events again after Retry-After
+            headers = {"Retry-After": str(max(int(keepalive), 1)), "Cache-Control": "no-cache"}
+            return Response("Too many dashboard event streams\n", 503, headers=headers, mimetype="text/plain")
+        headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        response = Response(
+            stream_with_context(self.stream_events(client, keepalive)), mimetype="text/event-stream", headers=headers
+        )
+        # Free the client slot even if the stream is closed before it starts
+        response.call_on_close(lambda: events.disconnect(client))
+        return response
+
+    def get_metrics(self):
+        """Expose the monitor metrics in the prometheus text format."""
+        return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+    def allow_device(self, mac: MacAddress, allow: bool) -> bool:
         """Set a device as allowed, reset alarm , and return the device status."""
-        device = self._db.get(mac_str)
-        device.allowed = allow
-        if allow:
-            device.set_alarm(False)
-        self._db.add_item(device)
-        return self._db.get(mac_str).allowed
+        with self._db.transaction():
+            device = self._db.get(mac)
+            if not device:
+                return False
+            device.allowed = allow
+            if allow:
+                device.set_alarm(False)
+            self._db.add_item(device)
+        device = self._db.snapshot.get(mac)
+        return bool(device and device.allowed)
 
 
 @appblueprint.route("/", methods=["GET"])
@@ -48,15 +211,33 @@ def get_index():
     return current_app.render_index()
 
 
+@appblueprint.route("/api/devices", methods=["GET"])
+def get_devices():
+    return current_app.get_devices(request.args.get("epoch", ""), request.args.get("since", 0, type=int))
+
+
+@appblueprint.route("/api/devices/table", methods=["GET"])
+def get_devices_table():
+    return current_app.get_devices_table(request.args)
+
+
+@appblueprint.route("/api/events", methods=["GET"])
+def get_events():
+    return current_app.get_events()
+
+
+@appblueprint.route("/metrics", methods=["GET"])
+def get_metrics():
+    return current_app.get_metrics()
+
+
 @appblueprint.route("/allow/<dev_key>", methods=["GET"])
 def enable_device(dev_key):
-    mac_str = ":".join([dev_key[i : i + 2] for i in range(0, len(dev_key), 2)])
-    status = current_app.allow_device(mac_str, True)
+    status = current_app.allow_device(MacAddress(dev_key), True)
     return {"status": status}
 
 
 @appblueprint.route("/disallow/<dev_key>", methods=["GET"])
 def disable_device(dev_key):
-    mac_str = ":".join([dev_key[i : i + 2] for i in range(0, len(dev_key), 2)])
-    status = current_app.allow_device(mac_str, False)
+    status = current_app.allow_device(MacAddress(dev_key), False)
     return {"status": status}
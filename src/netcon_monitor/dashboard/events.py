@@ -0,0 +1,84 @@
+import logging
+import queue
+from threading import Lock
+from typing import Any, Iterator, List, Optional, Tuple
+
+from netcon_monitor.monitor.presence import (
+    EVENT_ALARM_CLEARED,
+    EVENT_ALARM_RAISED,
+    EVENT_DEVICES_CHANGED,
+    EVENT_JOIN,
+    EVENT_LEAVE,
+    EVENT_NEW_DEVICE,
+    NetconMonEventBus,
+)
+
+
+class NetconMonEventClient:
+    """Events queue of a connected browser.
+
+    The queue is bounded: a client too slow to follow is dropped instead of holding the events, and resyncs when it
+    reconnects.
+    """
+
+    def __init__(self, size: int) -> None:
+        self._queue: "queue.Queue[Tuple[str, Any]]" = queue.Queue(maxsize=size)
+        self.dropped = False
+
+    def put(self, event: str, payload: Any) -> None:
+        if self.dropped:
+            return
+        try:
+            self._queue.put_nowait((event, payload))
+        except queue.Full:
+            self.dropped = True
+
+    def get(self, timeout: float) -> Optional[Tuple[str, Any]]:
+        """Get the next event, or None if no event was received within the timeout."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class NetconMonEventStream:
+    """Fan out the monitor events to the connected browsers, without ever blocking the monitor thread."""
+
+    EVENTS = [
+        EVENT_DEVICES_CHANGED, EVENT_NEW_DEVICE, EVENT_JOIN, EVENT_LEAVE, EVENT_ALARM_RAISED, EVENT_ALARM_CLEARED
+    ]
+
+    def __init__(self, bus: NetconMonEventBus, queue_size: int = 256, max_clients: int = 32) -> None:
+        self.logger = logging.getLogger(__name__)
+        self._queue_size = queue_size
+        self._max_clients = max_clients
+        self._lock = Lock()
+        self._clients: List[NetconMonEventClient] = []
+        bus.subscribe(self._publish, self.EVENTS)
+
+    def _publish(self, event: str, payload: Any) -> None:
+        for client in self._clients:
+            client.put(event, payload)
+
+    def connect(self) -> Optional[NetconMonEventClient]:
+        """Register a new client, or return None if too many clients are connected."""
+        with self._lock:
+            if len(self._clients) >= self._max_clients:
+                return None
+            client = NetconMonEventClient(self._queue_size)
+            self._clients = self._clients + [client]
+        return client
+
+    def disconnect(self, client: NetconMonEventClient) -> None:
+        with self._lock:
+            self._clients = [other for other in self._clients if other is not client]
+
+    def events(self, client: NetconMonEventClient, keepalive: float) -> Iterator[Optional[Tuple[str, Any]]]:
+        """Iterate over the events of a client until it is dropped, yielding None every keepalive seconds without
+        event, and disconnect it when done."""
+        try:
+            while not client.dropped:
+                yield client.get(keepalive)
+            self.logger.warning("Dropping a dashboard events client too slow to follow")
+        finally:
+            self.disconnect(client)
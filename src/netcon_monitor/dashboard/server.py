@@ -0,0 +1,124 @@
+import gzip
+import hashlib
+import logging
+import os
+from socketserver import ThreadingMixIn
+from threading import Lock
+from typing import Dict, Optional, Tuple
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import waitress
+except ImportError:
+    waitress = None
+
+log = logging.getLogger(__name__)
+
+
+class NetconMonWsgiServer(ThreadingMixIn, WSGIServer):
+    """Embedded WSGI server handling each request in its own thread, so that long event streams and slow clients
+    don't hold the others."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 64
+
+
+class NetconMonRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        log.debug(f"{self.address_string()} {format % args}")
+
+
+def serve(app, host: str, port: int, threads: int = 8) -> None:
+    """Serve a WSGI app until interrupted, with waitress when installed, else with the wsgiref threaded server.
+
+    Waitress serves the requests with a pool of threads, each event stream holding one of them.
+    """
+    if waitress:
+        log.info(f"Dashboard listening on {host}:{port} with waitress, {threads} threads")
+        waitress.serve(app, host=host, port=port, threads=threads, ident="netcon_monitor")
+        return
+    with make_server(host, port, app, NetconMonWsgiServer, NetconMonRequestHandler) as server:
+        log.info(f"Dashboard listening on {host}:{port}")
+        server.serve_forever()
+
+
+class NetconMonStaticAssets:
+    """Content hashes and compressed versions of the static files, computed once per file.
+
+    Hashes are used to fingerprint the static urls, so that the files can be cached by the browsers until they
+    change. Text files are compressed with gzip, and brotli when installed, all at start with precompress.
+    """
+
+    COMPRESSED_EXTENSIONS = (".css", ".js", ".map", ".svg", ".ttf", ".eot", ".ico", ".html", ".json", ".txt")
+    MIN_COMPRESSED_SIZE = 512
+
+    def __init__(self, folder: str) -> None:
+        self._folder = os.path.realpath(folder)
+        self._lock = Lock()
+        self._hashes: Dict[str, Optional[str]] = {}
+        self._compressed: Dict[Tuple[str, str], bytes] = {}
+
+    @property
+    def encodings(self) -> Tuple[str, ...]:
+        return ("br", "gzip") if brotli else ("gzip",)
+
+    def _path(self, filename: str) -> Optional[str]:
+        path = os.path.realpath(os.path.join(self._folder, filename))
+        if not path.startswith(self._folder + os.sep) or not os.path.isfile(path):
+            return None
+        return path
+
+    def _read(self, filename: str) -> Optional[bytes]:
+        path = self._path(filename)
+        if not path:
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def hash(self, filename: str) -> Optional[str]:
+        """Get the content hash of a file, or None if it doesn't exist."""
+        if filename not in self._hashes:
+            data = self._read(filename)
+            self._hashes[filename] = hashlib.sha1(data).hexdigest()[:12] if data is not None else None
+        return self._hashes[filename]
+
+    def compressible(self, filename: str) -> bool:
+        path = self._path(filename)
+        return path is not None and filename.endswith(self.COMPRESSED_EXTENSIONS) and (
+            os.path.getsize(path) >= self.MIN_COMPRESSED_SIZE
+        )
+
+    def precompress(self) -> None:
+        """Hash and compress all the static files, so that no request waits for it."""
+        count = 0
+        for root, _, files in os.walk(self._folder):
+            for name in files:
+                filename = os.path.relpath(os.path.join(root, name), self._folder).replace(os.sep, "/")
+                self.hash(filename)
+                if self.compressible(filename):
+                    for encoding in self.encodings:
+                        self.compressed(filename, encoding)
+                    count += 1
+        log.info(f"Compressed {count} static files with {', '.join(self.encodings)}")
+
+    def compressed(self, filename: str, encoding: str) -> Optional[bytes]:
+        """Get a file compressed with an encoding, compressing it at the first request."""
+        key = (filename, encoding)
+        if key not in self._compressed:
+            with self._lock:
+                if key not in self._compressed:
+                    data = self._read(filename)
+                    if data is None:
+                        return None
+                    if encoding == "br":
+                        data = brotli.compress(data)
+                    else:
+                        data = gzip.compress(data, compresslevel=9, mtime=0)
+                    self._compressed[key] = data
+        return self._compressed[key]
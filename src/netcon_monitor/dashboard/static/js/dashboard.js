@@ -5,26 +5,120 @@ function set_refresh(period_sec) {
     if (period_sec > 0) refreshTimer = setInterval(refreshDashboards, period_sec*1000);
 }
 
+var devicesEpoch = null;
+var devicesRevision = 0;
+var devicesEtag = null;
+
 function refreshDashboards() {
     console.log(new Date(Date.now()).toISOString() + ": Requesting dashboard data");
-    // $.get(getDashboardsDatatUrl, function(data) {dataReceived(data);});
+    // Only request the devices changed since the last received revision
+    $.ajax({
+        url: "/api/devices",
+        data: {epoch: devicesEpoch, since: devicesRevision},
+        headers: devicesEtag ? {"If-None-Match": devicesEtag} : {},
+        success: function(data, status, xhr) {
+            if (xhr.status != 304) {
+                devicesEtag = xhr.getResponseHeader("ETag");
+                devicesReceived(data);
+            }
+            $("#last_update").html("Last updated: " + new Date(Date.now()).toLocaleTimeString())
+        }
+    });
+}
+
+function escapeHtml(value) {
+    return $("<div>").text(value == null ? "None" : value).html();
 }
 
-// function dataReceived(json_resp)
-// {
-//     console.log(new Date(Date.now()).toISOString() + ": Received dashboard data");
+function deviceRow(dev) {
+    return [
+        escapeHtml(dev.ip),
+        escapeHtml(dev.mac),
+        escapeHtml(dev.hostname),
+        escapeHtml(dev.manufacturer),
+        dev.source ? escapeHtml(dev.source) : "",
+        dev.last_seen,
+        dev.alarm_timestamp || "",
+        `<div class="form-switch"><input class="form-check-input" type="checkbox" value="allow" role="switch" ` +
+            `id="allow-${dev.key}" onclick=allow_device("${dev.key}") ${dev.allowed ? "checked" : ""}></div>`,
+        dev.online ? "True" : "False",
+    ];
+}
+
+function devicesReceived(json_resp)
+{
+    console.log(new Date(Date.now()).toISOString() + ": " + json_resp.changed + " changed devices");
+    // Only redraw the current page when some devices changed, the table was just loaded at the first response
+    if (devicesEpoch != null && (json_resp.full || json_resp.changed)) $("#connection-table").DataTable().draw(false);
+    devicesEpoch = json_resp.epoch;
+    devicesRevision = json_resp.revision;
+}
 
-//     // Update tables
-//     dt = $("#db-card-table-" + json_resp.dashboards[i].db_id).DataTable();
-//     dt.clear(); // TODO: only send new elements, then don't clear
-//     dt.rows.add(json_resp.dashboards[i].table_data)
-//     dt.draw()
-//     }
-//     $("#last_update").html("Last updated: " + new Date(Date.now()).toLocaleTimeString())
-//     $('#loadsign').hide();
-//     console.log(new Date(Date.now()).toISOString() + ": Processed dashboard data");
-// }
+function patchDevices(devices)
+{
+    // Only the rows of the displayed page can be patched, the other devices are fetched with their page
+    var dt = $("#connection-table").DataTable();
+    for (const dev of devices) {
+        var row = dt.row("#dev-" + dev.key);
+        if (row.any()) {
+            row.data(deviceRow(dev));
+            $(row.node()).toggleClass("dev_alarm", dev.alarm_timestamp != null);
+        }
+    }
+    $("#last_update").html("Last updated: " + new Date(Date.now()).toLocaleTimeString())
+}
 
+var redrawTimer = null;
+
+function scheduleRedraw()
+{
+    // Group the redraws of bursts of events
+    if (redrawTimer == null) {
+        redrawTimer = setTimeout(function() {
+            redrawTimer = null;
+            $("#connection-table").DataTable().draw(false);
+        }, 1000);
+    }
+}
+
+function followEvents()
+{
+    if (!window.EventSource) return;
+    var source = new EventSource("/api/events");
+    // Catch up with the changes missed while disconnected
+    source.onopen = refreshDashboards;
+    // The server answers 503 when too many dashboards follow the events, and browsers don't reconnect after it
+    source.onerror = function() {
+        if (source.readyState == EventSource.CLOSED) setTimeout(followEvents, 30000);
+    };
+    source.addEventListener("devices_changed", function(event) {
+        var data = JSON.parse(event.data);
+        if (data.resync) scheduleRedraw();
+        else patchDevices(data.devices);
+        devicesRevision = Math.max(devicesRevision, data.revision);
+    });
+    for (const name of ["alarm_raised", "alarm_cleared"]) {
+        source.addEventListener(name, function(event) { patchDevices([JSON.parse(event.data)]); });
+    }
+    // New and leaving devices change the displayed rows
+    for (const name of ["new_device", "join", "leave"]) {
+        source.addEventListener(name, scheduleRedraw);
+    }
+}
+
+function tableDataReceived(json_resp)
+{
+    // Follow the changes from the revision of the table
+    if (json_resp.epoch != devicesEpoch) devicesRevision = json_resp.revision;
+    else devicesRevision = Math.max(devicesRevision, json_resp.revision);
+    devicesEpoch = json_resp.epoch;
+    return json_resp.data.map(function(dev) {
+        var row = deviceRow(dev);
+        row.DT_RowId = "dev-" + dev.key;
+        row.DT_RowClass = dev.alarm_timestamp != null ? "dev_alarm" : "";
+        return row;
+    });
+}
 
 function formatFloatTime(ftime) {
     if (ftime < 1) return `${ftime * 1000} ms`;
@@ -44,21 +138,18 @@ function formatFloatTime(ftime) {
 
 function createDashboardTable(tableId, ctxt = false, tab_data=null)
 {
-  // Custom filter to display or not the row with online value = False
-  $.fn.dataTable.ext.search.push(
-    function( settings, data, dataIndex ) {
-      if ( settings.nTable.id == tableId ) {
-        var episodes = parseFloat( data[7] ) || 0; // use data for the episodes column
-        if ((data[7] == "False") && !$("#show_offline").prop( "checked" )) return false;
-      }
-      return true;
-    }
-  );
-
+  // Devices are paged, sorted and filtered by the server, offline devices included or not
   var dbTable = $('#'+tableId).DataTable( {
     // "columns": [{ "width": 25 },{  }],
     // "initComplete": function( settings, json ) {},
-    data: tab_data,
+    serverSide: true,
+    processing: true,
+    searchDelay: 300,
+    ajax: {
+      url: "/api/devices/table",
+      data: function(params) { params.show_offline = $("#show_offline").prop("checked"); },
+      dataSrc: tableDataReceived,
+    },
     columnDefs: [
       {
           targets: "datetime_column",
@@ -159,9 +250,10 @@ function pageStart()
     // Show the loader, hide the dashboards; and request the data
     $('#loadsign').show();
 
-    // Create the datatables of each dashboard
+    // Create the datatables of each dashboard, the devices are rendered at the revision of the table
     createDashboardTable('connection-table');
 
-    // Request dashboards data
+    // Request dashboards data, and follow the changes pushed by the server
     refreshDashboards();
+    followEvents();
 }
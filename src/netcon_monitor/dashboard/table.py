@@ -0,0 +1,175 @@
+import time
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from netcon_monitor.monitor.db import NetconMonDb, NetconMonDbItem, NetconMonDbSnapshot
+from netcon_monitor.monitor.input import MacAddress
+
+
+class NetconMonSearchIndex:
+    """Substring search in the devices search texts, with an inverted index of their trigrams.
+
+    The devices containing all the trigrams of a search are found from the index, and only them are matched.
+    Searches shorter than a trigram scan all the texts.
+    """
+
+    GRAM = 3
+
+    def __init__(self) -> None:
+        self._texts: Dict[MacAddress, str] = {}
+        self._postings: Dict[str, Set[MacAddress]] = {}
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    @classmethod
+    def _grams(cls, text: str) -> Set[str]:
+        return {text[i : i + cls.GRAM] for i in range(len(text) - cls.GRAM + 1)}
+
+    def update(self, key: MacAddress, text: Optional[str]) -> None:
+        """Set the search text of a device, or remove it if None."""
+        old = self._texts.get(key)
+        if old == text:
+            return
+        if old is not None:
+            del self._texts[key]
+            for gram in self._grams(old):
+                keys = self._postings[gram]
+                keys.discard(key)
+                if not keys:
+                    del self._postings[gram]
+        if text is not None:
+            self._texts[key] = text
+            for gram in self._grams(text):
+                self._postings.setdefault(gram, set()).add(key)
+
+    def clear(self) -> None:
+        self._texts = {}
+        self._postings = {}
+
+    def search(self, query: str) -> Iterable[MacAddress]:
+        """Get the keys of the devices whose search text contains the query."""
+        if len(query) < self.GRAM:
+            return [key for key, text in self._texts.items() if query in text]
+        # Intersect from the rarest trigram, the candidates only get fewer
+        grams = sorted(self._grams(query), key=lambda gram: len(self._postings.get(gram, ())))
+        candidates = self._postings.get(grams[0], set())
+        for gram in grams[1:]:
+            if not candidates:
+                break
+            candidates = candidates & self._postings[gram]
+        return [key for key in candidates if query in self._texts[key]]
+
+
+class NetconMonDeviceTable:
+    """Server side processing of the devices table: paging, sorting and search.
+
+    Sorted orders are computed once per database revision and column. The search index is updated from the devices
+    changed since the previous revision only, and the matches are ordered by their rank in the sorted order.
+    Devices are read from the database snapshots.
+    """
+
+    # Sort keys of the table columns: ip, mac, hostname, manufacturer, source, last seen, alarm, allowed, online
+    SORT_KEYS: List[Callable[[NetconMonDbItem], Any]] = [
+        lambda dev: (len(dev.packed_ip), dev.packed_ip),
+        lambda dev: int(dev.mac),
+        lambda dev: (dev.hostname or "").lower(),
+        lambda dev: (dev.manufacturer or "").lower(),
+        lambda dev: (dev.source or "").lower(),
+        lambda dev: dev.last_seen_ts,
+        lambda dev: dev.alarm_ts or 0.0,
+        lambda dev: dev.allowed,
+        lambda dev: dev.last_seen_ts,
+    ]
+    MAX_PAGE_LENGTH = 1000
+    MAX_CACHED_SEARCHES = 32
+
+    def __init__(self, db: NetconMonDb) -> None:
+        self._db = db
+        self._lock = Lock()
+        self._revision: Optional[int] = None
+        self._epoch: Optional[str] = None
+        self._snapshot: NetconMonDbSnapshot = db.snapshot
+        self._index = NetconMonSearchIndex()
+        self._orders: Dict[int, List[MacAddress]] = {}
+        self._ranks: Dict[int, Dict[MacAddress, int]] = {}
+        self._filtered: Dict[Tuple, List[MacAddress]] = {}
+
+    @staticmethod
+    def search_text(device: NetconMonDbItem) -> str:
+        return " ".join(
+            str(value).lower()
+            for value in (device.ip, device.mac, device.hostname, device.manufacturer, device.source)
+            if value is not None
+        )
+
+    def _refresh(self, snapshot: NetconMonDbSnapshot) -> None:
+        """Update the search index with the devices changed since the last request, and drop the outdated orders."""
+        if snapshot.revision == self._revision and snapshot.epoch == self._epoch:
+            return
+        if self._revision is None or snapshot.epoch != self._epoch:
+            keys = list(snapshot.items)
+            self._index.clear()
+        else:
+            _, keys = snapshot.changes_since(self._revision)
+        for key in keys:
+            device = snapshot.get(key)
+            self._index.update(key, self.search_text(device) if device else None)
+        self._revision = snapshot.revision
+        self._epoch = snapshot.epoch
+        self._snapshot = snapshot
+        self._orders = {}
+        self._ranks = {}
+        self._filtered = {}
+
+    def _order(self, column: int) -> List[MacAddress]:
+        """Get the device keys in ascending order of a column."""
+        if column not in self._orders:
+            items = self._snapshot.items.items()
+            sort_key = self.SORT_KEYS[column]
+            self._orders[column] = [key for key, _ in sorted(items, key=lambda item: sort_key(item[1]))]
+        return self._orders[column]
+
+    def _rank(self, column: int) -> Dict[MacAddress, int]:
+        """Get the position of each device key in the order of a column."""
+        if column not in self._ranks:
+            self._ranks[column] = {key: rank for rank, key in enumerate(self._order(column))}
+        return self._ranks[column]
+
+    def query(
+        self, start: int, length: int, column: int, descending: bool, search: str, show_offline: bool
+    ) -> Tuple[int, int, List[NetconMonDbItem]]:
+        """Get the total number of devices, the number of devices matching the search and online filter, and the
+        devices of the requested page."""
+        column = column if 0 <= column < len(self.SORT_KEYS) else 1
+        search = search.strip().lower()
+        length = min(length if length > 0 else self.MAX_PAGE_LENGTH, self.MAX_PAGE_LENGTH)
+        with self._lock:
+            self._refresh(self._db.snapshot)
+            store = self._snapshot.items
+            online_since = time.time() - self._db.online_ttl.total_seconds()
+            # The online filter depends on the time, only cache the searches of all the devices
+            cache_key = (column, search)
+            keys = self._filtered.get(cache_key)
+            if keys is None:
+                if search:
+                    rank = self._rank(column)
+                    keys = sorted((key for key in self._index.search(search) if key in rank), key=rank.__getitem__)
+                else:
+                    keys = self._order(column)
+                if len(self._filtered) >= self.MAX_CACHED_SEARCHES:
+                    self._filtered = {}
+                self._filtered[cache_key] = keys
+        if show_offline:
+            # Only the requested page is read
+            if descending:
+                page = keys[max(len(keys) - start - length, 0) : max(len(keys) - start, 0)][::-1]
+            else:
+                page = keys[start : start + length]
+            return len(store), len(keys), [store[key] for key in page if key in store]
+        devices = [
+            dev
+            for dev in map(store.get, reversed(keys) if descending else keys)
+            if dev and dev.last_seen_ts > online_since
+        ]
+        return len(store), len(devices), devices[start : start + length]
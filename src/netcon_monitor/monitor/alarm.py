@@ -1,57 +1,114 @@
 import asyncio
+import heapq
 import logging
+import time
 from datetime import datetime, timedelta
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, Tuple
 
 from discord import SyncWebhook
 import telegram
 
-from netcon_monitor.monitor.db import NetconMonDbItem
+from netcon_monitor.monitor.db import NetconMonDb, NetconMonDbItem
+from netcon_monitor.monitor.dispatch import NetconMonAlarmDispatcher, is_transient_error
+from netcon_monitor.monitor.input import MacAddress
+from netcon_monitor.monitor.presence import EVENT_ALARM_CLEARED, EVENT_ALARM_RAISED, NetconMonEventBus
 
 
 class NetconMonAlarmNotifier:
     DEFAULT_MESSAGE = "{} new connections:\n\n{}"
     DEFAULT_MESSAGE_DEVICE = "- {}, {}, {}, {}\n"
+    DEFAULT_MESSAGE_MORE = "... and {} more devices\n"
+    # Minimum time in seconds between two messages
+    RATE_LIMIT_SECS = 0
+    # Maximum length of a message, longer messages are split
+    MAX_MESSAGE_LENGTH: Optional[int] = None
 
     def __init__(self, config: Dict[str, Any]):
         self._config = config
         self.logger = logging.getLogger(__name__)
+        self.rate_limit_secs = self.RATE_LIMIT_SECS
+        self._max_devices = self._config.get("ALARM_DIGEST_MAX_DEVICES", 50)
         self._message_device = self.DEFAULT_MESSAGE_DEVICE
         self._message = self.DEFAULT_MESSAGE
+        self._message_more = self._config.get("ALARM_MESSAGE_MORE", self.DEFAULT_MESSAGE_MORE)
 
-    def _build_message(self, device_list):
+    def _build_messages(self, device_list) -> List[str]:
+        """Build the messages of an alarm, listing at most ALARM_DIGEST_MAX_DEVICES devices, split at the provider
+        maximum message length."""
         if not device_list:
-            return None
-
-        content = ""
-        for dev in device_list:
-            content += self._message_device.format(dev.mac, dev.manufacturer, dev.ip, dev.hostname)
-        return self._message.format(len(device_list), content)
+            return []
+
+        devices = device_list[: self._max_devices] if self._max_devices else device_list
+        lines = [self._message_device.format(dev.mac, dev.manufacturer, dev.ip, dev.hostname) for dev in devices]
+        if len(devices) < len(device_list):
+            lines.append(self._message_more.format(len(device_list) - len(devices)))
+        if not self.MAX_MESSAGE_LENGTH:
+            return [self._message.format(len(device_list), "".join(lines))]
+
+        # Lines are grouped as long as the message fits, a single line too long for a message is truncated
+        available = max(self.MAX_MESSAGE_LENGTH - len(self._message.format(len(device_list), "")), 1)
+        chunks: List[List[str]] = []
+        chunk: List[str] = []
+        chunk_length = 0
+        for line in lines:
+            line = line[:available]
+            if chunk and chunk_length + len(line) > available:
+                chunks.append(chunk)
+                chunk = []
+                chunk_length = 0
+            chunk.append(line)
+            chunk_length += len(line)
+        chunks.append(chunk)
+        return [self._message.format(len(device_list), "".join(chunk)) for chunk in chunks]
+
+    def messages(self, device_list) -> List[str]:
+        """Get the messages of an alarm. Notifiers with a send_message method are sent them one by one by the
+        dispatcher, which retries each message on its own."""
+        return self._build_messages(device_list)
+
+    def _send_messages(self, device_list, send) -> None:
+        """Send the messages of an alarm, at the notifier rate limit."""
+        for index, content in enumerate(self._build_messages(device_list)):
+            if index:
+                time.sleep(self.rate_limit_secs)
+            send(content)
+
+    def is_transient(self, error: Exception) -> bool:
+        """Whether sending the alarm again may succeed after this error."""
+        return is_transient_error(error)
 
     def raise_alarm(self, item):
         pass
 
 
 class NetconMonTelegramAlarmNotifier(NetconMonAlarmNotifier):
+    # Bots can send about 20 messages per minute to the same group
+    RATE_LIMIT_SECS = 3
+    MAX_MESSAGE_LENGTH = 4096
+
     def __init__(self, config: Dict[str, Any], loop=None) -> None:
         super().__init__(config)
+        self.rate_limit_secs = self._config.get("TELEGRAM_RATE_LIMIT_SECS", self.RATE_LIMIT_SECS)
         self.loop = loop or asyncio.new_event_loop()
         self._bot_key = self._config.get("TELEGRAM_BOT_KEY")
-        self._chat_id = self._config.get("TELEGRAM_CHAT_ID")
+        self._chat_id = self._config.get("TELEGRAM_CHAT_ID", "")
         self._message_device = self._config.get("TELEGRAM_MESSAGE_DEVICE", self.DEFAULT_MESSAGE_DEVICE)
         self._message = self._config.get("TELEGRAM_MESSAGE", self.DEFAULT_MESSAGE)
         self._bot = telegram.Bot(token=self._bot_key)
         self.loop.run_until_complete(self._bot.initialize())
 
     def raise_alarm(self, device_list):
-        if not device_list:
-            return
+        self._send_messages(device_list, self.send_message)
 
-        content = self._build_message(device_list)
+    def is_transient(self, error: Exception) -> bool:
+        # Bad requests are network errors for the library, but fail the same way when retried
+        if isinstance(error, telegram.error.BadRequest):
+            return False
+        return isinstance(error, (telegram.error.NetworkError, telegram.error.RetryAfter)) or is_transient_error(error)
 
-        if content:
-            self.logger.debug(f"Sending alert to {self._chat_id}: {content}")
-            self.loop.run_until_complete(self._bot.send_message(chat_id=self._chat_id, text=content, parse_mode="HTML"))
+    def send_message(self, content: str) -> None:
+        self.logger.debug(f"Sending alert to {self._chat_id}: {content}")
+        self.loop.run_until_complete(self._bot.send_message(chat_id=self._chat_id, text=content, parse_mode="HTML"))
 
     def close(self):
         self.loop.run_until_complete(self.bot.shutdown())
@@ -59,20 +116,25 @@ class NetconMonTelegramAlarmNotifier(NetconMonAlarmNotifier):
 
 
 class NetconMonDiscordAlarmNotifier(NetconMonAlarmNotifier):
+    # Webhooks are limited to 30 messages per minute per channel
+    RATE_LIMIT_SECS = 2
+    MAX_MESSAGE_LENGTH = 2000
+
     def __init__(self, config: Dict[str, Any], loop=None) -> None:
         super().__init__(config)
+        self.rate_limit_secs = self._config.get("DISCORD_RATE_LIMIT_SECS", self.RATE_LIMIT_SECS)
         print(f"pipo {self._config.get('DISCORD_WEBHOOK')}")
         self._webhook = SyncWebhook.from_url(self._config.get("DISCORD_WEBHOOK"))
-        self._user = self._config.get("DISCORD_WEBHOOK_USER")
+        self._user = self._config.get("DISCORD_WEBHOOK_USER", "")
         self._message_device = self._config.get("DISCORD_MESSAGE_DEVICE", self.DEFAULT_MESSAGE_DEVICE)
         self._message = self._config.get("DISCORD_MESSAGE", self.DEFAULT_MESSAGE)
 
     def raise_alarm(self, device_list):
-        content = self._build_message(device_list)
+        self._send_messages(device_list, self.send_message)
 
-        if content:
-            self.logger.debug(f"Sending alert as {self._user}: {content}")
-            self._webhook.send(content, username=self._user)
+    def send_message(self, content: str) -> None:
+        self.logger.debug(f"Sending alert as {self._user}: {content}")
+        self._webhook.send(content, username=self._user)
 
 
 class NetconMonIfttAlarmNotifier(NetconMonAlarmNotifier):
@@ -80,32 +142,100 @@ class NetconMonIfttAlarmNotifier(NetconMonAlarmNotifier):
 
 
 class NetconMonAlarm:
-    def __init__(self, config):
+    """Raise the alarms of the devices not allowed, and clear them once the devices are offline for ALARM_TTL_SECS.
+
+    Alarm deadlines are kept in a min-heap, so that alarms of devices which never come back expire on time without
+    scanning the database. Deadlines are re-checked against the devices last seen time when they are due.
+    Raised and cleared alarms are published on the event bus.
+    """
+
+    def __init__(self, config, bus: Optional[NetconMonEventBus] = None):
         self._config = config
+        self.bus = bus or NetconMonEventBus()
         self.logger = logging.getLogger(__name__)
         self._alarm_ttl = timedelta(seconds=self._config["ALARM_TTL_SECS"])
-        self._notifiers = []
+        self._notifiers: List[NetconMonAlarmNotifier] = []
         if self._config.get("ENABLE_TELEGRAM"):
             self._notifiers.append(NetconMonTelegramAlarmNotifier(self._config))
         if self._config.get("ENABLE_DISCORD"):
             self._notifiers.append(NetconMonDiscordAlarmNotifier(self._config))
         if self._config.get("ENABLE_IFTT"):
             self._notifiers.append(NetconMonIfttAlarmNotifier(self._config))
-        self._pending_alarms = []
+        self._dispatcher = NetconMonAlarmDispatcher(self._config, self._notifiers)
+        self._pending_alarms: List[NetconMonDbItem] = []
+        self._expiry: List[Tuple[float, MacAddress]] = []
+        self._deadlines: Dict[MacAddress, float] = {}
+
+    def _schedule(self, mac: MacAddress, deadline: float) -> None:
+        self._deadlines[mac] = deadline
+        heapq.heappush(self._expiry, (deadline, mac))
+
+    def seed(self, db: NetconMonDb) -> None:
+        """Schedule the expiry of the alarms already raised."""
+        ttl = self._alarm_ttl.total_seconds()
+        for device in db.alarm_devices():
+            self._schedule(device.mac, device.last_seen_ts + ttl)
+
+    def next_expiry(self) -> Optional[float]:
+        """Get the time in seconds until the next alarm deadline, or None if no alarm is raised."""
+        return max(self._expiry[0][0] - time.time(), 0) if self._expiry else None
+
+    def expire_alarms(self, db: NetconMonDb) -> List[NetconMonDbItem]:
+        """Clear the alarms of the devices offline for longer than the alarm ttl, returning their devices."""
+        ttl = self._alarm_ttl.total_seconds()
+        now = time.time()
+        cleared = []
+        with db.transaction():
+            while self._expiry and self._expiry[0][0] <= now:
+                deadline, mac = heapq.heappop(self._expiry)
+                if self._deadlines.get(mac) != deadline:
+                    # Superseded by a later deadline
+                    continue
+                device = db.get(mac)
+                if not device or not device.in_alarm():
+                    del self._deadlines[mac]
+                elif device.last_seen_ts + ttl > now:
+                    # Seen since the alarm was scheduled
+                    self._schedule(mac, device.last_seen_ts + ttl)
+                else:
+                    del self._deadlines[mac]
+                    self._clear(device)
+                    db.add_item(device)
+                    cleared.append(device)
+        return cleared
+
+    def _clear(self, device: NetconMonDbItem) -> None:
+        self.logger.info(f"Clearing alarm for device {device.mac}")
+        device.set_alarm(in_alarm=False)
+        self.bus.publish(EVENT_ALARM_CLEARED, device)
+
+    def start(self):
+        """Start sending the alarms in background."""
+        self._dispatcher.start()
 
     def process_device(self, device: NetconMonDbItem):
         # If the device is in alarm but was not online for longer than the alarm ttl, clear it
         # print(f"{device.mac}: {datetime.now()}, {device.last_seen}, {datetime.now() - device.last_seen} > {self._alarm_ttl}")
         if device.in_alarm() and datetime.now() - device.last_seen > self._alarm_ttl:
-            self.logger.info(f"Clearing alarm for device {device.mac}")
-            device.set_alarm(in_alarm=False)
+            self._clear(device)
 
         # If the device is not allowed and not in alarm, raise alarm
         if not device.in_alarm() and not device.allowed:
             self._pending_alarms.append(device)
             device.set_alarm()
+            self._schedule(device.mac, time.time() + self._alarm_ttl.total_seconds())
+            self.bus.publish(EVENT_ALARM_RAISED, device)
+
+    def needs_processing(self, device: NetconMonDbItem) -> bool:
+        """Whether processing the device would raise or clear its alarm."""
+        if device.in_alarm():
+            return datetime.now() - device.last_seen > self._alarm_ttl
+        return not device.allowed
 
     def send_pending_alarms(self):
-        for notifier in self._notifiers:
-            notifier.raise_alarm(self._pending_alarms)
-        self._pending_alarms = []
+        """Queue the pending alarms to the notifiers, without waiting for them to be sent."""
+        self._dispatcher.submit(self._pending_alarms)
+        self._pending_alarms: List[NetconMonDbItem] = []
+
+    def stop(self):
+        self._dispatcher.stop()
@@ -1,12 +1,23 @@
+import copy
 import shelve
 import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from ipaddress import IPv4Address
+from ipaddress import IPv4Address, IPv4Network, IPv6Address, ip_address, ip_network
+from types import MappingProxyType
+from typing import AbstractSet, Any, Callable, Dict, Iterable, List, Mapping, Optional, Set, Tuple, Union
 import logging
 
 import attr
 
 from netcon_monitor.monitor.input import MacAddress
+from netcon_monitor.monitor.metrics import DB_SAVE_SECONDS, DB_SAVED_ITEMS
 
 DEFAULT_TIME = datetime(2000, 1, 1, 0, 0)
 DEFAULT_TIME_STR = DEFAULT_TIME.isoformat()
@@ -18,20 +29,43 @@ def ts_from_str(ts):
     return None
 
 
-@attr.s
+def to_epoch(ts: Union[datetime, float, None]) -> Optional[float]:
+    "Convert a datetime to an epoch timestamp, unless it's already one or none"
+    if ts is None:
+        return None
+    return ts.timestamp() if isinstance(ts, datetime) else float(ts)
+
+
+def to_packed_ip(ip: Union[IPv4Address, IPv6Address, str, bytes]) -> bytes:
+    "Convert an ip address or string to its packed representation, unless it's already packed"
+    return ip if isinstance(ip, bytes) else ip_address(ip).packed
+
+
+def intern_str(value: Optional[str]) -> Optional[str]:
+    "Intern strings shared by many items, e.g. manufacturers"
+    return sys.intern(value) if value else value
+
+
+@attr.s(slots=True)
 class NetconMonDbItem():
+    """A device, stored with epoch timestamps and packed ip to keep large stores small.
+
+    The ip and timestamps are exposed as ip address and datetime objects by properties, hot paths use the raw values.
+    """
+
     # Default values
     DEFAULT_MAC="0:0:0:0:0:0"
     DEFAULT_IP="127.0.0.1"
 
     # Properties
     mac = attr.ib(default=MacAddress(DEFAULT_MAC), type=MacAddress)
-    ip = attr.ib(default=DEFAULT_IP, type=IPv4Address)
-    hostname = attr.ib(default=None, type=str)
-    manufacturer = attr.ib(default=None, type=str)
-    last_seen = attr.ib(default=datetime.now(), type=datetime)
-    alarm_timestamp = attr.ib(default=None, type=datetime)
+    _ip = attr.ib(default=to_packed_ip(DEFAULT_IP), converter=to_packed_ip, type=bytes)
+    hostname = attr.ib(default=None, type=Optional[str])
+    manufacturer = attr.ib(default=None, converter=intern_str, type=Optional[str])
+    _last_seen = attr.ib(factory=time.time, converter=to_epoch, type=float)
+    _alarm_timestamp = attr.ib(default=None, converter=to_epoch, type=Optional[float])
     allowed = attr.ib(default=False, type=bool)
+    source = attr.ib(default=None, converter=intern_str, type=Optional[str])
 
     # Dict representation keys
     DICT_KEY_MAC = "mac"
@@ -41,6 +75,7 @@ class NetconMonDbItem():
     DICT_KEY_LASTSEEN = "last_seen"
     DICT_KEY_ALARMTS = "alarm_timestamp"
     DICT_KEY_ALLOWED = "allowed"
+    DICT_KEY_SOURCE = "source"
 
     @classmethod
     def from_dict(cls, raw_dict):
@@ -52,9 +87,10 @@ class NetconMonDbItem():
             last_seen=datetime.fromisoformat(raw_dict.get(cls.DICT_KEY_LASTSEEN) or DEFAULT_TIME_STR),
             alarm_timestamp=ts_from_str(raw_dict.get(cls.DICT_KEY_ALARMTS)),
             allowed=raw_dict.get(cls.DICT_KEY_ALLOWED, False),
+            source=raw_dict.get(cls.DICT_KEY_SOURCE),
         )
 
-    def to_dict(self) -> str:
+    def to_dict(self) -> Dict[str, Any]:
         return {
             self.DICT_KEY_MAC: str(self.mac),
             self.DICT_KEY_IP: str(self.ip),
@@ -63,32 +99,76 @@ class NetconMonDbItem():
             self.DICT_KEY_LASTSEEN: str(self.last_seen),
             self.DICT_KEY_ALARMTS: str(self.alarm_timestamp),
             self.DICT_KEY_ALLOWED: self.allowed,
+            self.DICT_KEY_SOURCE: self.source,
         }
 
     def __attrs_post_init__(self):
         if not self.manufacturer:
-            self.manufacturer = self.mac.get_manufacturer()
+            self.manufacturer = intern_str(self.mac.get_manufacturer())
+
+    def copy(self) -> "NetconMonDbItem":
+        return copy.copy(self)
+
+    @property
+    def ip(self) -> Union[IPv4Address, IPv6Address]:
+        return ip_address(self._ip)
+
+    @ip.setter
+    def ip(self, value: Union[IPv4Address, IPv6Address, str, bytes]) -> None:
+        self._ip = to_packed_ip(value)
+
+    @property
+    def packed_ip(self) -> bytes:
+        return self._ip
+
+    @property
+    def last_seen(self) -> datetime:
+        return datetime.fromtimestamp(self._last_seen)
+
+    @last_seen.setter
+    def last_seen(self, value: Union[datetime, float]) -> None:
+        self._last_seen = value.timestamp() if isinstance(value, datetime) else float(value)
+
+    @property
+    def last_seen_ts(self) -> float:
+        return self._last_seen
+
+    @property
+    def alarm_timestamp(self) -> Optional[datetime]:
+        return datetime.fromtimestamp(self._alarm_timestamp) if self._alarm_timestamp is not None else None
+
+    @alarm_timestamp.setter
+    def alarm_timestamp(self, value: Union[datetime, float, None]) -> None:
+        self._alarm_timestamp = to_epoch(value)
+
+    @property
+    def alarm_ts(self) -> Optional[float]:
+        return self._alarm_timestamp
 
     def refresh(self) -> None:
         """Refresh the last seen time, and the alarm if in alarm."""
-        self.last_seen = datetime.now()
+        self._last_seen = time.time()
         if not self.manufacturer:
             # To avoid throttling from the mac vendors api, check at refresh if we need to try to re update
-            self.manufacturer = self.mac.get_manufacturer()
+            self.manufacturer = intern_str(self.mac.get_manufacturer())
+
+    def touch(self, timestamp: float) -> None:
+        """Only refresh the last seen time."""
+        self._last_seen = timestamp
 
     def set_alarm(self, in_alarm: bool = True) -> None:
         """Set or clear the alarm."""
         if in_alarm:
-            if not self.alarm_timestamp:
-                self.alarm_timestamp = datetime.now()
+            if self._alarm_timestamp is None:
+                self._alarm_timestamp = time.time()
         else:
-            self.alarm_timestamp = None
+            self._alarm_timestamp = None
 
     def in_alarm(self) -> bool:
-        return True if self.alarm_timestamp else False
+        return self._alarm_timestamp is not None
 
     def is_online(self, ttl: timedelta) -> bool:
-        return (datetime.now() - self.last_seen) < ttl
+        return (time.time() - self._last_seen) < ttl.total_seconds()
 
 
 class NetconMonDbItemSerializer(json.JSONEncoder):
@@ -99,55 +179,410 @@ class NetconMonDbItemSerializer(json.JSONEncoder):
         return json.JSONEncoder.default(self, o)
 
 
-class NetconMonDb:
-    DATABASE_FILE = "connections.db"
-    ONLINE_JITTER_SECS = 60
+@attr.s(slots=True, frozen=True)
+class NetconMonDbSnapshot:
+    """Immutable read view of the database, as of a commit. Its items must not be modified."""
+
+    epoch = attr.ib(type=str)
+    revision = attr.ib(type=int)
+    items = attr.ib(type=Mapping[MacAddress, NetconMonDbItem])
+    # Revision of the last change of each item, ordered by revision
+    _revisions = attr.ib(type=Dict[MacAddress, int])
+
+    def get(self, item_key: MacAddress) -> Optional[NetconMonDbItem]:
+        return self.items.get(item_key)
+
+    def changes_since(self, revision: int) -> Tuple[int, List[MacAddress]]:
+        """Get the snapshot revision, and the keys of the items changed after a revision, most recent first."""
+        keys = []
+        for key, key_revision in reversed(self._revisions.items()):
+            if key_revision <= revision:
+                break
+            keys.append(key)
+        return self.revision, keys
+
+
+class NetconMonDbBackend:
+    """Base storage backend. Queries are full scans of the store, backends with indexes override them."""
+
+    DATABASE_FILE = ""
 
     def __init__(self, config) -> None:
-        self.store = None
         self._config = config
-        self._db_path=self._config["DATABASE_PATH"] + "/" + self.DATABASE_FILE
-        self.online_ttl = timedelta(seconds=self._config["MONITOR_DELAY_SECS"] + self.ONLINE_JITTER_SECS)
+        self.path = self._config["DATABASE_PATH"] + "/" + self.DATABASE_FILE
         self.logger = logging.getLogger(__name__)
-        self.load()
-        self.logger.info(f"Loaded datastore {self._db_path}, {len(self.store)} elements")
 
-    def load(self):
-        self.store = {}
+    def load(self) -> Dict[MacAddress, NetconMonDbItem]:
+        raise NotImplementedError
+
+    def save(
+        self, store: Dict[MacAddress, NetconMonDbItem], dirty: Set[MacAddress], touched: AbstractSet[MacAddress] = frozenset()
+    ) -> None:
+        """Save the dirty items, and the last seen time of the touched items."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def online_keys(self, store: Dict[MacAddress, NetconMonDbItem], since: datetime) -> Iterable[MacAddress]:
+        since_ts = since.timestamp()
+        return [key for key, item in store.items() if item.last_seen_ts > since_ts]
+
+    def alarm_keys(self, store: Dict[MacAddress, NetconMonDbItem]) -> Iterable[MacAddress]:
+        return [key for key, item in store.items() if item.in_alarm()]
+
+    def subnet_keys(self, store: Dict[MacAddress, NetconMonDbItem], network: IPv4Network) -> Iterable[MacAddress]:
+        return [key for key, item in store.items() if item.ip in network]
+
+
+class NetconMonJsonDbBackend(NetconMonDbBackend):
+    """Store the devices in a single json file."""
+
+    DATABASE_FILE = "connections.db"
+
+    def __init__(self, config) -> None:
+        super().__init__(config)
+        self._encoded: Dict[MacAddress, str] = {}
+
+    def load(self) -> Dict[MacAddress, NetconMonDbItem]:
+        self._encoded = {}
         # self.store = shelve.open(self._db_path, writeback=True)
         try:
-            with open(self._db_path, "r") as f:
+            with open(self.path, "r") as f:
                 raw_store = json.load(f)
-                self.store = { key: NetconMonDbItem.from_dict(raw_store[key]) for key in raw_store }
+                return { MacAddress(key): NetconMonDbItem.from_dict(raw_store[key]) for key in raw_store }
         except (FileNotFoundError, json.decoder.JSONDecodeError):
             self.logger.info("Creating a new database file")
+        return {}
 
-    def save(self):
+    def save(
+        self, store: Dict[MacAddress, NetconMonDbItem], dirty: Set[MacAddress], touched: AbstractSet[MacAddress] = frozenset()
+    ) -> None:
+        """Atomically write the store, only re-encoding the items modified since the last save."""
         # self.store.sync()
-        with open(self._db_path, "w") as f:
-            json.dump(self.store, f, cls=NetconMonDbItemSerializer)
+        for key in dirty | touched:
+            if key in store:
+                self._encoded[key] = json.dumps(store[key], cls=NetconMonDbItemSerializer)
+            else:
+                self._encoded.pop(key, None)
+        for key in store.keys() - self._encoded.keys():
+            self._encoded[key] = json.dumps(store[key], cls=NetconMonDbItemSerializer)
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write("{")
+            f.write(", ".join(f'"{key}": {self._encoded[key]}' for key in store))
+            f.write("}")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+class NetconMonSqliteDbBackend(NetconMonDbBackend):
+    """Store the devices in a sqlite database in WAL mode, with indexed online, alarm and subnet queries."""
+
+    DATABASE_FILE = "connections.sqlite"
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS devices (
+            mac TEXT PRIMARY KEY,
+            ip TEXT,
+            ip_key BLOB,
+            hostname TEXT,
+            manufacturer TEXT,
+            last_seen REAL,
+            alarm_timestamp REAL,
+            allowed INTEGER,
+            source TEXT
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_devices_ip ON devices (ip_key)",
+        "CREATE INDEX IF NOT EXISTS idx_devices_last_seen ON devices (last_seen)",
+        "CREATE INDEX IF NOT EXISTS idx_devices_alarm ON devices (alarm_timestamp)",
+    ]
+    COLUMNS = "mac, ip, ip_key, hostname, manufacturer, last_seen, alarm_timestamp, allowed, source"
+    # Columns added after the initial schema, with their type
+    ADDED_COLUMNS = {"source": "TEXT"}
+
+    def __init__(self, config) -> None:
+        super().__init__(config)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            for statement in self.SCHEMA:
+                self._conn.execute(statement)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(devices)")}
+            for column, column_type in self.ADDED_COLUMNS.items():
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE devices ADD COLUMN {column} {column_type}")
+
+    @staticmethod
+    def _to_row(item: NetconMonDbItem) -> Tuple:
+        return (
+            str(item.mac),
+            str(item.ip),
+            item.packed_ip,
+            item.hostname,
+            item.manufacturer,
+            item.last_seen_ts,
+            item.alarm_ts,
+            int(item.allowed),
+            item.source,
+        )
+
+    @staticmethod
+    def _from_row(row: Tuple) -> NetconMonDbItem:
+        mac, ip, _, hostname, manufacturer, last_seen, alarm_timestamp, allowed, source = row
+        return NetconMonDbItem(
+            mac=MacAddress(mac),
+            ip=ip,
+            hostname=hostname,
+            manufacturer=manufacturer,
+            last_seen=last_seen or DEFAULT_TIME,
+            alarm_timestamp=alarm_timestamp,
+            allowed=bool(allowed),
+            source=source,
+        )
+
+    def _import_json(self) -> None:
+        """Import the devices of a json database, if any, when starting on an empty database."""
+        json_backend = NetconMonJsonDbBackend(self._config)
+        store = json_backend.load()
+        if store:
+            self.logger.info(f"Importing {len(store)} elements from {json_backend.path}")
+            self.save(store, set(store.keys()))
+
+    def load(self) -> Dict[MacAddress, NetconMonDbItem]:
+        with self._lock:
+            empty = self._conn.execute("SELECT COUNT(*) FROM devices").fetchone()[0] == 0
+        if empty:
+            self._import_json()
+        with self._lock:
+            cursor = self._conn.execute(f"SELECT {self.COLUMNS} FROM devices")
+            return {MacAddress(row[0]): self._from_row(row) for row in cursor}
+
+    def save(
+        self, store: Dict[MacAddress, NetconMonDbItem], dirty: Set[MacAddress], touched: AbstractSet[MacAddress] = frozenset()
+    ) -> None:
+        updated = [self._to_row(store[key]) for key in dirty if key in store]
+        deleted = [(str(key),) for key in dirty if key not in store]
+        seen = [(store[key].last_seen_ts, str(key)) for key in touched - dirty if key in store]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO devices ({self.COLUMNS}) VALUES ({', '.join('?' * 9)})", updated
+            )
+            self._conn.executemany("DELETE FROM devices WHERE mac = ?", deleted)
+            self._conn.executemany("UPDATE devices SET last_seen = ? WHERE mac = ?", seen)
 
     def close(self) -> None:
-        self.save()
+        with self._lock:
+            self._conn.close()
+
+    def _query_keys(self, query: str, params: Tuple) -> List[MacAddress]:
+        with self._lock:
+            return [MacAddress(row[0]) for row in self._conn.execute(query, params)]
+
+    def online_keys(self, store: Dict[MacAddress, NetconMonDbItem], since: datetime) -> Iterable[MacAddress]:
+        return self._query_keys("SELECT mac FROM devices WHERE last_seen > ?", (since.timestamp(),))
+
+    def alarm_keys(self, store: Dict[MacAddress, NetconMonDbItem]) -> Iterable[MacAddress]:
+        return self._query_keys("SELECT mac FROM devices WHERE alarm_timestamp IS NOT NULL", ())
+
+    def subnet_keys(self, store: Dict[MacAddress, NetconMonDbItem], network: IPv4Network) -> Iterable[MacAddress]:
+        return self._query_keys(
+            "SELECT mac FROM devices WHERE ip_key BETWEEN ? AND ? AND length(ip_key) = ?",
+            (network.network_address.packed, network.broadcast_address.packed, len(network.network_address.packed)),
+        )
+
+
+class NetconMonDb:
+    """Devices database, with a single writer at a time and lock free readers.
+
+    Writers change the items of the store within transactions, serialized by the database lock. When the outermost
+    transaction ends, the changed items are copied into a new immutable snapshot, published for the readers (e.g. the
+    dashboard), which thus never see half applied changes.
+    """
+
+    ONLINE_JITTER_SECS = 60
+
+    def __init__(self, config) -> None:
+        self.store: Dict[MacAddress, NetconMonDbItem] = {}
+        self._config = config
+        self.online_ttl = timedelta(seconds=self._config["MONITOR_DELAY_SECS"] + self.ONLINE_JITTER_SECS)
+        self.logger = logging.getLogger(__name__)
+        self._backend = self._config.get("DATABASE_BACKEND_CLASS", NetconMonJsonDbBackend)(self._config)
+        self._flush_interval = self._config.get("DATABASE_FLUSH_INTERVAL_SECS", 0)
+        self._touch_flush_interval = self._config.get("DATABASE_TOUCH_FLUSH_SECS", 30)
+        self._last_flush: Optional[float] = None
+        self._lock = threading.RLock()
+        self._transaction_depth = 0
+        self._dirty: Set[MacAddress] = set()
+        self._touched: Set[MacAddress] = set()
+        # Revision of the last change of each item, ordered by revision. The epoch tells revisions of different runs
+        # apart
+        self.epoch = f"{int(time.time() * 1000):x}"
+        self.revision = 0
+        self._revisions: "OrderedDict[MacAddress, int]" = OrderedDict()
+        self._unpublished: Set[MacAddress] = set()
+        self._snapshot_items: Dict[MacAddress, NetconMonDbItem] = {}
+        self.snapshot = NetconMonDbSnapshot(self.epoch, self.revision, MappingProxyType({}), {})
+        self.load()
+        self.logger.info(f"Loaded datastore {self._backend.path}, {len(self.store)} elements")
+
+    def load(self):
+        with self._lock:
+            self._dirty = set()
+            self._touched = set()
+            self.store = self._backend.load()
+            self._snapshot_items = {}
+            self._unpublished = set(self.store)
+            self._publish()
+
+    def save(self):
+        with self._lock:
+            backend = type(self._backend).__name__
+            with DB_SAVE_SECONDS.time(backend=backend):
+                self._backend.save(self.store, self._dirty, self._touched)
+            DB_SAVED_ITEMS.inc(len(self._dirty | self._touched), backend=backend)
+            # The last seen times of the touched items are published with the saves only
+            self._unpublished.update(self._touched)
+            self._dirty = set()
+            self._touched = set()
+            self._last_flush = time.monotonic()
+
+    def commit(self, force: bool = False) -> None:
+        """Save pending changes, unless the flush interval since the last save is not elapsed.
+
+        Changes of the last seen times only are saved every DATABASE_TOUCH_FLUSH_SECS at most.
+        """
+        if not self._dirty and not self._touched:
+            return
+        interval = self._flush_interval if self._dirty else max(self._flush_interval, self._touch_flush_interval)
+        if force or self._last_flush is None or time.monotonic() - self._last_flush >= interval:
+            self.save()
+
+    def _publish(self) -> None:
+        """Publish a new snapshot with copies of the items changed since the previous one."""
+        if not self._unpublished and self.snapshot is not None:
+            return
+        items = self._snapshot_items.copy()
+        for key in self._unpublished:
+            item = self.store.get(key)
+            if item is None:
+                items.pop(key, None)
+            else:
+                items[key] = item.copy()
+        self._snapshot_items = items
+        self._unpublished = set()
+        self.snapshot = NetconMonDbSnapshot(self.epoch, self.revision, MappingProxyType(items), dict(self._revisions))
+
+    def _end_change(self) -> None:
+        if not self._transaction_depth:
+            self.commit()
+            self._publish()
+
+    @contextmanager
+    def transaction(self):
+        """Group changes so that they are committed in a single write, and published in a single snapshot, when
+        the outermost transaction ends. Transactions of different threads are serialized."""
+        with self._lock:
+            self._transaction_depth += 1
+            try:
+                yield self
+            finally:
+                self._transaction_depth -= 1
+                self._end_change()
+
+    def close(self) -> None:
+        with self._lock:
+            self.commit(force=True)
+            self._backend.close()
 
     def add(self, **kwargs) -> NetconMonDbItem:
         return self.add_item(NetconMonDbItem(**kwargs))
 
     def add_item(self, item: NetconMonDbItem) -> NetconMonDbItem:
-        self.store[str(item.mac)] = item
-        self.save()
+        with self._lock:
+            self.store[item.mac] = item
+            self._dirty.add(item.mac)
+            self.mark_changed([item.mac])
         return item
 
-    def has(self, item_key: str) -> bool:
-        return item_key in self.store
+    @staticmethod
+    def _key(item_key: Union[MacAddress, str]) -> Optional[MacAddress]:
+        if isinstance(item_key, MacAddress):
+            return item_key
+        try:
+            return MacAddress(item_key)
+        except ValueError:
+            return None
+
+    def has(self, item_key: Union[MacAddress, str]) -> bool:
+        return self._key(item_key) in self.store
 
-    def get(self, item_key: str) -> NetconMonDbItem:
-        return self.store[item_key] if item_key in self.store else None
+    def get(self, item_key: Union[MacAddress, str]) -> Optional[NetconMonDbItem]:
+        """Get an item to change, readers of other threads must use the snapshot instead."""
+        key = self._key(item_key)
+        return self.store.get(key) if key else None
 
     def update(self, item: NetconMonDbItem) -> None:
         item.refresh()
         self.add_item(item)
 
+    def touch(self, item_keys: Iterable[MacAddress]) -> None:
+        """Refresh the last seen time of unchanged items, saving only this time when the backend supports it.
+
+        The touched items are not recorded as changed, their last seen time is published with the next save.
+        """
+        now = time.time()
+        with self._lock:
+            for key in item_keys:
+                item = self.store.get(key)
+                if item:
+                    item.touch(now)
+                    self._touched.add(key)
+            self._end_change()
+
+    def mark_changed(self, item_keys: Iterable[MacAddress]) -> None:
+        """Record a change of the items in a new revision, e.g. for the items which went offline."""
+        with self._lock:
+            item_keys = list(item_keys)
+            if item_keys:
+                self.revision += 1
+                for key in item_keys:
+                    self._revisions[key] = self.revision
+                    self._revisions.move_to_end(key)
+                self._unpublished.update(item_keys)
+            self._end_change()
+
+    def changes_since(self, revision: int) -> Tuple[int, List[MacAddress]]:
+        """Get the published revision, and the keys of the items changed after a revision, most recent first."""
+        return self.snapshot.changes_since(revision)
+
+    def _query(self, keys: Iterable[MacAddress], predicate: Callable[[NetconMonDbItem], bool]) -> List[NetconMonDbItem]:
+        """Get the items for keys returned by the backend, updated with the changes not saved yet."""
+        keys = set(keys)
+        for key in self._dirty | self._touched:
+            if key in self.store and predicate(self.store[key]):
+                keys.add(key)
+            else:
+                keys.discard(key)
+        return [self.store[key] for key in keys if key in self.store]
+
+    def online_devices(self) -> List[NetconMonDbItem]:
+        since = datetime.now() - self.online_ttl
+        since_ts = since.timestamp()
+        return self._query(self._backend.online_keys(self.store, since), lambda item: item.last_seen_ts > since_ts)
+
+    def alarm_devices(self) -> List[NetconMonDbItem]:
+        return self._query(self._backend.alarm_keys(self.store), lambda item: item.in_alarm())
+
+    def subnet_devices(self, subnet: str) -> List[NetconMonDbItem]:
+        network = ip_network(subnet)
+        return self._query(
+            self._backend.subnet_keys(self.store, network), lambda item: item.ip in network
+        )
+
     def dump(self):
         date_format = "%d/%m/%Y %H:%M:%S"
         print(f"{len(self.store)} elements in datastore")
@@ -0,0 +1,283 @@
+import json
+import logging
+import os
+import time
+from collections import deque
+from functools import partial
+from threading import Condition, Lock, Thread
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+import attr
+
+from netcon_monitor.monitor.metrics import ALARMS_SENT, NOTIFIER_ERRORS, NOTIFIER_SECONDS
+
+
+@attr.s(slots=True, frozen=True)
+class NetconMonAlarmRecord:
+    """Snapshot of an alarmed device, safe to send from another thread and to persist."""
+
+    mac = attr.ib(type=str)
+    manufacturer = attr.ib(default=None, type=Optional[str])
+    ip = attr.ib(default=None, type=Optional[str])
+    hostname = attr.ib(default=None, type=Optional[str])
+    timestamp = attr.ib(factory=time.time, type=float)
+
+    @classmethod
+    def from_item(cls, item) -> "NetconMonAlarmRecord":
+        return cls(
+            mac=str(item.mac),
+            manufacturer=item.manufacturer,
+            ip=str(item.ip) if item.ip else None,
+            hostname=item.hostname,
+            timestamp=item.alarm_ts or time.time(),
+        )
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Whether sending again may succeed: network errors, throttling and server errors, but not client errors."""
+    if getattr(error, "retry_after", None):
+        return True
+    # discord errors have a status, requests ones a response
+    status = getattr(error, "status", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status >= 500 or status == 429
+    return isinstance(error, OSError)
+
+
+class NetconMonNotifierWorker(Thread):
+    """Send the alarm batches of one notifier in order, retrying with exponential backoff and at its rate limit.
+
+    Only the transient errors are retried, as told by the notifier is_transient method if any. Batches failing
+    otherwise, e.g. rejected by the provider or badly formatted, are dropped.
+    """
+
+    def __init__(self, notifier, config: Dict[str, Any], on_change=None) -> None:
+        super().__init__(name=f"{__name__}.{type(notifier).__name__}", daemon=True)
+        self.notifier = notifier
+        self.logger = logging.getLogger(__name__)
+        self._retry_secs = config.get("ALARM_RETRY_SECS", 5)
+        self._max_retry_secs = config.get("ALARM_MAX_RETRY_SECS", 600)
+        self._coalesce_secs = config.get("ALARM_COALESCE_SECS", 0)
+        self._on_change = on_change
+        self._is_transient = getattr(notifier, "is_transient", is_transient_error)
+        self._batches: Deque[List[NetconMonAlarmRecord]] = deque()
+        # Number of messages of the first batch already sent or dropped, they are skipped when it is sent again
+        self._sent = 0
+        self._condition = Condition()
+        self._last_send = 0.0
+        self._first_queued = 0.0
+        self._running = False
+
+    @property
+    def progress(self) -> Tuple[int, List[List[NetconMonAlarmRecord]]]:
+        """Get the number of messages of the first batch already sent, and the pending batches."""
+        with self._condition:
+            return self._sent, list(self._batches)
+
+    def submit(self, batch: List[NetconMonAlarmRecord]) -> None:
+        with self._condition:
+            if not self._batches:
+                self._first_queued = time.monotonic()
+            self._batches.append(batch)
+            self._condition.notify()
+
+    def resume(self, batches: List[List[NetconMonAlarmRecord]], sent: int) -> None:
+        """Queue the batches undelivered by a previous run, skipping the messages of the first one already sent."""
+        with self._condition:
+            if not self._batches:
+                self._sent = sent
+            for batch in batches:
+                self.submit(batch)
+
+    def _coalesce(self) -> None:
+        """Wait for the coalescing window since the first queued batch, then merge all the queued batches."""
+        while self._running:
+            wait_secs = self._first_queued + self._coalesce_secs - time.monotonic()
+            if wait_secs <= 0:
+                break
+            self._condition.wait(wait_secs)
+        # A partly sent batch is sent on as it is, merging it would change its messages
+        partial_batch = self._batches.popleft() if self._sent and self._batches else None
+        if len(self._batches) > 1:
+            merged: Dict[str, NetconMonAlarmRecord] = {}
+            for batch in self._batches:
+                for record in batch:
+                    merged.setdefault(record.mac, record)
+            self._batches.clear()
+            self._batches.append(list(merged.values()))
+        if partial_batch is not None:
+            self._batches.appendleft(partial_batch)
+
+    def _wait(self, delay: Optional[float] = None) -> None:
+        with self._condition:
+            if self._running:
+                self._condition.wait(delay)
+
+    def _sends(self, batch: List[NetconMonAlarmRecord]) -> List[Callable[[], None]]:
+        """Split the sending of a batch in the messages of the notifier, if it has send_message, else a single send."""
+        send_message = getattr(self.notifier, "send_message", None)
+        if send_message is None:
+            return [partial(self.notifier.raise_alarm, batch)]
+        return [partial(send_message, content) for content in self.notifier.messages(batch)]
+
+    def _send(self, batch: List[NetconMonAlarmRecord]) -> bool:
+        """Send a batch, blocking until it is delivered or dropped, or the worker is stopped.
+
+        Each message is retried on its own, so that a failure doesn't deliver the messages already sent again. The
+        messages sent are counted in the worker, so that neither does a batch saved when stopping and sent at the
+        next start.
+        """
+        name = type(self.notifier).__name__
+        try:
+            sends = self._sends(batch)
+        except Exception as e:
+            self.logger.exception(f"Dropping {len(batch)} alarms which {self.name} failed to format: {e}")
+            return True
+        with self._condition:
+            sent = self._sent
+        dropped = 0
+        backoff = self._retry_secs
+        while sent < len(sends) and self._running:
+            wait_secs = self._last_send + getattr(self.notifier, "rate_limit_secs", 0) - time.monotonic()
+            if wait_secs > 0:
+                self._wait(wait_secs)
+                continue
+            self._last_send = time.monotonic()
+            try:
+                with NOTIFIER_SECONDS.time(notifier=name):
+                    sends[sent]()
+                sent += 1
+                self._advance(sent)
+                backoff = self._retry_secs
+            except Exception as e:
+                NOTIFIER_ERRORS.inc(notifier=name)
+                if not self._is_transient(e):
+                    self.logger.exception(
+                        f"Dropping message {sent + 1}/{len(sends)} of {len(batch)} alarms which {self.name} failed "
+                        f"to send: {e}"
+                    )
+                    sent += 1
+                    self._advance(sent)
+                    dropped += 1
+                    continue
+                # Telegram and discord both tell how long to wait when throttled
+                delay = getattr(e, "retry_after", None) or backoff
+                self.logger.error(
+                    f"Unable to send message {sent + 1}/{len(sends)} of {len(batch)} alarms with {self.name}, "
+                    f"retrying in {delay}s: {e}"
+                )
+                self._wait(float(delay))
+                backoff = min(backoff * 2, self._max_retry_secs)
+        if sent < len(sends):
+            return False
+        if not dropped:
+            ALARMS_SENT.inc(len(batch), notifier=name)
+        return True
+
+    def _advance(self, sent: int) -> None:
+        with self._condition:
+            self._sent = sent
+
+    def run(self) -> None:
+        self._running = True
+        while self._running:
+            with self._condition:
+                while self._running and not self._batches:
+                    self._condition.wait()
+                if self._coalesce_secs:
+                    self._coalesce()
+                if not self._running:
+                    break
+                batch = self._batches[0]
+            if self._send(batch):
+                with self._condition:
+                    self._batches.popleft()
+                    self._sent = 0
+                    self._first_queued = time.monotonic()
+                if self._on_change:
+                    self._on_change()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+
+
+class NetconMonAlarmDispatcher:
+    """Dispatch the alarm batches to all the notifiers in parallel, off the monitor thread.
+
+    Undelivered batches are saved in DATABASE_PATH, and sent again at the next start. The messages of the first
+    batch of each notifier already sent are saved too, and skipped.
+    """
+
+    PENDING_FILE = "alarms_pending.json"
+    STOP_TIMEOUT_SECS = 5
+
+    def __init__(self, config: Dict[str, Any], notifiers: Iterable) -> None:
+        self.logger = logging.getLogger(__name__)
+        self._path = config["DATABASE_PATH"] + "/" + self.PENDING_FILE
+        self._save_lock = Lock()
+        self._workers = {
+            type(notifier).__name__: NetconMonNotifierWorker(notifier, config, on_change=self.save)
+            for notifier in notifiers
+        }
+        self.load()
+
+    def load(self) -> None:
+        try:
+            with open(self._path, "r") as f:
+                pending = json.load(f)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            return
+        for name, progress in pending.items():
+            batches = progress["batches"]
+            worker = self._workers.get(name)
+            if not worker:
+                self.logger.warning(f"Dropping {len(batches)} undelivered alarm batches of disabled {name}")
+                continue
+            self.logger.info(f"Resending {len(batches)} undelivered alarm batches with {name}")
+            worker.resume(
+                [[NetconMonAlarmRecord(**record) for record in batch] for batch in batches], progress.get("sent", 0)
+            )
+
+    def save(self) -> None:
+        with self._save_lock:
+            pending: Dict[str, Dict[str, Any]] = {}
+            for name, worker in self._workers.items():
+                sent, batches = worker.progress
+                if batches:
+                    pending[name] = {
+                        "sent": sent,
+                        "batches": [[attr.asdict(record) for record in batch] for batch in batches],
+                    }
+            if not pending:
+                if os.path.exists(self._path):
+                    os.remove(self._path)
+                return
+            tmp_path = self._path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(pending, f)
+            os.replace(tmp_path, self._path)
+
+    def submit(self, devices: Iterable) -> None:
+        """Queue an alarm batch for all the notifiers, from the devices as they are now."""
+        batch = [NetconMonAlarmRecord.from_item(device) for device in devices]
+        if not batch or not self._workers:
+            return
+        for worker in self._workers.values():
+            worker.submit(batch)
+        self.save()
+
+    def start(self) -> None:
+        for worker in self._workers.values():
+            worker.start()
+
+    def stop(self) -> None:
+        for worker in self._workers.values():
+            worker.stop()
+        for worker in self._workers.values():
+            if worker.is_alive():
+                worker.join(self.STOP_TIMEOUT_SECS)
+        self.save()
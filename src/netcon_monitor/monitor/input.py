@@ -1,38 +1,109 @@
 import json
 import logging
+import re
 import subprocess
-from ipaddress import IPv4Address, ip_address, ip_network
-from typing import Any, Dict, List, Tuple
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import total_ordering
+from ipaddress import IPv4Address, ip_address
+from threading import BoundedSemaphore, Event, Lock, Thread
+from typing import IO, TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union, cast
 
-import requests
-from paramiko import AutoAddPolicy, SSHClient
+from paramiko import AutoAddPolicy, SSHClient, SSHException
 
+from netcon_monitor.monitor.metrics import COMMAND_ERRORS, COMMAND_SECONDS, SSH_CONNECT_ERRORS, SSH_CONNECT_SECONDS
+from netcon_monitor.monitor.netmatch import NetconMonNetworkMatcher
+
+if TYPE_CHECKING:
+    from netcon_monitor.monitor.replay import NetconMonCommandRecorder
 
 log = logging.getLogger(__name__)
 
+
+@total_ordering
 class MacAddress:
-    def __init__(self, mac_str: str) -> None:
-        self._bytes = mac_str.split(":")
-        self._bytes = [int(byte, 16) for byte in self._bytes]
-        if len(self._bytes) != 6:
-            raise ValueError(f"Invalid MAC address {mac_str}")
+    """Immutable MAC address, stored as a 48-bit integer."""
+
+    __slots__ = ("_value", "_str")
+    MAC_FORMATS = re.compile(
+        r"(?P<bytes>(?:[0-9A-Fa-f]{1,2}[:-]){5}[0-9A-Fa-f]{1,2})"
+        r"|(?P<words>[0-9A-Fa-f]{4}\.[0-9A-Fa-f]{4}\.[0-9A-Fa-f]{4})"
+        r"|(?P<hex>[0-9A-Fa-f]{12})"
+    )
+    BYTES_SEPARATORS = re.compile(r"[:-]")
+    MAC_BITS = 48
+    _value: int
+    _str: str
+
+    # Offline vendor registry and remote lookup cache, set with set_vendor_lookup
+    vendor_registry = None
+    vendor_cache = None
+
+    def __init__(self, mac: Union[str, int, bytes]) -> None:
+        """Create from an int, 6 bytes, or a string: aa:bb:cc:dd:ee:ff, a-b-c-d-e-f, aabb.ccdd.eeff or aabbccddeeff."""
+        if isinstance(mac, int):
+            value = mac
+        elif isinstance(mac, bytes) and len(mac) == 6:
+            value = int.from_bytes(mac, "big")
+        else:
+            text = mac.strip() if isinstance(mac, str) else ""
+            match = self.MAC_FORMATS.fullmatch(text)
+            if not match:
+                raise ValueError(f"Invalid MAC address {mac!r}")
+            if match.group("bytes"):
+                value = 0
+                for byte in self.BYTES_SEPARATORS.split(match.group("bytes")):
+                    value = (value << 8) | int(byte, 16)
+            else:
+                value = int(text.replace(".", ""), 16)
+        if not 0 <= value < 1 << self.MAC_BITS:
+            raise ValueError(f"Invalid MAC address {mac!r}")
+        object.__setattr__(self, "_value", value)
+        object.__setattr__(self, "_str", ":".join(f"{byte:0>2X}" for byte in value.to_bytes(6, "big")))
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+
+    def __reduce__(self):
+        return (self.__class__, (self._value,))
 
     def __str__(self) -> str:
-        return ":".join([f"{byte:0>2X}" for byte in self._bytes])
+        return self._str
 
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}({self})"
 
+    def __int__(self) -> int:
+        return self._value
+
+    def __hash__(self) -> int:
+        return hash(self._value)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, MacAddress):
+            return self._value == other._value
+        return NotImplemented
+
+    def __lt__(self, other: Any) -> bool:
+        if isinstance(other, MacAddress):
+            return self._value < other._value
+        return NotImplemented
+
+    @classmethod
+    def set_vendor_lookup(cls, registry=None, cache=None) -> None:
+        cls.vendor_registry = registry
+        cls.vendor_cache = cache
+
     def get_manufacturer(self):
-        url = "https://api.macvendors.com/"
-        try:
-            response = requests.get(url + self.__str__())
-        except Exception as e:
-            log.error(f"Unable to get mac info for {self.__str__()}from api.macvendors.com :{e}")
-            return None
-        if response.status_code != 200:
-            return None
-        return response.content.decode()
+        """Get the manufacturer from the local registry, or from the remote lookup cache without blocking."""
+        if self.vendor_registry:
+            manufacturer = self.vendor_registry.lookup(int(self))
+            if manufacturer:
+                return manufacturer
+        if self.vendor_cache:
+            return self.vendor_cache.lookup(int(self))
+        return None
 
 
 class NetconMonError(Exception):
@@ -41,30 +112,40 @@ class NetconMonError(Exception):
 
 class NetconMonInput:
     def __init__(self, config: Dict[str, Any]) -> None:
-        super(NetconMonInput, self).__init__(config)
         self._config = config
         self.logger = logging.getLogger(__name__)
-        self._monitored_networks = [ip_network(local_net) for local_net in self._config["MONITORED_NETWORKS"]]
+        self._monitored_networks = NetconMonNetworkMatcher(
+            self._config["MONITORED_NETWORKS"], self._config.get("EXCLUDED_NETWORKS", [])
+        )
 
-    def is_monitored(self, device: Tuple[IPv4Address, MacAddress]) -> bool:
+    def is_monitored(self, device: Tuple[IPv4Address, Optional[MacAddress]]) -> bool:
         dev_ip, _ = device
-        if not self._monitored_networks:
-            return True
-        for monitored_net in self._monitored_networks:
-            if dev_ip in monitored_net:
-                return True
-        return False
+        return dev_ip in self._monitored_networks
 
-    def get_monitored_devices(self) -> List[Tuple[IPv4Address, MacAddress]]:
-        return [device for device in self.get_connected_devices() if self.is_monitored(device)]
+    def get_monitored_devices(self) -> Iterator[Tuple[IPv4Address, MacAddress]]:
+        return (device for device in self.get_connected_devices() if self.is_monitored(device))
 
-    def get_connected_devices(self) -> List[Tuple[IPv4Address, MacAddress]]:
+    def get_connected_devices(self) -> Iterable[Tuple[IPv4Address, MacAddress]]:
         raise NotImplementedError
 
+    def watch(
+        self,
+        callback: Callable[[Tuple[IPv4Address, MacAddress]], None],
+        on_lost: Optional[Callable[[IPv4Address, Optional[MacAddress]], None]] = None,
+    ) -> bool:
+        """Start reporting monitored devices to the callback as soon as they are seen, between polls, and the ip and
+        mac if known of the devices no longer reachable to on_lost.
+
+        Returns False if the input doesn't support it, and devices are only reported when polled.
+        """
+        return False
+
+    def stop(self) -> None:
+        """Stop watching the devices."""
+
 
 class NetconMonResolver:
     def __init__(self, config: Dict[str, Any]) -> None:
-        super(NetconMonResolver, self).__init__(config)
         self._config = config
         self.logger = logging.getLogger(__name__)
 
@@ -72,106 +153,368 @@ class NetconMonResolver:
         raise NotImplementedError
 
 
-class NetconMonCommand:
+class NetconMonSshSession:
+    """SSH connection to a remote host, kept open and shared by all the commands sent to this host.
+
+    The connection is kept alive, and re-established when lost, with an exponential backoff between failed attempts.
+    The number of concurrent channels is limited by SSH_MAX_CHANNELS. The commands followed indefinitely, e.g. ip
+    monitor, never release their channel: they use one of their own, outside of the limit, not to starve the others.
+    """
+
+    _sessions: Dict[Tuple[str, int, str], "NetconMonSshSession"] = {}
+    _sessions_lock = Lock()
+
     def __init__(self, config: Dict[str, Any]) -> None:
         self._config = config
         self.logger = logging.getLogger(__name__)
-        self._ssh_client = self._init_remote_client()
+        self._hostname = self._config["REMOTE_HOSTNAME"]
+        self._timeout = self._config.get("SSH_TIMEOUT_SECS", 10)
+        self._keepalive = self._config.get("SSH_KEEPALIVE_SECS", 30)
+        self._max_backoff = self._config.get("SSH_RECONNECT_MAX_BACKOFF_SECS", 300)
+        self._channels = BoundedSemaphore(self._config.get("SSH_MAX_CHANNELS", 4))
+        self._lock = Lock()
+        self._client = None
+        self._backoff = 0
+        self._next_attempt = 0.0
+
+    @classmethod
+    def get(cls, config: Dict[str, Any]) -> "NetconMonSshSession":
+        """Get the session to the remote host of the config, creating it if needed."""
+        key = (config["REMOTE_HOSTNAME"], config["REMOTE_PORT"], config["REMOTE_USER"])
+        with cls._sessions_lock:
+            if key not in cls._sessions:
+                cls._sessions[key] = cls(config)
+            return cls._sessions[key]
+
+    @classmethod
+    def close_all(cls) -> None:
+        with cls._sessions_lock:
+            for session in cls._sessions.values():
+                session.close()
+
+    def is_active(self) -> bool:
+        transport = self._client.get_transport() if self._client else None
+        return bool(transport and transport.is_active())
+
+    def connect(self) -> SSHClient:
+        """Get the connected client, connecting if needed unless a previous attempt failed too recently."""
+        with self._lock:
+            if self.is_active():
+                return self._client
+
+            if time.monotonic() < self._next_attempt:
+                raise NetconMonError(f"Connection to {self._hostname} failed, retrying in {self._backoff}s")
+            if self._client:
+                self.logger.info(f"Connection to {self._hostname} lost, reconnecting")
+                self._client.close()
+                self._client = None
 
-    def _init_remote_client(self) -> SSHClient:
-        ssh_client = None
-        if self._config["REMOTE_HOSTNAME"]:
             ssh_client = SSHClient()
             ssh_client.set_missing_host_key_policy(AutoAddPolicy())
             ssh_client.load_system_host_keys()
-        return ssh_client
+            start = time.perf_counter()
+            try:
+                ssh_client.connect(
+                    hostname=self._hostname,
+                    port=self._config["REMOTE_PORT"],
+                    username=self._config["REMOTE_USER"],
+                    password=self._config["REMOTE_PASS"],
+                    pkey=self._config["REMOTE_PRIVATE_KEY"],
+                    key_filename=self._config["REMOTE_PRIVATE_KEY_FILE"],
+                    timeout=self._timeout,
+                )
+            except (SSHException, OSError) as e:
+                ssh_client.close()
+                SSH_CONNECT_ERRORS.inc(host=self._hostname)
+                self._backoff = min(max(self._backoff * 2, 1), self._max_backoff)
+                self._next_attempt = time.monotonic() + self._backoff
+                raise NetconMonError(f"Unable to connect to {self._hostname}: {e}") from e
+
+            SSH_CONNECT_SECONDS.observe(time.perf_counter() - start, host=self._hostname)
+            ssh_client.get_transport().set_keepalive(self._keepalive)
+            self._backoff = 0
+            self._client = ssh_client
+            return ssh_client
+
+    def exec_command(self, command: str) -> Tuple[str, str]:
+        with self._channels:
+            ssh_client = self.connect()
+            try:
+                _, stdout, stderr = ssh_client.exec_command(command, timeout=self._timeout)
+                return stdout.read().decode(), stderr.read().decode()
+            except (SSHException, OSError) as e:
+                raise NetconMonError(f"Error executing {command} on {self._hostname}: {e}") from e
+
+    def stream_command(
+        self, command: str, timeout: Optional[float] = -1, closers: Optional[Set[Callable[[], None]]] = None
+    ) -> Iterator[str]:
+        """Yield the command output lines as they are received. Use timeout=None to wait for lines indefinitely.
+
+        The function closing the channel is added to closers while the command runs, to interrupt it from another
+        thread.
+        """
+        with self._channels if timeout is not None else nullcontext():
+            ssh_client = self.connect()
+            stdout = None
+            try:
+                _, stdout, _ = ssh_client.exec_command(command, timeout=self._timeout if timeout == -1 else timeout)
+                if closers is not None:
+                    closers.add(stdout.channel.close)
+                for line in stdout:
+                    yield line.decode() if isinstance(line, bytes) else line
+            except (SSHException, OSError) as e:
+                raise NetconMonError(f"Error executing {command} on {self._hostname}: {e}") from e
+            finally:
+                if stdout:
+                    if closers is not None:
+                        closers.discard(stdout.channel.close)
+                    stdout.channel.close()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._client:
+                self._client.close()
+                self._client = None
 
-    def connect(self) -> None:
-        try:
-            self._ssh_client.connect(
-                hostname=self._config["REMOTE_HOSTNAME"],
-                port=self._config["REMOTE_PORT"],
-                username=self._config["REMOTE_USER"],
-                password=self._config["REMOTE_PASS"],
-                pkey=self._config["REMOTE_PRIVATE_KEY"],
-                key_filename=self._config["REMOTE_PRIVATE_KEY_FILE"],
-            )
-        except TimeoutError as e:
-            raise NetconMonError
 
+class NetconMonCommand:
+    # Recorder of the command outputs, set to capture them for replay
+    recorder: Optional["NetconMonCommandRecorder"] = None
+
+    def __init__(self, config: Dict[str, Any]) -> None:
+        self._config = config
+        self.logger = logging.getLogger(__name__)
+        self._session = NetconMonSshSession.get(self._config) if self._config["REMOTE_HOSTNAME"] else None
+        # Functions interrupting the commands streamed
+        self._stream_closers: Set[Callable[[], None]] = set()
+
+    @property
+    def host(self) -> str:
+        return self._config["REMOTE_HOSTNAME"] or "local"
+
+    def connect(self) -> None:
+        if self._session:
+            self._session.connect()
 
     def disconnect(self) -> None:
-        self._ssh_client.close()
-
-    def run_command(self, command: str, autconnect=True) -> Tuple[str, str]:
-        if self._ssh_client:
-            if autconnect:
-                self.connect()
-            _, stdout, stderr = self._ssh_client.exec_command(" ".join(command))
-            command_output_stdout = stdout.read().decode()
-            command_output_stderr = stderr.read().decode()
-            if autconnect:
-                self.disconnect()
-            return command_output_stdout, command_output_stderr
+        """Close the remote connection. It is shared by all commands on the host and normally left open."""
+        if self._session:
+            self._session.close()
+
+    def _exec_command(self, command: List[str]) -> Tuple[str, str]:
+        if self._session:
+            # The session connects or reconnects on demand
+            return self._session.exec_command(" ".join(command))
         else:
             command_output = subprocess.run(command, capture_output=True)
             return command_output.stdout.decode(), command_output.stderr.decode()
 
+    def _stream_command(self, command: List[str], timeout: Optional[float]) -> Iterator[str]:
+        if self._session:
+            yield from self._session.stream_command(" ".join(command), timeout, self._stream_closers)
+        else:
+            try:
+                process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+            except OSError as e:
+                raise NetconMonError(f"Error executing {command}: {e}") from e
+            # Always set with stdout=PIPE
+            stdout = cast(IO[str], process.stdout)
+            self._stream_closers.add(process.kill)
+            try:
+                yield from stdout
+            finally:
+                self._stream_closers.discard(process.kill)
+                stdout.close()
+                if process.poll() is None:
+                    process.kill()
+                process.wait()
+
+    def close_streams(self) -> None:
+        """Interrupt the commands being streamed, from another thread."""
+        for close in list(self._stream_closers):
+            close()
+
+    def run_command(self, command: List[str]) -> Tuple[str, str]:
+        start = time.time()
+        try:
+            with COMMAND_SECONDS.time(host=self.host):
+                stdout, stderr = self._exec_command(command)
+        except Exception:
+            COMMAND_ERRORS.inc(host=self.host)
+            raise
+        if self.recorder:
+            self.recorder.record(self.host, command, start, time.time() - start, stdout, stderr)
+        return stdout, stderr
+
+    def stream_command(self, command: List[str], timeout: Optional[float] = -1) -> Iterator[str]:
+        """Yield the command stdout lines as they are produced, without buffering the whole output."""
+        # Only the outputs read to the end are timed and recorded, not the ones of the commands interrupted
+        start = time.time()
+        perf_start = time.perf_counter()
+        recorder = self.recorder
+        lines: Optional[List[str]] = [] if recorder else None
+        try:
+            for line in self._stream_command(command, timeout):
+                if lines is not None:
+                    lines.append(line)
+                yield line
+        except Exception:
+            COMMAND_ERRORS.inc(host=self.host)
+            raise
+        COMMAND_SECONDS.observe(time.perf_counter() - perf_start, host=self.host)
+        if recorder and lines is not None:
+            recorder.record(self.host, command, start, time.time() - start, "".join(lines), "")
 
-class NetconMonArpCommandInput(NetconMonInput, NetconMonCommand):
-    SHELL_COMMAND = ["arp", "-a"]
+    def run_commands(self, commands: List[List[str]]) -> List[Tuple[str, str]]:
+        """Run independent commands concurrently, on separate channels of the remote session if any.
+
+        The results are returned in the commands order. The concurrency on the remote host is bounded by
+        SSH_MAX_CHANNELS.
+        """
+        with ThreadPoolExecutor(max_workers=len(commands), thread_name_prefix=__name__) as executor:
+            return list(executor.map(self.run_command, commands))
+
+
+class NetconMonStreamCommandInput(NetconMonInput, NetconMonCommand):
+    """Input parsing the output of a command line by line, as it is received."""
+
+    SHELL_COMMAND: List[str] = []
 
     def __init__(self, config: Dict[str, Any]):
         NetconMonCommand.__init__(self, config)
         NetconMonInput.__init__(self, config)
 
-    def get_connected_devices(self) -> List[Tuple[IPv4Address, MacAddress]]:
-        devices = []
+    def parse_line(self, line: str) -> Optional[Tuple[IPv4Address, MacAddress]]:
+        raise NotImplementedError
+
+    def parse_lines(self, lines: Iterable[str]) -> Iterator[Tuple[IPv4Address, MacAddress]]:
+        for line in lines:
+            try:
+                device = self.parse_line(line)
+                if device:
+                    yield device
+            except ValueError as e:
+                self.logger.warning(f"Invalid output or ip, skipping line {line.rstrip()}: {e}")
+
+    def get_connected_devices(self) -> Iterator[Tuple[IPv4Address, MacAddress]]:
         try:
-            command_stdout, _ = self.run_command(self.SHELL_COMMAND)
-
-            # Parse results
-            for line in command_stdout.splitlines():
-                try:
-                    tokens = line.split(" ")
-                    ip = ip_address(tokens[1].replace("(", "").replace(")", ""))
-                    mac = MacAddress(tokens[3])
-                    devices.append((ip, mac))
-                except (ValueError, IndexError) as e:
-                    self.logger.warning(f"Invalid output or ip, skipping line {line}: {e}")
+            yield from self.parse_lines(self.stream_command(self.SHELL_COMMAND))
         except NetconMonError as e:
             self.logger.error(f"Error executing commant: {e}")
 
-        return devices
+
+class NetconMonArpCommandInput(NetconMonStreamCommandInput):
+    SHELL_COMMAND = ["arp", "-a"]
+    # e.g. "? (192.168.0.1) at aa:bb:cc:dd:ee:ff [ether] on br0", incomplete entries have no mac address
+    LINE_FORMAT = re.compile(r"\((?P<ip>[^)]+)\) at (?P<mac>[0-9A-Fa-f:.-]+)")
+
+    def parse_line(self, line: str) -> Optional[Tuple[IPv4Address, MacAddress]]:
+        match = self.LINE_FORMAT.search(line)
+        if not match:
+            return None
+        return cast(IPv4Address, ip_address(match.group("ip"))), MacAddress(match.group("mac"))
 
 
-class NetconMonIpCommandInput(NetconMonInput, NetconMonCommand):
+class NetconMonIpCommandInput(NetconMonStreamCommandInput):
     SHELL_COMMAND = ["ip", "neigh"]
-    EXCLUDE_STATES = ["FAIL", "INCOMPLETE"]
+    EXCLUDE_STATES = ["FAIL", "FAILED", "INCOMPLETE"]
+    # e.g. "192.168.0.1 dev br0 lladdr aa:bb:cc:dd:ee:ff router REACHABLE", entries without mac address are skipped
+    LINE_FORMAT = re.compile(r"(?P<ip>\S+)\s+dev\s+\S+\s+lladdr\s+(?P<mac>\S+)(?:\s+\S+)*?\s+(?P<state>\S+)\s*")
 
-    def __init__(self, config: Dict[str, Any]):
-        NetconMonCommand.__init__(self, config)
-        NetconMonInput.__init__(self, config)
+    def parse_line(self, line: str) -> Optional[Tuple[IPv4Address, MacAddress]]:
+        match = self.LINE_FORMAT.fullmatch(line)
+        if not match or match.group("state").upper() in self.EXCLUDE_STATES:
+            return None
+        return cast(IPv4Address, ip_address(match.group("ip"))), MacAddress(match.group("mac"))
 
-    def get_connected_devices(self) -> List[Tuple[IPv4Address, MacAddress]]:
-        devices = []
-        try:
-            command_stdout, _ = self.run_command(self.SHELL_COMMAND)
-
-            # Parse results
-            for line in command_stdout.splitlines():
-                try:
-                    tokens = line.split(" ")
-                    ip = ip_address(tokens[0])
-                    mac = MacAddress(tokens[4])
-                    if tokens[5].upper() not in self.EXCLUDE_STATES:
-                        devices.append((ip, mac))
-                except (ValueError, IndexError) as e:
-                    self.logger.warning(f"Invalid output or ip, skipping line {line}: {e}")
-        except NetconMonError as e:
-            self.logger.error(f"Error executing commant: {e}")
 
-        return devices
+class NetconMonIpMonitorInput(NetconMonIpCommandInput):
+    """ip neigh input, also following ip monitor neigh to report new or reachable neighbors as soon as they appear,
+    and failed or deleted ones as lost.
+
+    Polling with ip neigh is still done every cycle, as a full resync catching any missed event.
+    """
+
+    MONITOR_COMMAND = ["ip", "monitor", "neigh"]
+    # e.g. "Deleted 192.168.0.1 dev br0 lladdr aa:bb:cc:dd:ee:ff STALE" or "192.168.0.1 dev br0 FAILED"
+    EVENT_FORMAT = re.compile(
+        r"(?P<deleted>Deleted\s+)?(?P<ip>\S+)\s+dev\s+\S+(?:\s+lladdr\s+(?P<mac>\S+))?(?:\s+\S+)*?\s+(?P<state>\S+)\s*"
+    )
+
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__(config)
+        self._max_backoff = self._config.get("SSH_RECONNECT_MAX_BACKOFF_SECS", 300)
+        self._watcher: Optional[Thread] = None
+        self._stopped = Event()
+
+    def parse_event(self, line: str) -> Optional[Tuple[IPv4Address, Optional[MacAddress], bool]]:
+        """Parse a neighbor event into its ip, its mac if known, and whether the neighbor is reachable."""
+        device = self.parse_line(line)
+        if device:
+            return device[0], device[1], True
+        match = self.EVENT_FORMAT.fullmatch(line)
+        if match and (match.group("deleted") or match.group("state").upper() in self.EXCLUDE_STATES):
+            mac = match.group("mac")
+            return cast(IPv4Address, ip_address(match.group("ip"))), MacAddress(mac) if mac else None, False
+        return None
+
+    def watch(
+        self,
+        callback: Callable[[Tuple[IPv4Address, MacAddress]], None],
+        on_lost: Optional[Callable[[IPv4Address, Optional[MacAddress]], None]] = None,
+    ) -> bool:
+        if not self._watcher:
+            self._stopped.clear()
+            self._watcher = Thread(
+                target=self._watch, args=(callback, on_lost), name=f"{__name__}.watch", daemon=True
+            )
+            self._watcher.start()
+        return True
+
+    def _watch(
+        self,
+        callback: Callable[[Tuple[IPv4Address, MacAddress]], None],
+        on_lost: Optional[Callable[[IPv4Address, Optional[MacAddress]], None]],
+    ) -> None:
+        """Follow the neighbor events, restarting the command with a backoff when it fails or ends."""
+        backoff = 1
+        while not self._stopped.is_set():
+            try:
+                for line in self.stream_command(self.MONITOR_COMMAND, timeout=None):
+                    try:
+                        event = self.parse_event(line)
+                    except ValueError as e:
+                        self.logger.warning(f"Invalid neighbor event, skipping line {line.rstrip()}: {e}")
+                        continue
+                    if not event:
+                        continue
+                    backoff = 1
+                    dev_ip, dev_mac, reachable = event
+                    if reachable:
+                        if dev_mac and self.is_monitored((dev_ip, dev_mac)):
+                            callback((dev_ip, dev_mac))
+                    elif on_lost and self.is_monitored((dev_ip, dev_mac)):
+                        on_lost(dev_ip, dev_mac)
+                if self._stopped.is_set():
+                    break
+                self.logger.warning(f"Neighbor events stopped, restarting in {backoff}s")
+            except NetconMonError as e:
+                if self._stopped.is_set():
+                    break
+                self.logger.error(f"Error following neighbor events, restarting in {backoff}s: {e}")
+            self._stopped.wait(backoff)
+            backoff = min(backoff * 2, self._max_backoff)
+
+    def stop(self) -> None:
+        """Stop following the neighbor events, terminating the ip monitor command."""
+        self._stopped.set()
+        if self._watcher:
+            deadline = time.monotonic() + 5
+            # The command may be starting while stopping, interrupt it until the watcher ends
+            while self._watcher.is_alive() and time.monotonic() < deadline:
+                self.close_streams()
+                self._watcher.join(timeout=0.1)
+            self._watcher = None
 
 
 class NetconMonAsusCommandResolver(NetconMonResolver, NetconMonCommand):
@@ -183,37 +526,48 @@ class NetconMonAsusCommandResolver(NetconMonResolver, NetconMonCommand):
         NetconMonCommand.__init__(self, config)
         NetconMonResolver.__init__(self, config)
 
+    def _add_mapping(self, mapping: Dict[MacAddress, str], mac_str: str, hostname: str) -> None:
+        try:
+            mapping[MacAddress(mac_str)] = hostname
+        except ValueError as e:
+            self.logger.warning(f"Invalid hostname entry {mac_str}, {hostname}: {e}")
+
     def get_hostname_mapping(self) -> Dict[MacAddress, str]:
+        mapping: Dict[MacAddress, str] = {}
         try:
             self.connect()
-            mapping = {}
+
+            # Run all the commands concurrently, the results are then merged in order: each config overrides the
+            # hostnames of the previous ones
+            nmp_stdout, dns_stdout, cli_stdout = [
+                stdout
+                for stdout, _ in self.run_commands(
+                    [self.SHELL_COMMAND_NMP, self.SHELL_COMMAND_DNS_CFG, self.SHELL_COMMAND_CLI_CFG]
+                )
+            ]
 
             # Get asus resolved config
-            command_stdout, _ = self.run_command(self.SHELL_COMMAND_NMP, autconnect=False)
-            payload = json.loads(command_stdout)
+            payload = json.loads(nmp_stdout)
             for mac in payload:
                 if payload[mac]["name"]:
-                    mapping[mac] = payload[mac]["name"]
+                    self._add_mapping(mapping, mac, payload[mac]["name"])
 
             # Get dns static host config
-            command_stdout, _ = self.run_command(self.SHELL_COMMAND_DNS_CFG, autconnect=False)
-            for line in command_stdout.splitlines():
+            for line in dns_stdout.splitlines():
                 tokens = line.split(",")
-                mapping[tokens[0].replace("dhcp-host=", "")] = tokens[2]
+                self._add_mapping(mapping, tokens[0].replace("dhcp-host=", ""), tokens[2])
 
             # Get UI static host config
-            command_stdout, _ = self.run_command(self.SHELL_COMMAND_CLI_CFG, autconnect=False)
-            for dev in command_stdout.split(">>"):
+            for dev in cli_stdout.split(">>"):
                 tokens = dev.replace("<", "").split(">")
                 entry = list(filter(None, tokens))
                 if entry:
-                    mapping[entry[1]] = entry[0]
+                    self._add_mapping(mapping, entry[1], entry[0])
 
             if self.logger.isEnabledFor(logging.DEBUG):
-                for dev in mapping:
-                    print(f"{dev}: {mapping[dev]}")
+                for dev_mac, hostname in mapping.items():
+                    print(f"{dev_mac}: {hostname}")
         except NetconMonError as e:
             self.logger.error(f"Error retrieving hostnames: {e}")
 
-        self.disconnect()
         return mapping
@@ -0,0 +1,130 @@
+import socket
+import struct
+from ipaddress import IPv4Address, ip_address
+from typing import Any, Dict, Iterator, Optional, Tuple, cast
+
+from netcon_monitor.monitor.input import MacAddress, NetconMonError, NetconMonInput
+
+# Netlink constants, from linux/netlink.h, linux/rtnetlink.h and linux/neighbour.h
+NETLINK_ROUTE = 0
+NLM_F_REQUEST = 0x01
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 0x02
+NLMSG_DONE = 0x03
+RTM_NEWNEIGH = 28
+RTM_GETNEIGH = 30
+NDA_DST = 1
+NDA_LLADDR = 2
+NUD_INCOMPLETE = 0x01
+NUD_FAILED = 0x20
+NUD_NOARP = 0x40
+
+NLMSGHDR = struct.Struct("=LHHLL")
+NDMSG = struct.Struct("=BBHiHBB")
+RTATTR = struct.Struct("=HH")
+
+
+def nl_align(length: int) -> int:
+    return (length + 3) & ~3
+
+
+def parse_neigh_messages(data: bytes, exclude_states: int) -> Iterator[Tuple[IPv4Address, MacAddress]]:
+    """Yield the neighbors of a buffer of netlink messages, skipping those in an excluded state.
+
+    Netlink errors raise a NetconMonError.
+    """
+    offset = 0
+    while offset + NLMSGHDR.size <= len(data):
+        msg_len, msg_type, _, _, _ = NLMSGHDR.unpack_from(data, offset)
+        if msg_len < NLMSGHDR.size:
+            raise NetconMonError(f"Invalid netlink message length {msg_len}")
+        if msg_type == NLMSG_ERROR:
+            (error,) = struct.unpack_from("=i", data, offset + NLMSGHDR.size)
+            if error:
+                raise NetconMonError(f"Netlink error {error}")
+        elif msg_type == RTM_NEWNEIGH:
+            _, _, _, _, state, _, _ = NDMSG.unpack_from(data, offset + NLMSGHDR.size)
+            ip: Optional[IPv4Address] = None
+            mac: Optional[MacAddress] = None
+            attr_offset = offset + NLMSGHDR.size + nl_align(NDMSG.size)
+            while attr_offset + RTATTR.size <= offset + msg_len:
+                attr_len, attr_type = RTATTR.unpack_from(data, attr_offset)
+                if attr_len < RTATTR.size:
+                    break
+                value = data[attr_offset + RTATTR.size : attr_offset + attr_len]
+                if attr_type == NDA_DST:
+                    # IPv6 neighbors are yielded too, typed as the addresses of the other inputs
+                    ip = cast(IPv4Address, ip_address(value))
+                elif attr_type == NDA_LLADDR and len(value) == 6:
+                    mac = MacAddress(value)
+                attr_offset += nl_align(attr_len)
+            if ip and mac and not state & exclude_states:
+                yield ip, mac
+        offset += nl_align(msg_len)
+
+
+class NetconMonProcArpInput(NetconMonInput):
+    """Local input reading the kernel ARP table from /proc/net/arp, without executing any command."""
+
+    PROC_ARP_FILE = "/proc/net/arp"
+    ATF_COM = 0x02  # Completed entry flag
+
+    def __init__(self, config: Dict[str, Any]):
+        NetconMonInput.__init__(self, config)
+
+    def get_connected_devices(self) -> Iterator[Tuple[IPv4Address, MacAddress]]:
+        try:
+            with open(self.PROC_ARP_FILE, "r") as f:
+                # Columns: IP address, HW type, Flags, HW address, Mask, Device
+                next(f, None)
+                for line in f:
+                    fields = line.split()
+                    try:
+                        if len(fields) >= 4 and int(fields[2], 16) & self.ATF_COM:
+                            yield IPv4Address(fields[0]), MacAddress(fields[3])
+                    except ValueError as e:
+                        # A malformed entry doesn't drop the rest of the table
+                        self.logger.debug(f"Invalid {self.PROC_ARP_FILE} entry, skipping line {line.rstrip()}: {e}")
+        except OSError as e:
+            self.logger.error(f"Error reading {self.PROC_ARP_FILE}: {e}")
+
+
+class NetconMonNetlinkInput(NetconMonInput):
+    """Local input dumping the kernel neighbor tables (IPv4 and IPv6) over a rtnetlink socket, linux only."""
+
+    # Same entries as ip neigh: skip unresolved entries, and the NOARP ones (e.g. multicast addresses)
+    EXCLUDE_STATES = NUD_INCOMPLETE | NUD_FAILED | NUD_NOARP
+    RECV_BUFFER_SIZE = 65536
+
+    def __init__(self, config: Dict[str, Any]):
+        NetconMonInput.__init__(self, config)
+        self._seq = 0
+
+    def get_connected_devices(self) -> Iterator[Tuple[IPv4Address, MacAddress]]:
+        try:
+            with socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE) as sock:
+                sock.bind((0, 0))
+                self._seq += 1
+                ndmsg = NDMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0, 0, 0)
+                header = NLMSGHDR.pack(
+                    NLMSGHDR.size + len(ndmsg), RTM_GETNEIGH, NLM_F_REQUEST | NLM_F_DUMP, self._seq, 0
+                )
+                sock.sendall(header + ndmsg)
+                while True:
+                    data = sock.recv(self.RECV_BUFFER_SIZE)
+                    yield from parse_neigh_messages(data, self.EXCLUDE_STATES)
+                    if not data or self._is_done(data):
+                        break
+        except (AttributeError, OSError, NetconMonError) as e:
+            # AttributeError is raised when netlink sockets are not supported on this platform
+            self.logger.error(f"Error dumping the neighbor table: {e}")
+
+    @staticmethod
+    def _is_done(data: bytes) -> bool:
+        offset = 0
+        while offset + NLMSGHDR.size <= len(data):
+            msg_len, msg_type, _, _, _ = NLMSGHDR.unpack_from(data, offset)
+            if msg_type in (NLMSG_DONE, NLMSG_ERROR) or msg_len < NLMSGHDR.size:
+                return True
+            offset += nl_align(msg_len)
+        return False
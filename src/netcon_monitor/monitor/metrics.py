@@ -0,0 +1,184 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+from typing import Dict, Iterator, List, Sequence, Tuple, TypeVar
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels_str(names: Sequence[str], values: Sequence[str], le: str = "") -> str:
+    labels = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if le:
+        labels.append(f'le="{le}"')
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+class NetconMonMetric:
+    """Base of the metrics, with values per label values."""
+
+    TYPE = ""
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+        self._lock = Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.TYPE}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class NetconMonCounter(NetconMonMetric):
+    TYPE = "counter"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, description, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_labels_str(self.label_names, key)} {value}"
+
+
+class NetconMonGauge(NetconMonCounter):
+    TYPE = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class NetconMonHistogram(NetconMonMetric):
+    """Histogram of durations in seconds, or of any other value, with cumulative buckets."""
+
+    TYPE = "histogram"
+    DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+    def __init__(
+        self, name: str, description: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> None:
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label values: count of each bucket (non cumulative, the last one is +Inf), sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            values[0][index] += 1
+            values[1][0] += value
+
+    def count(self, **labels: str) -> int:
+        values = self._values.get(self._key(labels))
+        return sum(values[0]) if values else 0
+
+    def total(self, **labels: str) -> float:
+        values = self._values.get(self._key(labels))
+        return values[1][0] if values else 0.0
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the duration of the block, measured with the monotonic performance counter."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = [(key, list(counts), total[0]) for key, (counts, total) in self._values.items()]
+        for key, counts, total in values:
+            cumulated = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulated += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket{_labels_str(self.label_names, key, le)} {cumulated}"
+            yield f"{self.name}_sum{_labels_str(self.label_names, key)} {total}"
+            yield f"{self.name}_count{_labels_str(self.label_names, key)} {cumulated}"
+
+
+MetricType = TypeVar("MetricType", bound=NetconMonMetric)
+
+
+class NetconMonMetricsRegistry:
+    def __init__(self, prefix: str = "netconmon_") -> None:
+        self._prefix = prefix
+        self._metrics: Dict[str, NetconMonMetric] = {}
+
+    def _register(self, metric: MetricType) -> MetricType:
+        registered = self._metrics.setdefault(metric.name, metric)
+        if not isinstance(registered, type(metric)):
+            raise ValueError(f"Metric {metric.name} already registered as a {registered.TYPE}")
+        return registered
+
+    def counter(self, name: str, description: str, labels: Sequence[str] = ()) -> NetconMonCounter:
+        return self._register(NetconMonCounter(self._prefix + name, description, labels))
+
+    def gauge(self, name: str, description: str, labels: Sequence[str] = ()) -> NetconMonGauge:
+        return self._register(NetconMonGauge(self._prefix + name, description, labels))
+
+    def histogram(
+        self,
+        name: str,
+        description: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = NetconMonHistogram.DEFAULT_BUCKETS,
+    ) -> NetconMonHistogram:
+        return self._register(NetconMonHistogram(self._prefix + name, description, labels, buckets))
+
+    def render(self) -> str:
+        """Render the metrics in the prometheus text exposition format."""
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+registry = NetconMonMetricsRegistry()
+
+CYCLE_SECONDS = registry.histogram("monitor_cycle_seconds", "Duration of the monitor poll cycles")
+CYCLE_OVERRUNS = registry.counter("monitor_cycle_overruns_total", "Poll cycles longer than MONITOR_DELAY_SECS")
+STAGE_SECONDS = registry.histogram(
+    "monitor_stage_seconds", "Duration of the monitor cycle stages, per target", ["stage", "target"]
+)
+TARGET_ERRORS = registry.counter("monitor_target_errors_total", "Failed or timed out target polls", ["target", "error"])
+TARGET_DEVICES = registry.gauge("monitor_target_devices", "Devices connected at the last poll", ["target"])
+COMMAND_SECONDS = registry.histogram("command_seconds", "Duration of the commands run", ["host"])
+COMMAND_ERRORS = registry.counter("command_errors_total", "Commands which failed to run", ["host"])
+SSH_CONNECT_SECONDS = registry.histogram("ssh_connect_seconds", "Duration of the ssh connections", ["host"])
+SSH_CONNECT_ERRORS = registry.counter("ssh_connect_errors_total", "Failed ssh connections", ["host"])
+DB_SAVE_SECONDS = registry.histogram("db_save_seconds", "Duration of the database saves", ["backend"])
+DB_SAVED_ITEMS = registry.counter("db_saved_items_total", "Items written by the database saves", ["backend"])
+NOTIFIER_SECONDS = registry.histogram("notifier_send_seconds", "Duration of the alarm sends", ["notifier"])
+NOTIFIER_ERRORS = registry.counter("notifier_errors_total", "Failed alarm sends", ["notifier"])
+ALARMS_SENT = registry.counter("alarms_sent_total", "Alarms delivered", ["notifier"])
+VENDOR_LOOKUPS = registry.counter(
+    "vendor_lookups_total", "Manufacturer lookups in the remote lookup cache, hit or miss", ["result"]
+)
+VENDOR_FETCHES = registry.counter(
+    "vendor_fetches_total", "Remote manufacturer requests, found, unknown or error", ["result"]
+)
+VENDOR_FETCH_SECONDS = registry.histogram("vendor_fetch_seconds", "Duration of the remote manufacturer requests")
@@ -1,21 +1,115 @@
 import logging
+import queue
 import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from ipaddress import IPv4Address
 from threading import Thread
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 from netcon_monitor.monitor.alarm import NetconMonAlarm
 from netcon_monitor.monitor.db import NetconMonDb, NetconMonDbItem
+from netcon_monitor.monitor.input import MacAddress, NetconMonSshSession
+from netcon_monitor.monitor.metrics import (
+    CYCLE_OVERRUNS,
+    CYCLE_SECONDS,
+    STAGE_SECONDS,
+    TARGET_DEVICES,
+    TARGET_ERRORS,
+)
+from netcon_monitor.monitor.presence import (
+    EVENT_DEVICES_CHANGED,
+    EVENT_JOIN,
+    EVENT_LEAVE,
+    EVENT_NEW_DEVICE,
+    NetconMonEventBus,
+    NetconMonPresenceTracker,
+)
+
+
+class NetconMonTarget:
+    """A monitored host, with its own config, input and resolver."""
+
+    def __init__(self, name: str, input_class, resolver_class, config: Dict[str, Any]) -> None:
+        self.name = name
+        self.config = config
+        self.fetcher = input_class(config)
+        self.resolver = resolver_class(config)
+        self.timeout = config.get("MONITOR_TARGET_TIMEOUT_SECS", 60)
+        self.future: Optional[Future] = None
+        # Start of the running poll, the timeout counts from it and not from the submission
+        self.started: Optional[float] = None
+        # Devices of the last processed poll, only updated from the monitor thread
+        self.snapshot: Optional[Dict[MacAddress, IPv4Address]] = None
+
+    def poll(self, resolve_hosts: bool) -> Tuple[List[Tuple[IPv4Address, MacAddress]], Dict[MacAddress, str]]:
+        self.started = time.monotonic()
+        hosts = {}
+        if resolve_hosts:
+            with STAGE_SECONDS.time(stage="resolve", target=self.name):
+                hosts = self.resolver.get_hostname_mapping()
+        # The devices are parsed as the command output is read, fetch and parse are timed together
+        with STAGE_SECONDS.time(stage="fetch", target=self.name):
+            devs = list(self.fetcher.get_monitored_devices())
+        return devs, hosts
+
+    def diff(
+        self, devs: Iterable[Tuple[IPv4Address, MacAddress]]
+    ) -> Tuple[List[Tuple[IPv4Address, MacAddress]], List[MacAddress], List[MacAddress]]:
+        """Replace the snapshot, returning the added or changed devices, and the unchanged and removed macs."""
+        previous = self.snapshot or {}
+        current = {dev_mac: dev_ip for dev_ip, dev_mac in devs}
+        changed = []
+        unchanged = []
+        for dev_mac, dev_ip in current.items():
+            if previous.get(dev_mac) == dev_ip:
+                unchanged.append(dev_mac)
+            else:
+                changed.append((dev_ip, dev_mac))
+        removed = [dev_mac for dev_mac in previous if dev_mac not in current]
+        self.snapshot = current
+        return changed, unchanged, removed
 
 
 class NetconMonMonitor(Thread):
-    def __init__(self, input_class: str, resolver_class: str, config, database: NetconMonDb = None):
+    def __init__(self, input_class: str, resolver_class: str, config, database: Optional[NetconMonDb] = None):
         super().__init__(name=__name__, daemon=True)
         self._config = config
-        self._fetcher = input_class(config)
-        self._resolver = resolver_class(config)
-        self._alarm = NetconMonAlarm(config)
+        self._targets = self._init_targets(input_class, resolver_class)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self._config.get("MONITOR_MAX_WORKERS", 8), thread_name_prefix=f"{__name__}.poll"
+        )
+        self.bus = NetconMonEventBus()
+        self._alarm = NetconMonAlarm(config, self.bus)
         self._period = self._config["MONITOR_DELAY_SECS"]
+        self._events: "queue.Queue[Optional[Tuple[str, Any, bool]]]" = queue.Queue()
         self.logger = logging.getLogger(__name__)
         self.db = database or NetconMonDb(self._config)
+        self.presence = NetconMonPresenceTracker(config, self.bus, self.db.online_ttl.total_seconds())
+        # Devices going online or offline change their online status without any database change. The presence is only
+        # updated within transactions, so that a burst of joins or leaves is published in a single snapshot
+        self.bus.subscribe(lambda event, session: self.db.mark_changed([session.mac]), [EVENT_JOIN, EVENT_LEAVE])
+        # Last lookup time of the manufacturers not found, retried every MONITOR_MANUFACTURER_RETRY_SECS only
+        self._manufacturer_retry_secs = self._config.get("MONITOR_MANUFACTURER_RETRY_SECS", 3600)
+        self._manufacturer_lookups: Dict[MacAddress, float] = {}
+        self._published_revision = self.db.revision
+
+    def _init_targets(self, input_class, resolver_class) -> List[NetconMonTarget]:
+        """Create the targets from MONITOR_TARGETS, or a single target from the main config."""
+        targets_config = self._config.get("MONITOR_TARGETS") or [{}]
+        targets = []
+        for target_config in targets_config:
+            config = dict(self._config)
+            config.update(target_config)
+            name = config.get("NAME") or config.get("REMOTE_HOSTNAME") or "local"
+            targets.append(
+                NetconMonTarget(
+                    name,
+                    target_config.get("CONNECTION_DETECTION_CLASS", input_class),
+                    target_config.get("HOSTNAME_DETECTION_CLASS", resolver_class),
+                    config,
+                )
+            )
+        return targets
 
     def run(self):
         """Run the thread periodically polling log files."""
@@ -25,27 +119,261 @@ class NetconMonMonitor(Thread):
         if self.logger.isEnabledFor(logging.DEBUG):
             self.db.dump()
 
+        self._alarm.seed(self.db)
+        self.presence.seed(self.db.online_devices())
+        self._alarm.start()
+        for target in self._targets:
+            if target.fetcher.watch(
+                lambda device, source=target.name: self._events.put((source, device, True)),
+                lambda dev_ip, dev_mac, source=target.name: self._events.put((source, (dev_ip, dev_mac), False)),
+            ):
+                self.logger.info(f"Following devices events from {target.name} between polls")
+
         while self._running:
-            devs = self._fetcher.get_monitored_devices()
-            hosts = self._resolver.get_hostname_mapping() if loops % self._config["MONITOR_HOSTS_PERIODS"] == 0 else {}
-            self.logger.info(f"{len(devs)} devices connected")
+            start = time.perf_counter()
+            self._poll_targets(loops % self._config["MONITOR_HOSTS_PERIODS"] == 0)
+            with STAGE_SECONDS.time(stage="alarm"):
+                self._alarm.send_pending_alarms()
+            duration = time.perf_counter() - start
+            CYCLE_SECONDS.observe(duration)
+            if duration > self._period:
+                CYCLE_OVERRUNS.inc()
+                self.logger.warning(f"Poll cycle took {duration:.1f}s, longer than the {self._period}s delay")
+            self._wait_events(self._period)
+            loops += 1
+
+    def _poll_targets(self, resolve_hosts: bool) -> None:
+        """Poll all the targets concurrently, and process the devices of each target as soon as it answers.
+
+        A target is abandoned once its poll ran for longer than its timeout, or if it could not start within the
+        monitor period, e.g. with all the workers held by unreachable targets.
+        """
+        pending = {}
+        for target in self._targets:
+            if target.future and not target.future.done():
+                self.logger.warning(f"Previous poll of {target.name} still running, skipping")
+                continue
+            target.started = None
+            target.future = self._executor.submit(target.poll, resolve_hosts)
+            pending[target.future] = (target, time.monotonic())
+
+        while pending:
+            now = time.monotonic()
+            deadlines = []
+            for future, (target, submitted) in list(pending.items()):
+                started = target.started
+                deadline = started + target.timeout if started is not None else submitted + self._period
+                if deadline > now:
+                    # Queued targets start when a worker is freed, possibly by an abandoned poll, check them again
+                    deadlines.append(deadline if started is not None else min(deadline, now + target.timeout))
+                    continue
+                del pending[future]
+                if future.cancel():
+                    self.logger.error(f"Poll of {target.name} not started after {self._period}s, cancelled")
+                    TARGET_ERRORS.inc(target=target.name, error="queued")
+                else:
+                    self.logger.error(f"Poll of {target.name} timed out after {target.timeout}s")
+                    TARGET_ERRORS.inc(target=target.name, error="timeout")
+            if not pending:
+                break
+            next_deadline = min(deadlines)
+            done, _ = wait(pending, timeout=next_deadline - now, return_when=FIRST_COMPLETED)
+            for future in done:
+                target, _ = pending.pop(future)
+                try:
+                    devs, hosts = future.result()
+                except Exception as e:
+                    self.logger.exception(f"Error polling {target.name}: {e}")
+                    TARGET_ERRORS.inc(target=target.name, error="exception")
+                    continue
+                with STAGE_SECONDS.time(stage="process", target=target.name):
+                    devs_count = self._process_poll(target, devs, hosts, full=resolve_hosts)
+                    self._publish_changes()
+                TARGET_DEVICES.set(devs_count, target=target.name)
+                self.logger.info(f"{devs_count} devices connected to {target.name}")
+
+    def _process_poll(
+        self,
+        target: NetconMonTarget,
+        devs: List[Tuple[IPv4Address, MacAddress]],
+        hosts: Dict[MacAddress, str],
+        full: bool,
+    ) -> int:
+        """Process the devices of a poll which changed since the previous one, only touching the unchanged ones.
+
+        All the devices are processed on the first poll and when full is set, e.g. on the hostname resolution cycles.
+        """
+        first = target.snapshot is None
+        changed, unchanged, removed = target.diff(devs)
+        if first or full:
+            return self._process_devices(devs, hosts, target.name)
+
+        if removed:
+            self.logger.debug(f"{len(removed)} devices disconnected from {target.name}")
+        snapshot = target.snapshot or {}
+        touched = []
+        with self.db.transaction():
+            for dev_mac in unchanged:
+                device = self.db.get(dev_mac)
+                if device and self._is_unchanged(device, snapshot[dev_mac], target.name):
+                    touched.append(device)
+                else:
+                    changed.append((snapshot[dev_mac], dev_mac))
+            self._process_devices(changed, hosts, target.name)
+            self.db.touch(device.mac for device in touched)
+            for device in touched:
+                self.presence.seen(device)
+        self.logger.debug(f"{len(changed)} devices changed on {target.name}, {len(touched)} unchanged")
+        return len(changed) + len(touched)
+
+    def _process_devices(
+        self, devs: Iterable[Tuple[IPv4Address, MacAddress]], hosts: Dict[MacAddress, str], source: str
+    ) -> int:
+        devs_count = 0
+        new_devices = []
+        with self.db.transaction():
             for dev_ip, dev_mac in devs:
-                mac_str = str(dev_mac)
-                device = self.db.get(mac_str)
+                devs_count += 1
+                device = self.db.get(dev_mac)
                 if device:
                     device.ip = dev_ip
-                    if mac_str in hosts:
-                        device.hostname = hosts[mac_str]
+                    device.source = source
+                    if dev_mac in hosts:
+                        device.hostname = hosts[dev_mac]
                 else:
-                    self.logger.info(f"New device detected {dev_mac}")
-                    device = NetconMonDbItem(ip=dev_ip, mac=dev_mac, hostname=hosts.get(mac_str))
+                    self.logger.info(f"New device detected {dev_mac} on {source}")
+                    device = NetconMonDbItem(ip=dev_ip, mac=dev_mac, hostname=hosts.get(dev_mac), source=source)
+                    new_devices.append(device)
                 self._alarm.process_device(device)
                 self.db.update(device)
+                if device.manufacturer:
+                    self._manufacturer_lookups.pop(dev_mac, None)
+                else:
+                    self._manufacturer_lookups[dev_mac] = time.monotonic()
+                self.presence.seen(device)
+        for device in new_devices:
+            self.bus.publish(EVENT_NEW_DEVICE, device)
+        return devs_count
 
-            self._alarm.send_pending_alarms()
-            time.sleep(self._period)
-            loops += 1
+    def _process_events(self, devs: List[Tuple[IPv4Address, MacAddress]], source: str) -> int:
+        """Process the devices reported between polls which changed, only touching the unchanged ones, returning the
+        number of devices processed."""
+        changed = []
+        touched = []
+        with self.db.transaction():
+            # Only the last event of each device matters
+            for dev_mac, dev_ip in {dev_mac: dev_ip for dev_ip, dev_mac in devs}.items():
+                device = self.db.get(dev_mac)
+                if device and self._is_unchanged(device, dev_ip, source):
+                    touched.append(device)
+                else:
+                    changed.append((dev_ip, dev_mac))
+            if changed:
+                self._process_devices(changed, {}, source)
+            self.db.touch(device.mac for device in touched)
+            for device in touched:
+                self.presence.seen(device)
+        return len(changed)
+
+    def _lose_devices(self, lost: List[Tuple[str, IPv4Address, Optional[MacAddress]]]) -> None:
+        """End the presence sessions of the devices reported as no longer reachable."""
+        targets = {target.name: target for target in self._targets}
+        with self.db.transaction():
+            for source, dev_ip, dev_mac in lost:
+                snapshot = targets[source].snapshot or {}
+                if dev_mac is None:
+                    dev_mac = next((mac for mac, ip in snapshot.items() if ip == dev_ip), None)
+                if dev_mac is not None and self.presence.leave(dev_mac):
+                    self.logger.debug(f"Device {dev_mac} no longer reachable on {source}")
+
+    def _is_unchanged(self, device: NetconMonDbItem, dev_ip: IPv4Address, source: str) -> bool:
+        """Whether a stored device seen again only needs its last seen time refreshed.
+
+        Devices still need processing with another ip or source, with an alarm to raise or clear, or when their
+        manufacturer lookup is due.
+        """
+        return (
+            device.ip == dev_ip
+            and device.source == source
+            and self._manufacturer_resolved(device)
+            and not self._alarm.needs_processing(device)
+        )
+
+    def _manufacturer_resolved(self, device: NetconMonDbItem) -> bool:
+        """Whether the manufacturer of a device is known, or was looked up recently without success, e.g. for the
+        randomized MACs."""
+        if device.manufacturer:
+            return True
+        looked_up = self._manufacturer_lookups.get(device.mac)
+        return looked_up is not None and time.monotonic() - looked_up < self._manufacturer_retry_secs
+
+    def _next_timer(self) -> Optional[float]:
+        """Get the time in seconds until the next alarm or presence expiry."""
+        delays = [delay for delay in (self._alarm.next_expiry(), self.presence.next_expiry()) if delay is not None]
+        return min(delays) if delays else None
+
+    def _run_timers(self) -> None:
+        with STAGE_SECONDS.time(stage="timers"):
+            self._expire()
+
+    def _expire(self) -> None:
+        cleared = self._alarm.expire_alarms(self.db)
+        if cleared:
+            self.logger.info(f"{len(cleared)} alarms expired")
+        with self.db.transaction():
+            left = self.presence.expire()
+        if left:
+            self.logger.info(f"{len(left)} devices disconnected")
+        self._publish_changes()
+
+    def _publish_changes(self) -> None:
+        """Publish the keys of the devices changed since the last publication."""
+        revision, keys = self.db.changes_since(self._published_revision)
+        self._published_revision = revision
+        if keys:
+            self.bus.publish(EVENT_DEVICES_CHANGED, {"revision": revision, "keys": keys})
+
+    def _wait_events(self, delay: float) -> None:
+        """Wait for the next poll, processing the devices reported by the inputs and the expiries meanwhile."""
+        deadline = time.monotonic() + delay
+        while self._running:
+            timeout = max(deadline - time.monotonic(), 0)
+            next_timer = self._next_timer()
+            expiring = next_timer is not None and next_timer < timeout
+            try:
+                events = [self._events.get(timeout=next_timer if expiring else timeout)]
+            except queue.Empty:
+                if not expiring:
+                    return
+                self._run_timers()
+                continue
+            while not self._events.empty():
+                events.append(self._events.get_nowait())
+
+            # A None event is only used to wake up the thread
+            devs_by_source: Dict[str, List[Tuple[IPv4Address, MacAddress]]] = {}
+            lost = []
+            for event in filter(None, events):
+                source, (dev_ip, dev_mac), reachable = event
+                if reachable:
+                    devs_by_source.setdefault(source, []).append((dev_ip, dev_mac))
+                else:
+                    lost.append((source, dev_ip, dev_mac))
+            processed = 0
+            for source, devs in devs_by_source.items():
+                processed += self._process_events(devs, source)
+            if lost:
+                self._lose_devices(lost)
+            self._publish_changes()
+            if processed:
+                self._alarm.send_pending_alarms()
 
     def stop(self):
         self._running = False
+        self._events.put(None)
+        for target in self._targets:
+            target.fetcher.stop()
+        self._executor.shutdown(wait=False)
+        self._alarm.stop()
+        NetconMonSshSession.close_all()
         self.db.close()
@@ -0,0 +1,69 @@
+from bisect import bisect_right
+from ipaddress import IPv4Address, IPv6Address, ip_network
+from typing import Dict, Iterable, List, Tuple, Union
+
+IP_BITS = {4: 32, 6: 128}
+
+
+def merge_intervals(intervals: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    "Merge overlapping or adjacent [start, end] intervals, returning them sorted"
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract_intervals(intervals: List[Tuple[int, int]], excluded: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    "Remove the excluded intervals from sorted disjoint intervals"
+    result = []
+    for start, end in intervals:
+        for ex_start, ex_end in excluded:
+            if ex_end < start or ex_start > end:
+                continue
+            if ex_start > start:
+                result.append((start, ex_start - 1))
+            start = ex_end + 1
+            if start > end:
+                break
+        if start <= end:
+            result.append((start, end))
+    return result
+
+
+class NetconMonNetworkMatcher:
+    """Match ip addresses against included and excluded networks, IPv4 and IPv6.
+
+    The networks are compiled per ip version into sorted disjoint integer intervals (included networks minus the
+    excluded ones), so that a membership test is a single bisection. No included network means all the addresses.
+    """
+
+    def __init__(self, included: Iterable[str], excluded: Iterable[str] = ()) -> None:
+        included_nets = [ip_network(net) for net in included]
+        excluded_nets = [ip_network(net) for net in excluded]
+        self._starts: Dict[int, List[int]] = {}
+        self._ends: Dict[int, List[int]] = {}
+        for version, bits in IP_BITS.items():
+            if included_nets:
+                intervals = merge_intervals(
+                    self._network_interval(net) for net in included_nets if net.version == version
+                )
+            else:
+                intervals = [(0, (1 << bits) - 1)]
+            excluded_intervals = merge_intervals(
+                self._network_interval(net) for net in excluded_nets if net.version == version
+            )
+            intervals = subtract_intervals(intervals, excluded_intervals)
+            self._starts[version] = [start for start, _ in intervals]
+            self._ends[version] = [end for _, end in intervals]
+
+    @staticmethod
+    def _network_interval(network) -> Tuple[int, int]:
+        return int(network.network_address), int(network.broadcast_address)
+
+    def __contains__(self, ip: Union[IPv4Address, IPv6Address]) -> bool:
+        value = int(ip)
+        index = bisect_right(self._starts[ip.version], value) - 1
+        return index >= 0 and value <= self._ends[ip.version][index]
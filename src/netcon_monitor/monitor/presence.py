@@ -0,0 +1,201 @@
+import logging
+import os
+import struct
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+import attr
+
+from netcon_monitor.monitor.input import MacAddress
+
+EVENT_JOIN = "join"
+EVENT_LEAVE = "leave"
+EVENT_ALARM_RAISED = "alarm_raised"
+EVENT_ALARM_CLEARED = "alarm_cleared"
+EVENT_NEW_DEVICE = "new_device"
+# Committed database changes, with the revision and the keys of the changed devices
+EVENT_DEVICES_CHANGED = "devices_changed"
+
+
+class NetconMonEventBus:
+    """In-process publish/subscribe of the monitor events.
+
+    Subscribers are called synchronously from the publishing thread, and must not block.
+    """
+
+    def __init__(self) -> None:
+        self.logger = logging.getLogger(__name__)
+        self._lock = Lock()
+        self._subscribers: List[tuple] = []
+
+    def subscribe(self, callback: Callable[[str, Any], None], events: Optional[Iterable[str]] = None) -> Callable:
+        """Call back with the event name and payload for the given events, or all the events.
+
+        Returns the function unsubscribing the callback.
+        """
+        subscriber = (callback, frozenset(events) if events else None)
+        with self._lock:
+            self._subscribers = self._subscribers + [subscriber]
+
+        def unsubscribe() -> None:
+            with self._lock:
+                self._subscribers = [sub for sub in self._subscribers if sub is not subscriber]
+
+        return unsubscribe
+
+    def publish(self, event: str, payload: Any) -> None:
+        for callback, events in self._subscribers:
+            if events is None or event in events:
+                try:
+                    callback(event, payload)
+                except Exception as e:
+                    self.logger.exception(f"Error in {event} subscriber: {e}")
+
+
+@attr.s(slots=True)
+class NetconMonPresenceSession:
+    """A period during which a device was connected."""
+
+    mac = attr.ib(type=MacAddress)
+    start = attr.ib(type=float)
+    end = attr.ib(default=None, type=float)
+
+
+class NetconMonSessionHistory:
+    """Append-only history of the ended sessions, as fixed size binary records (mac, start, end).
+
+    Records older than PRESENCE_HISTORY_RETENTION_SECS, or beyond the PRESENCE_HISTORY_MAX_SESSIONS most recent ones,
+    are dropped when the file is compacted, at start and when it grows twice as large as its limit.
+    """
+
+    HISTORY_FILE = "sessions.bin"
+    RECORD = struct.Struct("<Qdd")
+
+    def __init__(self, config: Dict[str, Any]) -> None:
+        self.logger = logging.getLogger(__name__)
+        self._path = config["DATABASE_PATH"] + "/" + self.HISTORY_FILE
+        self._retention = config.get("PRESENCE_HISTORY_RETENTION_SECS", 90 * 86400)
+        self._max_sessions = config.get("PRESENCE_HISTORY_MAX_SESSIONS", 1000000)
+        self._lock = Lock()
+        self._count = 0
+        self.compact()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, sessions: Iterable[NetconMonPresenceSession]) -> None:
+        data = b"".join(self.RECORD.pack(int(session.mac), session.start, session.end) for session in sessions)
+        if not data:
+            return
+        with self._lock:
+            with open(self._path, "ab") as f:
+                f.write(data)
+            self._count += len(data) // self.RECORD.size
+        if self._count > 2 * self._max_sessions:
+            self.compact()
+
+    def _read(self) -> bytes:
+        try:
+            with open(self._path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return b""
+        # Ignore a partially written last record
+        return data[: len(data) - len(data) % self.RECORD.size]
+
+    def sessions(self, mac: Optional[MacAddress] = None, since: Optional[float] = None) -> Iterator[NetconMonPresenceSession]:
+        """Iterate over the sessions, oldest first, of a device or all the devices, ended after since."""
+        with self._lock:
+            data = self._read()
+        mac_value = int(mac) if mac is not None else None
+        for value, start, end in self.RECORD.iter_unpack(data):
+            if (mac_value is None or value == mac_value) and (since is None or end >= since):
+                yield NetconMonPresenceSession(MacAddress(value), start, end)
+
+    def compact(self) -> None:
+        """Rewrite the history without the sessions beyond the retention limits."""
+        with self._lock:
+            data = self._read()
+            oldest = time.time() - self._retention
+            records = [record for record in self.RECORD.iter_unpack(data) if record[2] >= oldest]
+            records = records[-self._max_sessions :] if self._max_sessions else records
+            if len(records) * self.RECORD.size != len(data):
+                tmp_path = self._path + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(b"".join(self.RECORD.pack(*record) for record in records))
+                os.replace(tmp_path, self._path)
+                self.logger.info(f"Compacted session history, {len(records)} sessions kept")
+            self._count = len(records)
+
+
+class NetconMonPresenceTracker:
+    """Track the devices presence sessions, publishing join and leave events.
+
+    Online devices are kept ordered by last seen time, so that departures are found from the oldest one without
+    scanning all the devices.
+    """
+
+    def __init__(self, config: Dict[str, Any], bus: NetconMonEventBus, ttl: float) -> None:
+        self.logger = logging.getLogger(__name__)
+        self._bus = bus
+        self._ttl = ttl
+        self.history = NetconMonSessionHistory(config)
+        self._online: "OrderedDict[MacAddress, float]" = OrderedDict()
+        self._starts: Dict[MacAddress, float] = {}
+
+    def __contains__(self, mac: MacAddress) -> bool:
+        return mac in self._online
+
+    def seed(self, devices: Iterable) -> None:
+        """Resume the sessions of the devices online at start, without publishing join events."""
+        for device in sorted(devices, key=lambda device: device.last_seen_ts):
+            self._online[device.mac] = device.last_seen_ts
+            self._starts[device.mac] = device.last_seen_ts
+
+    def session(self, mac: MacAddress) -> Optional[NetconMonPresenceSession]:
+        """Get the current session of a device, if online."""
+        return NetconMonPresenceSession(mac, self._starts[mac]) if mac in self._online else None
+
+    def seen(self, device, timestamp: Optional[float] = None) -> None:
+        timestamp = timestamp or device.last_seen_ts
+        mac = device.mac
+        if mac in self._online:
+            self._online[mac] = timestamp
+            self._online.move_to_end(mac)
+        else:
+            self._online[mac] = timestamp
+            self._starts[mac] = timestamp
+            self._bus.publish(EVENT_JOIN, device)
+
+    def leave(self, mac: MacAddress) -> Optional[NetconMonPresenceSession]:
+        """End the session of a device reported as no longer reachable, returning it if the device was online."""
+        last_seen = self._online.pop(mac, None)
+        if last_seen is None:
+            return None
+        session = NetconMonPresenceSession(mac, self._starts.pop(mac), last_seen)
+        self.history.append([session])
+        self._bus.publish(EVENT_LEAVE, session)
+        return session
+
+    def next_expiry(self) -> Optional[float]:
+        """Get the time in seconds until the oldest online device leaves, or None if no device is online."""
+        if not self._online:
+            return None
+        return max(next(iter(self._online.values())) + self._ttl - time.time(), 0)
+
+    def expire(self) -> List[NetconMonPresenceSession]:
+        """End the sessions of the devices not seen for longer than the ttl, returning them."""
+        oldest = time.time() - self._ttl
+        ended = []
+        while self._online:
+            mac, last_seen = next(iter(self._online.items()))
+            if last_seen > oldest:
+                break
+            del self._online[mac]
+            ended.append(NetconMonPresenceSession(mac, self._starts.pop(mac), last_seen))
+        self.history.append(ended)
+        for session in ended:
+            self._bus.publish(EVENT_LEAVE, session)
+        return ended
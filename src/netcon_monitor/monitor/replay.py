@@ -0,0 +1,145 @@
+import gzip
+import json
+import logging
+import time
+from collections import deque
+from functools import lru_cache
+from ipaddress import IPv4Address
+from threading import Lock
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from netcon_monitor.monitor.input import (
+    MacAddress,
+    NetconMonCommand,
+    NetconMonError,
+    NetconMonInput,
+    NetconMonResolver,
+)
+
+
+class NetconMonCommandRecorder:
+    """Append the outputs of the commands, with their start time and duration, to a gzipped json lines file.
+
+    Install it as NetconMonCommand.recorder to record all the commands run by the inputs and resolvers.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+        self._lock = Lock()
+        self._file = gzip.open(path, "at", encoding="utf-8")
+
+    def record(self, host: str, command: List[str], start: float, duration: float, stdout: str, stderr: str) -> None:
+        record = {"t": round(start, 3), "d": round(duration, 3), "host": host, "cmd": " ".join(command), "out": stdout}
+        if stderr:
+            record["err"] = stderr
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._file.write(line)
+            # Each record is flushed, so that the file is readable while recording and after a crash
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class NetconMonReplayLog:
+    """Recorded command outputs, replayed in order for each host and command.
+
+    Each output is returned at its recorded time since the first record, and after its recorded duration, divided by
+    the replay speed. A speed of 0 replays as fast as possible. Once all the outputs of a command have been replayed,
+    the last one is returned again.
+    """
+
+    _logs: Dict[Tuple[str, float], "NetconMonReplayLog"] = {}
+    _logs_lock = Lock()
+
+    def __init__(self, path: str, speed: float = 1.0) -> None:
+        self.logger = logging.getLogger(__name__)
+        self._speed = speed
+        self._lock = Lock()
+        self._outputs: Dict[Tuple[str, str], deque] = {}
+        self._first_ts = None
+        self._start: Optional[float] = None
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if self._first_ts is None or record["t"] < self._first_ts:
+                    self._first_ts = record["t"]
+                self._outputs.setdefault((record["host"], record["cmd"]), deque()).append(record)
+        self.logger.info(f"Loaded {sum(map(len, self._outputs.values()))} recorded outputs from {path}")
+
+    @classmethod
+    def get(cls, path: str, speed: float = 1.0) -> "NetconMonReplayLog":
+        """Get the log of a file, shared by all the inputs and resolvers replaying it."""
+        key = (path, speed)
+        with cls._logs_lock:
+            if key not in cls._logs:
+                cls._logs[key] = cls(path, speed)
+            return cls._logs[key]
+
+    def output(self, host: str, command: List[str]) -> Tuple[str, str]:
+        """Get the next recorded output of a command on a host, waiting for its replay time."""
+        with self._lock:
+            if self._start is None:
+                self._start = time.monotonic()
+            start = self._start
+            outputs = self._outputs.get((host, " ".join(command)))
+            if not outputs:
+                raise NetconMonError(f"No recorded output of {' '.join(command)} on {host}")
+            record = outputs.popleft() if len(outputs) > 1 else outputs[0]
+        if self._speed > 0:
+            delay = start + (record["t"] - self._first_ts) / self._speed - time.monotonic()
+            time.sleep(max(delay, 0) + record["d"] / self._speed)
+        return record["out"], record.get("err", "")
+
+
+class NetconMonReplayCommand(NetconMonCommand):
+    """Command returning the outputs recorded in REPLAY_FILE instead of running the commands."""
+
+    def __init__(self, config: Dict[str, Any]) -> None:
+        self._host = config["REMOTE_HOSTNAME"] or "local"
+        self._replay = NetconMonReplayLog.get(config["REPLAY_FILE"], config.get("REPLAY_SPEED", 1.0))
+        # Never connect to the recorded host
+        super().__init__(dict(config, REMOTE_HOSTNAME=None))
+
+    @property
+    def host(self) -> str:
+        return self._host
+
+    def _exec_command(self, command: List[str]) -> Tuple[str, str]:
+        return self._replay.output(self._host, command)
+
+    def _stream_command(self, command: List[str], timeout: Optional[float]) -> Iterator[str]:
+        stdout, _ = self._replay.output(self._host, command)
+        yield from stdout.splitlines(keepends=True)
+
+
+@lru_cache(maxsize=None)
+def replay_class(command_class: type) -> type:
+    """Get a subclass of an input or resolver running its commands with NetconMonReplayCommand."""
+    name = command_class.__name__.replace("NetconMon", "NetconMonReplay", 1)
+    return type(name, (NetconMonReplayCommand, command_class), {})
+
+
+class NetconMonReplayInput(NetconMonInput):
+    """Input parsing the outputs recorded in REPLAY_FILE with REPLAY_INPUT_CLASS."""
+
+    def __init__(self, config: Dict[str, Any]) -> None:
+        super().__init__(config)
+        self._input = replay_class(config["REPLAY_INPUT_CLASS"])(config)
+
+    def get_connected_devices(self) -> Iterator[Tuple[IPv4Address, MacAddress]]:
+        return self._input.get_connected_devices()
+
+
+class NetconMonReplayResolver(NetconMonResolver):
+    """Resolver parsing the outputs recorded in REPLAY_FILE with REPLAY_RESOLVER_CLASS."""
+
+    def __init__(self, config: Dict[str, Any]) -> None:
+        super().__init__(config)
+        self._resolver = replay_class(config["REPLAY_RESOLVER_CLASS"])(config)
+
+    def get_hostname_mapping(self) -> Dict[MacAddress, str]:
+        return self._resolver.get_hostname_mapping()
@@ -0,0 +1,228 @@
+import csv
+import json
+import logging
+import os
+import time
+from array import array
+from bisect import bisect_left
+from threading import Condition, Thread
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+from netcon_monitor.monitor.metrics import VENDOR_FETCH_SECONDS, VENDOR_FETCHES, VENDOR_LOOKUPS
+
+log = logging.getLogger(__name__)
+
+
+class NetconMonOuiRegistry:
+    """Offline MAC vendor registry, loaded from the IEEE MA-L, MA-M, MA-S (and IAB) csv files.
+
+    Prefixes are kept per length in sorted integer arrays, and looked up by bisection from the most specific length.
+    """
+
+    MAC_BITS = 48
+    PREFIX_BITS = (36, 28, 24)
+    CSV_KEY_ASSIGNMENT = "Assignment"
+    CSV_KEY_ORGANIZATION = "Organization Name"
+
+    def __init__(self) -> None:
+        self._vendors: List[str] = []
+        self._vendor_ids: Dict[str, int] = {}
+        self._prefixes = {bits: array("Q") for bits in self.PREFIX_BITS}
+        self._prefix_vendors = {bits: array("I") for bits in self.PREFIX_BITS}
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "NetconMonOuiRegistry":
+        registry = cls()
+        for path in config.get("OUI_DATABASE_FILES") or []:
+            try:
+                registry.load_csv(path)
+            except OSError as e:
+                log.error(f"Unable to load vendor database {path}: {e}")
+        return registry
+
+    def __len__(self) -> int:
+        return sum(len(prefixes) for prefixes in self._prefixes.values())
+
+    def _vendor_id(self, name: str) -> int:
+        if name not in self._vendor_ids:
+            self._vendor_ids[name] = len(self._vendors)
+            self._vendors.append(name)
+        return self._vendor_ids[name]
+
+    def load_csv(self, path: str) -> None:
+        """Load an IEEE registry csv file, entries already loaded for the same prefix are replaced."""
+        entries: Dict[int, Dict[int, int]] = {bits: {} for bits in self.PREFIX_BITS}
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                assignment = (row.get(self.CSV_KEY_ASSIGNMENT) or "").strip()
+                name = (row.get(self.CSV_KEY_ORGANIZATION) or "").strip()
+                bits = len(assignment) * 4
+                if bits not in entries or not name:
+                    continue
+                try:
+                    entries[bits][int(assignment, 16)] = self._vendor_id(name)
+                except ValueError:
+                    log.warning(f"Invalid assignment {assignment} in {path}, skipping")
+
+        for bits, new_entries in entries.items():
+            if new_entries:
+                merged = dict(zip(self._prefixes[bits], self._prefix_vendors[bits]))
+                merged.update(new_entries)
+                prefixes = sorted(merged)
+                self._prefixes[bits] = array("Q", prefixes)
+                self._prefix_vendors[bits] = array("I", (merged[prefix] for prefix in prefixes))
+        log.info(f"Loaded vendor database {path}, {len(self)} prefixes")
+
+    def lookup(self, mac: int) -> Optional[str]:
+        """Get the vendor of a MAC address given as a 48-bit integer, or None if unknown."""
+        for bits in self.PREFIX_BITS:
+            prefixes = self._prefixes[bits]
+            prefix = mac >> (self.MAC_BITS - bits)
+            index = bisect_left(prefixes, prefix)
+            if index < len(prefixes) and prefixes[index] == prefix:
+                return self._vendors[self._prefix_vendors[bits][index]]
+        return None
+
+
+class NetconMonVendorCache(Thread):
+    """Remote vendor lookup cache, keyed by OUI and persisted on disk.
+
+    Lookups never block: unknown or expired prefixes are queued and resolved by batches in the cache thread, at the
+    rate allowed by the remote api. Unknown vendors are cached as well, with a shorter TTL.
+    """
+
+    API_URL = "https://api.macvendors.com/"
+    # Locally administered addresses, e.g. randomized by the phones, are not assigned to any vendor
+    LOCAL_BIT = 0x02 << 40
+    API_TIMEOUT_SECS = 10
+    CACHE_FILE = "vendors.json"
+    MAX_BACKOFF_SECS = 300
+
+    def __init__(self, config: Dict[str, Any]) -> None:
+        super().__init__(name=__name__, daemon=True)
+        self._config = config
+        self.logger = logging.getLogger(__name__)
+        self._path = self._config["DATABASE_PATH"] + "/" + self.CACHE_FILE
+        self._ttl = self._config.get("VENDOR_CACHE_TTL_SECS", 30 * 86400)
+        self._negative_ttl = self._config.get("VENDOR_CACHE_NEGATIVE_TTL_SECS", 86400)
+        self._rate = self._config.get("VENDOR_LOOKUP_RATE_SECS", 1.0)
+        self._batch_size = self._config.get("VENDOR_LOOKUP_BATCH_SIZE", 32)
+        self._entries: Dict[str, Tuple[Optional[str], float]] = {}
+        self._pending: Dict[str, None] = {}
+        self._condition = Condition()
+        self._backoff = 0.0
+        self._running = False
+        self.load()
+
+    @staticmethod
+    def oui(mac: int) -> str:
+        return ":".join(f"{byte:0>2X}" for byte in (mac >> 24).to_bytes(3, "big"))
+
+    def load(self) -> None:
+        try:
+            with open(self._path, "r") as f:
+                self._entries = {oui: (name, ts) for oui, (name, ts) in json.load(f).items()}
+        except (FileNotFoundError, json.decoder.JSONDecodeError, ValueError):
+            self._entries = {}
+
+    def save(self) -> None:
+        tmp_path = self._path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self._path)
+
+    def lookup(self, mac: int) -> Optional[str]:
+        """Get the cached vendor of a MAC address given as a 48-bit integer, queuing its prefix if not cached."""
+        if mac & self.LOCAL_BIT:
+            return None
+        oui = self.oui(mac)
+        entry = self._entries.get(oui)
+        if entry:
+            name, timestamp = entry
+            if time.time() - timestamp < (self._ttl if name else self._negative_ttl):
+                VENDOR_LOOKUPS.inc(result="hit")
+                return name
+        VENDOR_LOOKUPS.inc(result="miss")
+
+        with self._condition:
+            if oui not in self._pending:
+                self._pending[oui] = None
+                self._condition.notify()
+        # Keep using an expired vendor name until it is refreshed
+        return entry[0] if entry else None
+
+    def _fetch(self, oui: str) -> Tuple[bool, Optional[str]]:
+        """Query the remote api, returning whether the prefix was resolved, and its vendor if known."""
+        try:
+            with VENDOR_FETCH_SECONDS.time():
+                response = requests.get(self.API_URL + oui, timeout=self.API_TIMEOUT_SECS)
+        except requests.RequestException as e:
+            VENDOR_FETCHES.inc(result="error")
+            self.logger.error(f"Unable to get mac info for {oui} from api.macvendors.com: {e}")
+            return False, None
+        if response.status_code == 200:
+            VENDOR_FETCHES.inc(result="found")
+            return True, response.content.decode()
+        if response.status_code == 404:
+            VENDOR_FETCHES.inc(result="unknown")
+            return True, None
+        VENDOR_FETCHES.inc(result="error")
+        self.logger.warning(f"Unable to get mac info for {oui} from api.macvendors.com: {response.status_code}")
+        return False, None
+
+    def _next_batch(self) -> List[str]:
+        with self._condition:
+            while self._running and not self._pending:
+                self._condition.wait()
+            batch = list(self._pending)[: self._batch_size]
+        return batch
+
+    def process_batch(self, batch: List[str]) -> None:
+        """Resolve a batch of prefixes at the api rate, backing off on failures, and save the results."""
+        for oui in batch:
+            resolved, name = self._fetch(oui)
+            if resolved:
+                self._entries[oui] = (name, time.time())
+                with self._condition:
+                    self._pending.pop(oui, None)
+                self._backoff = 0.0
+            else:
+                # Throttled or unreachable, leave the remaining prefixes pending and retry later
+                self._backoff = min(max(self._backoff * 2, self._rate, 1.0), self.MAX_BACKOFF_SECS)
+                break
+            self._sleep(self._rate)
+        self.save()
+        self._sleep(self._backoff)
+
+    def _sleep(self, delay: float) -> None:
+        """Sleep until the delay is elapsed or the cache is stopped, new lookups notifying the condition meanwhile."""
+        deadline = time.monotonic() + delay
+        with self._condition:
+            while self._running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+    def run(self) -> None:
+        self._running = True
+        while self._running:
+            batch = self._next_batch()
+            if batch and self._running:
+                try:
+                    self.process_batch(batch)
+                except Exception as e:
+                    self.logger.exception(f"Error resolving vendors: {e}")
+                    self._backoff = min(max(self._backoff * 2, self._rate, 1.0), self.MAX_BACKOFF_SECS)
+                    self._sleep(self._backoff)
+
+    def stop(self) -> None:
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        try:
+            self.save()
+        except OSError as e:
+            self.logger.error(f"Unable to save the vendor cache {self._path}: {e}")
@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta
+
+from netcon_monitor.monitor.alarm import NetconMonAlarm, NetconMonAlarmNotifier
+from netcon_monitor.monitor.db import NetconMonDb, NetconMonDbItem
+from netcon_monitor.monitor.input import MacAddress
+from netcon_monitor.monitor.presence import EVENT_ALARM_CLEARED
+
+
+class ChunkedNotifier(NetconMonAlarmNotifier):
+    MAX_MESSAGE_LENGTH = 200
+
+
+def test_build_messages_chunks():
+    notifier = ChunkedNotifier({"ALARM_DIGEST_MAX_DEVICES": 20})
+    devices = [NetconMonDbItem(mac=MacAddress(i), ip=f"10.0.0.{i}", manufacturer="acme") for i in range(30)]
+    messages = notifier._build_messages(devices)
+
+    assert len(messages) > 1
+    assert all(len(message) <= ChunkedNotifier.MAX_MESSAGE_LENGTH for message in messages)
+    assert all(message.startswith("30 new connections") for message in messages)
+    content = "".join(messages)
+    assert content.count("acme") == 20
+    assert content.endswith("... and 10 more devices\n")
+
+
+def test_expire_alarms(tmp_path):
+    config = {"DATABASE_PATH": str(tmp_path), "MONITOR_DELAY_SECS": 600, "ALARM_TTL_SECS": 60}
+    db = NetconMonDb(config)
+    now = datetime.now()
+    with db.transaction():
+        for i, last_seen in enumerate((now - timedelta(seconds=120), now - timedelta(seconds=30))):
+            db.add(mac=MacAddress(i), manufacturer="acme", last_seen=last_seen).set_alarm()
+
+    alarm = NetconMonAlarm(config)
+    events = []
+    alarm.bus.subscribe(lambda event, device: events.append((event, str(device.mac))))
+    alarm.seed(db)
+    assert alarm.next_expiry() == 0
+    assert [str(dev.mac) for dev in alarm.expire_alarms(db)] == ["00:00:00:00:00:00"]
+    assert events == [(EVENT_ALARM_CLEARED, "00:00:00:00:00:00")]
+    assert not db.get("00:00:00:00:00:00").in_alarm()
+    assert db.get("00:00:00:00:00:01").in_alarm()
+    assert 0 < alarm.next_expiry() <= 30
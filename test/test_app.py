@@ -0,0 +1,94 @@
+import gzip
+import re
+
+from netcon_monitor.dashboard.app import NetconMonApp
+from netcon_monitor.dashboard.events import NetconMonEventStream
+from netcon_monitor.dashboard.table import NetconMonDeviceTable
+from netcon_monitor.monitor.db import NetconMonDb
+from netcon_monitor.monitor.input import MacAddress
+from netcon_monitor.monitor.presence import NetconMonEventBus
+
+
+def _client(tmp_path):
+    app = NetconMonApp(None, "netcon_monitor.config.Config", None)
+    app.config["DATABASE_PATH"] = str(tmp_path)
+    app._db = NetconMonDb(app.config)
+    return app.test_client()
+
+
+def test_index_etag(tmp_path):
+    client = _client(tmp_path)
+    response = client.get("/")
+    assert response.status_code == 200
+    assert client.get("/", headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+
+
+def test_devices_changes(tmp_path):
+    client = _client(tmp_path)
+    db = client.application._db
+    etag = client.get("/").headers["ETag"]
+    with db.transaction():
+        for i in range(3):
+            db.add(mac=MacAddress(i), ip=f"10.0.0.{i}", manufacturer="acme")
+
+    # The page doesn't depend on the devices
+    assert client.get("/", headers={"If-None-Match": etag}).status_code == 304
+
+    data = client.get("/api/devices", query_string={"epoch": "", "since": 0}).get_json()
+    assert data == {"epoch": db.epoch, "revision": db.revision, "full": True, "changed": 3}
+    revision = db.revision
+    db.add(mac=MacAddress(1), ip="10.0.0.5", manufacturer="acme")
+    data = client.get("/api/devices", query_string={"epoch": db.epoch, "since": revision}).get_json()
+    assert data == {"epoch": db.epoch, "revision": revision + 1, "full": False, "changed": 1}
+
+    client.application._table = NetconMonDeviceTable(db)
+    table = client.get("/api/devices/table", query_string={"length": 2, "show_offline": "true"}).get_json()
+    assert (table["recordsTotal"], len(table["data"]), table["revision"]) == (3, 2, revision + 1)
+
+
+def test_static_fingerprint_and_compression(tmp_path):
+    client = _client(tmp_path)
+    url = re.search(r'src="([^"]*/dashboard.js\?v=\w+)"', client.get("/").get_data(as_text=True)).group(1)
+
+    response = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "immutable" in response.headers["Cache-Control"]
+    assert b"function refreshDashboards" in gzip.decompress(response.data)
+    headers = {"Accept-Encoding": "gzip", "If-None-Match": response.headers["ETag"]}
+    assert client.get(url, headers=headers).status_code == 304
+
+
+def test_static_precompress(tmp_path):
+    assets = NetconMonApp(None, "netcon_monitor.config.Config", None)._assets
+    assets.precompress()
+    assert ("js/dashboard.js", "gzip") in assets._compressed
+    assert all(assets.compressible(filename) for filename, _ in assets._compressed)
+    assert assets._hashes["js/dashboard.js"]
+
+
+def test_metrics(tmp_path):
+    client = _client(tmp_path)
+    client.application._db.save()
+    response = client.get("/metrics")
+    assert response.mimetype == "text/plain"
+    text = response.get_data(as_text=True)
+    assert "# TYPE netconmon_db_save_seconds histogram" in text
+    assert re.search(r'netconmon_db_save_seconds_bucket\{backend="NetconMonJsonDbBackend",le="\+Inf"\} [1-9]', text)
+
+
+def test_events_max_clients(tmp_path):
+    client = _client(tmp_path)
+    client.application.config["SSE_KEEPALIVE_SECS"] = 0.05
+    events = client.application._events = NetconMonEventStream(NetconMonEventBus(), queue_size=4, max_clients=1)
+
+    response = client.get("/api/events", buffered=False)
+    assert response.status_code == 200
+    assert next(response.response) == b"retry: 50\n\n"
+
+    # The browsers are told to come back later instead of getting an empty stream
+    rejected = client.get("/api/events")
+    assert rejected.status_code == 503
+    assert rejected.headers["Retry-After"] == "1"
+
+    response.close()
+    assert events.connect() is not None
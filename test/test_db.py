@@ -0,0 +1,115 @@
+import json
+
+from datetime import datetime
+
+from netcon_monitor.monitor.db import NetconMonDb, NetconMonJsonDbBackend, NetconMonSqliteDbBackend
+from netcon_monitor.monitor.input import MacAddress
+
+
+def _config(tmp_path, **kwargs):
+    config = {"DATABASE_PATH": str(tmp_path), "MONITOR_DELAY_SECS": 600}
+    config.update(kwargs)
+    return config
+
+
+def test_db_transaction_single_write(tmp_path, monkeypatch):
+    db = NetconMonDb(_config(tmp_path))
+    saves = []
+    save = db.save
+    monkeypatch.setattr(db, "save", lambda: saves.append(1) or save())
+
+    with db.transaction():
+        for i in range(10):
+            db.add(mac=MacAddress(f"0:0:0:0:0:{i:x}"), ip=f"192.168.0.{i}", manufacturer="acme")
+    assert len(saves) == 1
+
+    with open(tmp_path / NetconMonJsonDbBackend.DATABASE_FILE) as f:
+        assert len(json.load(f)) == 10
+
+    reloaded = NetconMonDb(_config(tmp_path))
+    assert str(reloaded.get("00:00:00:00:00:09").ip) == "192.168.0.9"
+
+
+def test_db_flush_interval(tmp_path):
+    db = NetconMonDb(_config(tmp_path, DATABASE_FLUSH_INTERVAL_SECS=3600))
+    db.add(mac=MacAddress("0:0:0:0:0:1"), manufacturer="acme")
+    db.add(mac=MacAddress("0:0:0:0:0:2"), manufacturer="acme")
+
+    with open(tmp_path / NetconMonJsonDbBackend.DATABASE_FILE) as f:
+        assert len(json.load(f)) == 1
+
+    db.close()
+    with open(tmp_path / NetconMonJsonDbBackend.DATABASE_FILE) as f:
+        assert len(json.load(f)) == 2
+
+
+def test_db_sqlite_queries(tmp_path):
+    db = NetconMonDb(_config(tmp_path))
+    db.add(mac=MacAddress("0:0:0:0:0:1"), ip="192.168.0.1", manufacturer="acme")
+    db.add(mac=MacAddress("0:0:0:0:0:2"), ip="192.168.1.2", manufacturer="acme", last_seen=datetime(2020, 1, 1))
+    db.close()
+
+    db = NetconMonDb(_config(tmp_path, DATABASE_BACKEND_CLASS=NetconMonSqliteDbBackend))
+    assert len(db.store) == 2
+    with db.transaction():
+        device = db.add(mac=MacAddress("0:0:0:0:0:3"), ip="192.168.1.3", manufacturer="acme")
+        device.set_alarm()
+        assert [str(dev.mac) for dev in db.alarm_devices()] == ["00:00:00:00:00:03"]
+    assert sorted(str(dev.mac) for dev in db.online_devices()) == ["00:00:00:00:00:01", "00:00:00:00:00:03"]
+    assert sorted(str(dev.mac) for dev in db.subnet_devices("192.168.1.0/24")) == ["00:00:00:00:00:02", "00:00:00:00:00:03"]
+    db.close()
+
+    db = NetconMonDb(_config(tmp_path, DATABASE_BACKEND_CLASS=NetconMonSqliteDbBackend))
+    assert db.get("00:00:00:00:00:03").in_alarm()
+    assert db.get("00:00:00:00:00:02").last_seen == datetime(2020, 1, 1)
+
+
+def test_db_touch(tmp_path):
+    for backend_class in (NetconMonJsonDbBackend, NetconMonSqliteDbBackend):
+        config = _config(tmp_path / backend_class.__name__, DATABASE_BACKEND_CLASS=backend_class)
+        (tmp_path / backend_class.__name__).mkdir()
+        db = NetconMonDb(config)
+        db.add(mac=MacAddress("0:0:0:0:0:1"), ip="192.168.0.1", manufacturer="acme", last_seen=datetime(2020, 1, 1))
+        db.touch([MacAddress("0:0:0:0:0:1"), MacAddress("0:0:0:0:0:2")])
+        assert db.get("00:00:00:00:00:01").last_seen > datetime(2020, 1, 1)
+        db.close()
+
+        db = NetconMonDb(config)
+        assert len(db.store) == 1
+        assert db.get("00:00:00:00:00:01").last_seen > datetime(2020, 1, 1)
+        assert str(db.get("00:00:00:00:00:01").ip) == "192.168.0.1"
+        db.close()
+
+
+def test_db_changes_since(tmp_path):
+    db = NetconMonDb(_config(tmp_path))
+    with db.transaction():
+        for i in range(3):
+            db.add(mac=MacAddress(i), manufacturer="acme")
+    revision, keys = db.changes_since(0)
+    assert revision == 3
+    assert keys == [MacAddress(2), MacAddress(1), MacAddress(0)]
+
+    # Touched items are not changes
+    db.touch([MacAddress(0)])
+    db.mark_changed([MacAddress(1)])
+    assert db.changes_since(revision) == (4, [MacAddress(1)])
+    assert db.changes_since(4) == (4, [])
+
+
+def test_db_snapshot_isolation(tmp_path):
+    db = NetconMonDb(_config(tmp_path))
+    db.add(mac=MacAddress(1), ip="192.168.0.1", manufacturer="acme")
+    snapshot = db.snapshot
+
+    with db.transaction():
+        device = db.get(MacAddress(1))
+        device.ip = "192.168.0.2"
+        db.add_item(device)
+        db.add(mac=MacAddress(2), manufacturer="acme")
+        assert db.snapshot is snapshot
+    assert str(snapshot.get(MacAddress(1)).ip) == "192.168.0.1"
+    assert len(snapshot.items) == 1
+
+    assert str(db.snapshot.get(MacAddress(1)).ip) == "192.168.0.2"
+    assert db.snapshot.changes_since(snapshot.revision) == (db.revision, [MacAddress(2), MacAddress(1)])
@@ -0,0 +1,162 @@
+import time
+
+from netcon_monitor.monitor.alarm import NetconMonAlarmNotifier
+from netcon_monitor.monitor.db import NetconMonDbItem
+from netcon_monitor.monitor.dispatch import NetconMonAlarmDispatcher, NetconMonAlarmRecord, is_transient_error
+from netcon_monitor.monitor.input import MacAddress
+
+
+class FlakyNotifier:
+    rate_limit_secs = 0
+
+    def __init__(self, failures, error=None):
+        self.failures = failures
+        self.error = error or ConnectionError("unreachable")
+        self.calls = 0
+        self.sent = []
+
+    def raise_alarm(self, device_list):
+        self.calls += 1
+        if self.failures:
+            self.failures -= 1
+            raise self.error
+        self.sent.append(device_list)
+
+
+class ChunkedNotifier(NetconMonAlarmNotifier):
+    MAX_MESSAGE_LENGTH = 200
+
+    def __init__(self, config, fail_at):
+        super().__init__(config)
+        self.fail_at = fail_at
+        self.calls = 0
+        self.sent = []
+
+    def send_message(self, content):
+        self.calls += 1
+        if self.calls == self.fail_at:
+            raise ConnectionError("reset")
+        self.sent.append(content)
+
+
+class HttpError(Exception):
+    def __init__(self, status):
+        super().__init__(f"status {status}")
+        self.status = status
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_dispatch_retry(tmp_path):
+    notifier = FlakyNotifier(failures=2)
+    dispatcher = NetconMonAlarmDispatcher({"DATABASE_PATH": str(tmp_path), "ALARM_RETRY_SECS": 0.01}, [notifier])
+    dispatcher.start()
+    device = NetconMonDbItem(mac=MacAddress("0:0:0:0:0:1"), ip="192.168.0.1", manufacturer="acme")
+    dispatcher.submit([device])
+    device.ip = "192.168.0.2"
+
+    assert _wait_for(lambda: notifier.sent)
+    assert notifier.sent[0][0].ip == "192.168.0.1"
+    dispatcher.stop()
+    assert not (tmp_path / NetconMonAlarmDispatcher.PENDING_FILE).exists()
+
+
+def test_dispatch_persist_undelivered(tmp_path):
+    config = {"DATABASE_PATH": str(tmp_path), "ALARM_RETRY_SECS": 60}
+    dispatcher = NetconMonAlarmDispatcher(config, [FlakyNotifier(failures=1)])
+    dispatcher.start()
+    dispatcher.submit([NetconMonDbItem(mac=MacAddress("0:0:0:0:0:1"), manufacturer="acme")])
+    dispatcher.stop()
+    assert (tmp_path / NetconMonAlarmDispatcher.PENDING_FILE).exists()
+
+    notifier = FlakyNotifier(failures=0)
+    dispatcher = NetconMonAlarmDispatcher(config, [notifier])
+    dispatcher.start()
+    assert _wait_for(lambda: notifier.sent)
+    assert notifier.sent[0][0].mac == "00:00:00:00:00:01"
+    dispatcher.stop()
+
+
+def test_dispatch_coalesce(tmp_path):
+    notifier = FlakyNotifier(failures=0)
+    dispatcher = NetconMonAlarmDispatcher({"DATABASE_PATH": str(tmp_path), "ALARM_COALESCE_SECS": 0.2}, [notifier])
+    dispatcher.start()
+    for i in range(3):
+        dispatcher.submit([NetconMonDbItem(mac=MacAddress(i), manufacturer="acme")])
+
+    assert _wait_for(lambda: notifier.sent)
+    dispatcher.stop()
+    assert len(notifier.sent) == 1
+    assert len(notifier.sent[0]) == 3
+
+
+def test_transient_errors():
+    assert is_transient_error(ConnectionError("reset"))
+    assert is_transient_error(TimeoutError())
+    assert is_transient_error(HttpError(503))
+    assert is_transient_error(HttpError(429))
+    assert not is_transient_error(HttpError(400))
+    assert not is_transient_error(HttpError(404))
+    assert not is_transient_error(KeyError("message"))
+
+
+def test_dispatch_drop_permanent(tmp_path):
+    notifier = FlakyNotifier(failures=1, error=HttpError(400))
+    dispatcher = NetconMonAlarmDispatcher({"DATABASE_PATH": str(tmp_path), "ALARM_RETRY_SECS": 0.01}, [notifier])
+    dispatcher.start()
+    dispatcher.submit([NetconMonDbItem(mac=MacAddress(1), manufacturer="acme")])
+    dispatcher.submit([NetconMonDbItem(mac=MacAddress(2), manufacturer="acme")])
+
+    # The rejected batch is not retried, the next one is sent
+    assert _wait_for(lambda: notifier.sent)
+    dispatcher.stop()
+    assert notifier.calls == 2
+    assert [batch[0].mac for batch in notifier.sent] == ["00:00:00:00:00:02"]
+    assert not (tmp_path / NetconMonAlarmDispatcher.PENDING_FILE).exists()
+
+
+def test_dispatch_resume_chunks(tmp_path):
+    config = {"DATABASE_PATH": str(tmp_path), "ALARM_RETRY_SECS": 0.01, "ALARM_DIGEST_MAX_DEVICES": 0}
+    notifier = ChunkedNotifier(config, fail_at=3)
+    dispatcher = NetconMonAlarmDispatcher(config, [notifier])
+    dispatcher.start()
+    devices = [NetconMonDbItem(mac=MacAddress(i), ip=f"10.0.0.{i}", manufacturer="acme") for i in range(20)]
+    messages = notifier.messages([NetconMonAlarmRecord.from_item(device) for device in devices])
+    assert len(messages) > 3
+    dispatcher.submit(devices)
+
+    # The third message fails once, it is sent again after the first two only
+    assert _wait_for(lambda: len(notifier.sent) == len(messages))
+    dispatcher.stop()
+    assert notifier.calls == len(messages) + 1
+    assert notifier.sent == messages
+    lines = [line for content in notifier.sent for line in content.splitlines() if line.startswith("- ")]
+    assert len(lines) == len(set(lines)) == 20
+
+
+def test_dispatch_persist_partly_sent(tmp_path):
+    config = {"DATABASE_PATH": str(tmp_path), "ALARM_RETRY_SECS": 60, "ALARM_DIGEST_MAX_DEVICES": 0}
+    notifier = ChunkedNotifier(config, fail_at=3)
+    dispatcher = NetconMonAlarmDispatcher(config, [notifier])
+    dispatcher.start()
+    devices = [NetconMonDbItem(mac=MacAddress(i), ip=f"10.0.0.{i}", manufacturer="acme") for i in range(20)]
+    messages = notifier.messages([NetconMonAlarmRecord.from_item(device) for device in devices])
+    dispatcher.submit(devices)
+    # Stopped while waiting to retry the third message
+    assert _wait_for(lambda: notifier.calls == 3)
+    dispatcher.stop()
+    assert notifier.sent == messages[:2]
+
+    # Only the messages not sent yet are sent at the next start
+    notifier = ChunkedNotifier(config, fail_at=0)
+    dispatcher = NetconMonAlarmDispatcher(config, [notifier])
+    dispatcher.start()
+    assert _wait_for(lambda: len(notifier.sent) == len(messages) - 2)
+    dispatcher.stop()
+    assert notifier.sent == messages[2:]
+    assert not (tmp_path / NetconMonAlarmDispatcher.PENDING_FILE).exists()
@@ -0,0 +1,19 @@
+from netcon_monitor.dashboard.events import NetconMonEventStream
+from netcon_monitor.monitor.presence import EVENT_JOIN, NetconMonEventBus
+
+
+def test_event_stream_drops_slow_clients():
+    bus = NetconMonEventBus()
+    stream = NetconMonEventStream(bus, queue_size=2, max_clients=2)
+    fast, slow = stream.connect(), stream.connect()
+    assert stream.connect() is None
+
+    fast_events = stream.events(fast, keepalive=0.01)
+    for i in range(4):
+        bus.publish(EVENT_JOIN, i)
+        assert next(fast_events) == (EVENT_JOIN, i)
+    assert next(fast_events) is None
+    assert slow.dropped and not fast.dropped
+
+    assert list(stream.events(slow, keepalive=0.01)) == []
+    assert stream.connect() is not None
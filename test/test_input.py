@@ -0,0 +1,418 @@
+import copy
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from ipaddress import ip_address
+from threading import Lock
+
+import pytest
+from paramiko import SSHException
+
+import netcon_monitor.monitor.input as netinput
+from netcon_monitor.monitor import kernel, metrics
+from netcon_monitor.monitor.input import (
+    MacAddress,
+    NetconMonArpCommandInput,
+    NetconMonAsusCommandResolver,
+    NetconMonCommand,
+    NetconMonError,
+    NetconMonIpCommandInput,
+    NetconMonIpMonitorInput,
+    NetconMonSshSession,
+)
+from netcon_monitor.monitor.kernel import NetconMonProcArpInput
+
+
+def test_mac_address_formats():
+    mac = MacAddress("aa:bb:cc:d:e:f")
+    assert str(mac) == "AA:BB:CC:0D:0E:0F"
+    assert int(mac) == 0xAABBCC0D0E0F
+    for mac_str in ["AA-BB-CC-0D-0E-0F", "aabb.cc0d.0e0f", "AABBCC0D0E0F", " aa:bb:cc:0d:0e:0f\n"]:
+        assert MacAddress(mac_str) == mac
+    assert MacAddress(0xAABBCC0D0E0F) == mac
+    assert MacAddress(bytes.fromhex("aabbcc0d0e0f")) == mac
+
+    for mac_str in ["aa:bb:cc:dd:ee", "aa:bb:cc:dd:ee:fg", "aa:bb:cc:dd:ee:ff:00", "a_bbccddeeff", ""]:
+        with pytest.raises(ValueError):
+            MacAddress(mac_str)
+    with pytest.raises(ValueError):
+        MacAddress(1 << 48)
+
+
+def test_mac_address_value():
+    mac = MacAddress("00:11:22:33:44:55")
+    assert {mac: 1}[MacAddress("00-11-22-33-44-55")] == 1
+    assert MacAddress("00:11:22:33:44:54") < mac
+    assert sorted([mac, MacAddress("00:00:00:00:00:01")])[0] == MacAddress("00:00:00:00:00:01")
+    assert copy.deepcopy(mac) == mac
+    with pytest.raises(AttributeError):
+        mac._value = 0
+
+
+def _input(input_class, output):
+    config = {"REMOTE_HOSTNAME": "", "MONITORED_NETWORKS": ["192.168.0.0/24"]}
+    fetcher = input_class(config)
+    fetcher.stream_command = lambda command: iter(output.splitlines(keepends=True))
+    return fetcher
+
+
+def test_ip_command_input():
+    fetcher = _input(
+        NetconMonIpCommandInput,
+        "192.168.0.1 dev br0 lladdr aa:bb:cc:dd:ee:01 router REACHABLE\n"
+        "192.168.0.2 dev br0 lladdr aa:bb:cc:dd:ee:02 STALE\n"
+        "192.168.0.3 dev br0  FAILED\n"
+        "192.168.0.4 dev br0 lladdr aa:bb:cc:dd:ee:04 INCOMPLETE\n"
+        "192.168.1.5 dev eth0 lladdr aa:bb:cc:dd:ee:05 REACHABLE\n"
+        "192.168.0.6 dev br0 lladdr zz:bb:cc:dd:ee:06 REACHABLE\n",
+    )
+    assert list(fetcher.get_monitored_devices()) == [
+        (ip_address("192.168.0.1"), MacAddress("aa:bb:cc:dd:ee:01")),
+        (ip_address("192.168.0.2"), MacAddress("aa:bb:cc:dd:ee:02")),
+    ]
+
+
+def test_arp_command_input():
+    fetcher = _input(
+        NetconMonArpCommandInput,
+        "? (192.168.0.1) at aa:bb:cc:dd:ee:1 [ether] on br0\n"
+        "? (192.168.0.3) at <incomplete> on br0\n"
+        "router (192.168.0.2) at aa:bb:cc:dd:ee:02 on en0 ifscope [ethernet]\n",
+    )
+    assert list(fetcher.get_monitored_devices()) == [
+        (ip_address("192.168.0.1"), MacAddress("aa:bb:cc:dd:ee:01")),
+        (ip_address("192.168.0.2"), MacAddress("aa:bb:cc:dd:ee:02")),
+    ]
+
+
+def test_ip_monitor_events():
+    fetcher = NetconMonIpMonitorInput({"REMOTE_HOSTNAME": "", "MONITORED_NETWORKS": []})
+    assert fetcher.parse_event("192.168.0.1 dev br0 lladdr aa:bb:cc:dd:ee:01 REACHABLE\n") == (
+        ip_address("192.168.0.1"), MacAddress("aa:bb:cc:dd:ee:01"), True
+    )
+    assert fetcher.parse_event("192.168.0.2 dev br0  FAILED\n") == (ip_address("192.168.0.2"), None, False)
+    assert fetcher.parse_event("192.168.0.3 dev br0 lladdr aa:bb:cc:dd:ee:03 INCOMPLETE\n") == (
+        ip_address("192.168.0.3"), MacAddress("aa:bb:cc:dd:ee:03"), False
+    )
+    assert fetcher.parse_event("Deleted 192.168.0.4 dev br0 lladdr aa:bb:cc:dd:ee:04 STALE\n") == (
+        ip_address("192.168.0.4"), MacAddress("aa:bb:cc:dd:ee:04"), False
+    )
+    assert fetcher.parse_event("192.168.0.5 dev br0 lladdr aa:bb:cc:dd:ee:05 PROBE\n")[2]
+    assert fetcher.parse_event("unrelated output\n") is None
+
+
+def test_ip_monitor_stop():
+    fetcher = NetconMonIpMonitorInput({"REMOTE_HOSTNAME": "", "MONITORED_NETWORKS": []})
+    fetcher.MONITOR_COMMAND = ["sh", "-c", "echo '192.168.0.2 dev br0  FAILED'; exec sleep 60"]
+    lost = []
+    fetcher.watch(lambda device: None, lambda dev_ip, dev_mac: lost.append(dev_ip))
+    start = time.monotonic()
+    while not lost and time.monotonic() - start < 5:
+        time.sleep(0.01)
+    assert lost == [ip_address("192.168.0.2")]
+
+    watcher = fetcher._watcher
+    fetcher.stop()
+    # The command is killed, and the watcher ends without restarting it
+    assert not watcher.is_alive()
+    assert time.monotonic() - start < 5
+    assert not fetcher._stream_closers
+
+
+def test_stream_command_metrics():
+    command = NetconMonCommand({"REMOTE_HOSTNAME": ""})
+    count = metrics.COMMAND_SECONDS.count(host="local")
+    errors = metrics.COMMAND_ERRORS.value(host="local")
+    assert list(command.stream_command(["printf", "a\\nb\\n"])) == ["a\n", "b\n"]
+    assert metrics.COMMAND_SECONDS.count(host="local") == count + 1
+
+    with pytest.raises(NetconMonError):
+        list(command.stream_command(["/nonexistent/command"]))
+    assert metrics.COMMAND_ERRORS.value(host="local") == errors + 1
+    assert metrics.COMMAND_SECONDS.count(host="local") == count + 1
+
+
+def test_proc_arp_input(tmp_path, monkeypatch):
+    arp_file = tmp_path / "arp"
+    arp_file.write_text(
+        "IP address       HW type     Flags       HW address            Mask     Device\n"
+        "192.168.0.1      0x1         0x2         aa:bb:cc:dd:ee:01     *        br0\n"
+        "192.168.0.2      0x1         0x0         00:00:00:00:00:00     *        br0\n"
+    )
+    monkeypatch.setattr(NetconMonProcArpInput, "PROC_ARP_FILE", str(arp_file))
+    fetcher = NetconMonProcArpInput({"MONITORED_NETWORKS": []})
+    assert list(fetcher.get_monitored_devices()) == [(ip_address("192.168.0.1"), MacAddress("aa:bb:cc:dd:ee:01"))]
+
+
+def test_proc_arp_input_invalid_lines(tmp_path, monkeypatch):
+    arp_file = tmp_path / "arp"
+    arp_file.write_text(
+        "IP address       HW type     Flags       HW address            Mask     Device\n"
+        "192.168.0.1      0x1         0x2         aa:bb:cc:dd:ee:01     *        br0\n"
+        "192.168.0.256    0x1         0x2         aa:bb:cc:dd:ee:02     *        br0\n"
+        "192.168.0.3      0x1         0xz         aa:bb:cc:dd:ee:03     *        br0\n"
+        "192.168.0.4      0x1         0x2         aa:bb:cc:dd:ee        *        br0\n"
+        "192.168.0.5      0x1         0x6         aa:bb:cc:dd:ee:05     *        br0\n"
+    )
+    monkeypatch.setattr(NetconMonProcArpInput, "PROC_ARP_FILE", str(arp_file))
+    fetcher = NetconMonProcArpInput({"MONITORED_NETWORKS": []})
+    assert list(fetcher.get_monitored_devices()) == [
+        (ip_address("192.168.0.1"), MacAddress("aa:bb:cc:dd:ee:01")),
+        (ip_address("192.168.0.5"), MacAddress("aa:bb:cc:dd:ee:05")),
+    ]
+
+
+def _neigh_message(state, ip, mac):
+    attrs = b""
+    for attr_type, value in [(kernel.NDA_DST, ip_address(ip).packed), (kernel.NDA_LLADDR, bytes.fromhex(mac))]:
+        attr = kernel.RTATTR.pack(kernel.RTATTR.size + len(value), attr_type) + value
+        attrs += attr + b"\0" * (kernel.nl_align(len(attr)) - len(attr))
+    payload = kernel.NDMSG.pack(0, 0, 0, 1, state, 0, 0) + attrs
+    return kernel.NLMSGHDR.pack(kernel.NLMSGHDR.size + len(payload), kernel.RTM_NEWNEIGH, 0, 1, 0) + payload
+
+
+def test_netlink_messages():
+    data = (
+        _neigh_message(0x02, "192.168.0.1", "aabbccddee01")
+        + _neigh_message(kernel.NUD_FAILED, "192.168.0.2", "aabbccddee02")
+        + _neigh_message(0x04, "fd00::3", "aabbccddee03")
+    )
+    assert list(kernel.parse_neigh_messages(data, kernel.NUD_FAILED)) == [
+        (ip_address("192.168.0.1"), MacAddress("aa:bb:cc:dd:ee:01")),
+        (ip_address("fd00::3"), MacAddress("aa:bb:cc:dd:ee:03")),
+    ]
+
+
+class FakeSshHost:
+    """Remote host of the fake ssh clients, counting their open channels."""
+
+    def __init__(self):
+        self.clients = []
+        self.connect_errors = []
+        self.outputs = {}
+        self.lock = Lock()
+        self.open_channels = 0
+        self.max_open_channels = 0
+
+    def __call__(self):
+        client = FakeSshClient(self)
+        self.clients.append(client)
+        return client
+
+
+class FakeChannel:
+    def __init__(self, host):
+        self._host = host
+        self.closed = False
+        with host.lock:
+            host.open_channels += 1
+            host.max_open_channels = max(host.max_open_channels, host.open_channels)
+
+    def close(self):
+        with self._host.lock:
+            if not self.closed:
+                self.closed = True
+                self._host.open_channels -= 1
+
+
+class FakeStdout:
+    """Output of a command, read at once, or followed until its channel is closed."""
+
+    def __init__(self, channel, lines, follow):
+        self.channel = channel
+        self._lines = lines
+        self._follow = follow
+
+    def read(self):
+        time.sleep(0.05)
+        self.channel.close()
+        return "".join(self._lines).encode()
+
+    def __iter__(self):
+        yield from self._lines
+        while self._follow and not self.channel.closed:
+            time.sleep(0.01)
+
+
+class FakeTransport:
+    def __init__(self):
+        self.active = True
+        self.keepalive = None
+
+    def is_active(self):
+        return self.active
+
+    def set_keepalive(self, interval):
+        self.keepalive = interval
+
+
+class FakeSshClient:
+    def __init__(self, host):
+        self._host = host
+        self.transport = None
+        self.closed = False
+
+    def set_missing_host_key_policy(self, policy):
+        pass
+
+    def load_system_host_keys(self):
+        pass
+
+    def connect(self, **kwargs):
+        if self._host.connect_errors:
+            raise self._host.connect_errors.pop(0)
+        self.transport = FakeTransport()
+
+    def get_transport(self):
+        return self.transport
+
+    def exec_command(self, command, timeout=None):
+        if command not in self._host.outputs:
+            raise SSHException(f"unknown command {command}")
+        stdout = FakeStdout(FakeChannel(self._host), self._host.outputs[command], follow=timeout is None)
+        return None, stdout, io.BytesIO()
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def ssh_host(monkeypatch):
+    host = FakeSshHost()
+    monkeypatch.setattr(netinput, "SSHClient", host)
+    return host
+
+
+def _ssh_session(**config):
+    return NetconMonSshSession(
+        {
+            "REMOTE_HOSTNAME": "router",
+            "REMOTE_PORT": 22,
+            "REMOTE_USER": "admin",
+            "REMOTE_PASS": "",
+            "REMOTE_PRIVATE_KEY": None,
+            "REMOTE_PRIVATE_KEY_FILE": None,
+            **config,
+        }
+    )
+
+
+def test_ssh_session_reconnect_backoff(ssh_host):
+    ssh_host.connect_errors = [OSError("unreachable")] * 3
+    session = _ssh_session(SSH_RECONNECT_MAX_BACKOFF_SECS=2)
+    for backoff in [1, 2, 2]:
+        with pytest.raises(NetconMonError, match="Unable to connect"):
+            session.connect()
+        # No new attempt before the backoff
+        with pytest.raises(NetconMonError, match=f"retrying in {backoff}s"):
+            session.connect()
+        session._next_attempt = 0.0
+    assert len(ssh_host.clients) == 3
+    assert all(client.closed for client in ssh_host.clients)
+
+    client = session.connect()
+    assert session.connect() is client
+    # Reconnected when the connection is lost, the backoff was reset
+    client.transport.active = False
+    assert session.connect() is not client
+    assert client.closed
+    assert session._backoff == 0
+    assert len(ssh_host.clients) == 5
+
+
+def test_ssh_session_keepalive(ssh_host):
+    session = _ssh_session(SSH_KEEPALIVE_SECS=7)
+    assert session.connect().get_transport().keepalive == 7
+
+
+def test_ssh_session_channel_limit(ssh_host):
+    ssh_host.outputs = {
+        "ip monitor neigh": ["192.168.0.1 dev br0 lladdr aa:bb:cc:dd:ee:01 REACHABLE\n"],
+        **{f"echo {name}": [f"{name}\n"] for name in "abcd"},
+    }
+    session = _ssh_session(SSH_MAX_CHANNELS=1)
+    closers = set()
+    stream = session.stream_command("ip monitor neigh", None, closers)
+    executor = ThreadPoolExecutor(max_workers=4)
+    try:
+        assert next(stream).startswith("192.168.0.1 ")
+        # The followed command doesn't hold the only channel of the others
+        futures = [executor.submit(session.exec_command, f"echo {name}") for name in "abcd"]
+        assert [future.result(timeout=5) for future in futures] == [(f"{name}\n", "") for name in "abcd"]
+        assert ssh_host.max_open_channels == 2
+        assert len(closers) == 1
+    finally:
+        stream.close()
+        executor.shutdown()
+    assert not closers
+    assert ssh_host.open_channels == 0
+
+    with pytest.raises(NetconMonError, match="Error executing missing on router"):
+        session.exec_command("missing")
+
+
+class FakeSession:
+    """Remote session answering the commands after a delay, the first ones last."""
+
+    def __init__(self, delays, failing=(), outputs=None):
+        self.delays = delays
+        self.failing = failing
+        self.outputs = outputs or {}
+        self.finished = []
+
+    def connect(self):
+        pass
+
+    def exec_command(self, command):
+        time.sleep(self.delays[command])
+        self.finished.append(command)
+        if command in self.failing:
+            raise NetconMonError(f"Error executing {command} on router")
+        return self.outputs.get(command, f"{command}\n"), ""
+
+
+def test_run_commands_order():
+    command = NetconMonCommand({"REMOTE_HOSTNAME": ""})
+    command._session = FakeSession({"cat a": 0.15, "cat b": 0.1, "cat c": 0.05})
+    assert command.run_commands([["cat", "a"], ["cat", "b"], ["cat", "c"]]) == [
+        ("cat a\n", ""),
+        ("cat b\n", ""),
+        ("cat c\n", ""),
+    ]
+    # Run concurrently, the results are not in the completion order
+    assert command._session.finished == ["cat c", "cat b", "cat a"]
+
+
+def test_run_commands_failure():
+    command = NetconMonCommand({"REMOTE_HOSTNAME": ""})
+    command._session = FakeSession({"cat a": 0.1, "cat b": 0.05, "cat c": 0}, failing=["cat b"])
+    errors = metrics.COMMAND_ERRORS.value(host="local")
+    with pytest.raises(NetconMonError, match="cat b"):
+        command.run_commands([["cat", "a"], ["cat", "b"], ["cat", "c"]])
+    # The other commands are not interrupted, the failure is counted once
+    assert sorted(command._session.finished) == ["cat a", "cat b", "cat c"]
+    assert metrics.COMMAND_ERRORS.value(host="local") == errors + 1
+
+
+def test_asus_resolver_precedence():
+    resolver = NetconMonAsusCommandResolver({"REMOTE_HOSTNAME": ""})
+    nmp, dns, cli = [
+        " ".join(command)
+        for command in [resolver.SHELL_COMMAND_NMP, resolver.SHELL_COMMAND_DNS_CFG, resolver.SHELL_COMMAND_CLI_CFG]
+    ]
+    outputs = {
+        nmp: '{"AA:BB:CC:DD:EE:01": {"name": "nmp1"}, "AA:BB:CC:DD:EE:02": {"name": "nmp2"}}',
+        dns: "dhcp-host=aa:bb:cc:dd:ee:02,192.168.0.2,dns2\n",
+        cli: "<cli1>AA:BB:CC:DD:EE:01>0>>",
+    }
+    # The configs overriding the others are received first
+    resolver._session = FakeSession({nmp: 0.1, dns: 0.05, cli: 0}, outputs=outputs)
+    assert resolver.get_hostname_mapping() == {
+        MacAddress("aa:bb:cc:dd:ee:01"): "cli1",
+        MacAddress("aa:bb:cc:dd:ee:02"): "dns2",
+    }
+    assert resolver._session.finished == [cli, dns, nmp]
+
+    # A failing command fails the whole mapping, it is retried at the next resolution
+    resolver._session = FakeSession({nmp: 0, dns: 0, cli: 0}, failing=[dns], outputs=outputs)
+    assert resolver.get_hostname_mapping() == {}
@@ -0,0 +1,223 @@
+import time
+from ipaddress import ip_address
+from threading import Event
+
+from netcon_monitor.monitor.input import MacAddress, NetconMonInput, NetconMonResolver
+from netcon_monitor.monitor.metrics import TARGET_ERRORS
+from netcon_monitor.monitor.monitor import NetconMonMonitor, NetconMonTarget
+
+
+class FakeInput(NetconMonInput):
+    devices = []
+
+    def get_connected_devices(self):
+        return list(self.devices)
+
+
+class SlowInput(NetconMonInput):
+    """Answer the target DEVICES after DELAY seconds, or once RELEASE is set."""
+
+    def get_connected_devices(self):
+        release = self._config.get("RELEASE")
+        if release:
+            release.wait(10)
+        else:
+            time.sleep(self._config["DELAY"])
+        return list(self._config["DEVICES"])
+
+
+class FakeResolver(NetconMonResolver):
+    def get_hostname_mapping(self):
+        return {}
+
+
+def _config(tmp_path, **kwargs):
+    config = {
+        "DATABASE_PATH": str(tmp_path),
+        "MONITOR_DELAY_SECS": 600,
+        "MONITOR_HOSTS_PERIODS": 6,
+        "ALARM_TTL_SECS": 1800,
+        "MONITORED_NETWORKS": [],
+        "REMOTE_HOSTNAME": None,
+    }
+    config.update(kwargs)
+    return config
+
+
+def _dev(ip, mac):
+    return ip_address(ip), MacAddress(mac)
+
+
+def test_target_diff(tmp_path):
+    target = NetconMonTarget("local", FakeInput, FakeResolver, _config(tmp_path))
+    devs = [_dev("192.168.0.1", "00:11:22:00:00:01"), _dev("192.168.0.2", "00:11:22:00:00:02")]
+    assert target.diff(devs) == (devs, [], [])
+
+    devs = [_dev("192.168.0.1", "00:11:22:00:00:01"), _dev("192.168.0.3", "00:11:22:00:00:02")]
+    devs.append(_dev("192.168.0.4", "00:11:22:00:00:04"))
+    changed, unchanged, removed = target.diff(devs[1:])
+    assert changed == devs[1:]
+    assert unchanged == []
+    assert removed == [MacAddress("00:11:22:00:00:01")]
+    assert target.diff(devs[1:]) == ([], [MacAddress("00:11:22:00:00:02"), MacAddress("00:11:22:00:00:04")], [])
+
+
+def test_process_poll_skips_unchanged(tmp_path):
+    monitor = NetconMonMonitor(FakeInput, FakeResolver, _config(tmp_path))
+    target = monitor._targets[0]
+    # Randomized MACs have no manufacturer, they are looked up once only
+    devs = [_dev("192.168.0.1", "02:11:22:00:00:01"), _dev("192.168.0.2", "00:11:22:00:00:02")]
+    assert monitor._process_poll(target, devs, {}, full=False) == 2
+
+    processed = []
+    process_device = monitor._alarm.process_device
+    monitor._alarm.process_device = lambda device: processed.append(device.mac) or process_device(device)
+    revision = monitor.db.revision
+    assert monitor._process_poll(target, devs, {}, full=False) == 2
+    assert processed == []
+    assert monitor.db.changes_since(revision) == (revision, [])
+
+    devs[1] = _dev("192.168.0.3", "00:11:22:00:00:02")
+    assert monitor._process_poll(target, devs, {}, full=False) == 2
+    assert processed == [MacAddress("00:11:22:00:00:02")]
+    monitor.stop()
+
+
+def test_unchanged_events_not_saved(tmp_path):
+    monitor = NetconMonMonitor(FakeInput, FakeResolver, _config(tmp_path))
+    source = monitor._targets[0].name
+    devs = [_dev("192.168.0.1", "02:11:22:00:00:01"), _dev("192.168.0.2", "02:11:22:00:00:02")]
+    assert monitor._process_events(devs, source) == 2
+
+    saves = []
+    monitor.db._backend.save = lambda store, dirty, touched=(): saves.append(dirty)
+    snapshot = monitor.db.snapshot
+    for _ in range(200):
+        assert monitor._process_events(devs[:1], source) == 0
+    assert saves == []
+    assert monitor.db.snapshot is snapshot
+
+    # A new ip is processed and saved
+    assert monitor._process_events([_dev("192.168.0.3", "02:11:22:00:00:01")], source) == 1
+    assert saves == [{MacAddress("02:11:22:00:00:01")}]
+
+    # Lost devices go offline, found by ip when their mac is unknown
+    monitor._targets[0].snapshot = {MacAddress("02:11:22:00:00:02"): ip_address("192.168.0.2")}
+    monitor._lose_devices([(source, ip_address("192.168.0.2"), None)])
+    assert MacAddress("02:11:22:00:00:02") not in monitor.presence
+    assert MacAddress("02:11:22:00:00:01") in monitor.presence
+    monitor.stop()
+
+
+def test_poll_targets_concurrently(tmp_path):
+    targets = [
+        {"NAME": f"site{i}", "DELAY": 0.3, "DEVICES": [_dev(f"192.168.{i}.1", f"00:11:22:00:0{i}:01")]}
+        for i in range(4)
+    ]
+    monitor = NetconMonMonitor(SlowInput, FakeResolver, _config(tmp_path, MONITOR_TARGETS=targets))
+    start = time.monotonic()
+    monitor._poll_targets(False)
+    # The targets are polled at the same time, not one after the other
+    assert time.monotonic() - start < 0.3 * 3
+    assert len(monitor.db.store) == 4
+    assert {target.name: len(target.snapshot) for target in monitor._targets} == {f"site{i}": 1 for i in range(4)}
+    monitor.stop()
+
+
+def test_poll_targets_timeout(tmp_path):
+    release = Event()
+    targets = [
+        {"NAME": "stuck", "RELEASE": release, "DEVICES": [_dev("192.168.0.1", "00:11:22:00:00:01")]},
+        {"NAME": "fast", "DELAY": 0, "DEVICES": [_dev("192.168.1.1", "00:11:22:00:01:01")]},
+    ]
+    config = _config(tmp_path, MONITOR_TARGETS=targets, MONITOR_TARGET_TIMEOUT_SECS=0.2)
+    monitor = NetconMonMonitor(SlowInput, FakeResolver, config)
+    stuck, fast = monitor._targets
+    timeouts = TARGET_ERRORS.value(target="stuck", error="timeout")
+
+    start = time.monotonic()
+    monitor._poll_targets(False)
+    # The stuck target is abandoned at its deadline, the other one is processed
+    assert 0.2 <= time.monotonic() - start < 2
+    assert TARGET_ERRORS.value(target="stuck", error="timeout") == timeouts + 1
+    assert stuck.snapshot is None
+    assert list(monitor.db.store.keys()) == [MacAddress("00:11:22:00:01:01")]
+
+    # The next cycle skips the stuck target while its poll is still running
+    future = stuck.future
+    monitor._poll_targets(False)
+    assert stuck.future is future
+    assert TARGET_ERRORS.value(target="stuck", error="timeout") == timeouts + 1
+
+    release.set()
+    future.result(timeout=5)
+    monitor._poll_targets(False)
+    assert len(monitor.db.store) == 2
+    monitor.stop()
+
+
+def test_presence_single_publish(tmp_path):
+    monitor = NetconMonMonitor(FakeInput, FakeResolver, _config(tmp_path))
+    source = monitor._targets[0].name
+    devs = [_dev(f"192.168.0.{i}", f"00:11:22:00:00:{i:02x}") for i in range(1, 51)]
+    publishes = []
+    publish = monitor.db._publish
+    monitor.db._publish = lambda: publishes.append(bool(monitor.db._unpublished)) or publish()
+
+    # 50 devices joining
+    assert monitor._process_events(devs, source) == 50
+    assert publishes.count(True) == 1
+
+    # 20 devices leaving, then all the others expiring
+    publishes.clear()
+    monitor._lose_devices([(source, dev_ip, dev_mac) for dev_ip, dev_mac in devs[:20]])
+    assert publishes.count(True) == 1
+    publishes.clear()
+    monitor.presence._ttl = -1
+    monitor._expire()
+    assert publishes.count(True) == 1
+    assert all(dev_mac not in monitor.presence for _, dev_mac in devs)
+    revision, keys = monitor.db.changes_since(0)
+    assert len(keys) == 50
+    monitor.stop()
+
+
+def test_poll_targets_more_than_workers(tmp_path):
+    targets = [
+        {"NAME": f"site{i}", "DELAY": 0.1, "DEVICES": [_dev(f"192.168.{i}.1", f"00:11:22:00:0{i}:01")]}
+        for i in range(4)
+    ]
+    config = _config(tmp_path, MONITOR_TARGETS=targets, MONITOR_MAX_WORKERS=1, MONITOR_TARGET_TIMEOUT_SECS=0.25)
+    monitor = NetconMonMonitor(SlowInput, FakeResolver, config)
+    timeouts = sum(TARGET_ERRORS.value(target=f"site{i}", error="timeout") for i in range(4))
+
+    # The targets waiting for the worker don't time out, their timeout starts with their poll
+    monitor._poll_targets(False)
+    assert len(monitor.db.store) == 4
+    assert sum(TARGET_ERRORS.value(target=f"site{i}", error="timeout") for i in range(4)) == timeouts
+    monitor.stop()
+
+
+def test_poll_targets_cancel_queued(tmp_path):
+    release = Event()
+    targets = [
+        {"NAME": "stuck", "RELEASE": release, "DEVICES": [], "MONITOR_TARGET_TIMEOUT_SECS": 0.6},
+        {"NAME": "queued", "DELAY": 0, "DEVICES": [_dev("192.168.1.1", "00:11:22:00:01:01")]},
+    ]
+    config = _config(
+        tmp_path, MONITOR_TARGETS=targets, MONITOR_MAX_WORKERS=1, MONITOR_TARGET_TIMEOUT_SECS=5, MONITOR_DELAY_SECS=0.3
+    )
+    monitor = NetconMonMonitor(SlowInput, FakeResolver, config)
+    stuck, queued = monitor._targets
+    cancelled = TARGET_ERRORS.value(target="queued", error="queued")
+
+    # The queued target is cancelled at the end of the period, instead of starting after the stuck one
+    start = time.monotonic()
+    monitor._poll_targets(False)
+    assert 0.6 <= time.monotonic() - start < 2
+    assert queued.future.cancelled()
+    assert TARGET_ERRORS.value(target="queued", error="queued") == cancelled + 1
+    release.set()
+    stuck.future.result(timeout=5)
+    assert queued.started is None
+    monitor.stop()
@@ -0,0 +1,22 @@
+from ipaddress import ip_address
+
+from netcon_monitor.monitor.netmatch import NetconMonNetworkMatcher
+
+
+def test_network_matcher():
+    matcher = NetconMonNetworkMatcher(
+        ["192.168.0.0/24", "192.168.1.0/24", "10.0.0.0/8", "10.1.0.0/16", "fd00::/64"],
+        ["192.168.1.128/25", "10.1.2.0/24", "fd00::ff/128"],
+    )
+    for ip in ["192.168.0.0", "192.168.1.127", "10.0.0.1", "10.1.3.4", "10.255.255.255", "fd00::1"]:
+        assert ip_address(ip) in matcher
+    for ip in ["192.168.1.128", "192.168.2.1", "10.1.2.3", "11.0.0.0", "9.255.255.255", "fd00::ff", "fd01::1"]:
+        assert ip_address(ip) not in matcher
+
+
+def test_network_matcher_all():
+    matcher = NetconMonNetworkMatcher([], ["192.168.0.0/24"])
+    assert ip_address("8.8.8.8") in matcher
+    assert ip_address("::1") in matcher
+    assert ip_address("192.168.0.1") not in matcher
+    assert ip_address("0.0.0.0") in NetconMonNetworkMatcher([])
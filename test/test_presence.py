@@ -0,0 +1,50 @@
+import time
+
+from netcon_monitor.monitor.db import NetconMonDbItem
+from netcon_monitor.monitor.input import MacAddress
+from netcon_monitor.monitor.presence import (
+    EVENT_JOIN,
+    EVENT_LEAVE,
+    NetconMonEventBus,
+    NetconMonPresenceSession,
+    NetconMonPresenceTracker,
+    NetconMonSessionHistory,
+)
+
+
+def test_presence_join_leave(tmp_path):
+    config = {"DATABASE_PATH": str(tmp_path)}
+    bus = NetconMonEventBus()
+    events = []
+    bus.subscribe(lambda event, payload: events.append((event, str(payload.mac))), [EVENT_JOIN, EVENT_LEAVE])
+    tracker = NetconMonPresenceTracker(config, bus, ttl=60)
+
+    now = time.time()
+    devices = [NetconMonDbItem(mac=MacAddress(i), manufacturer="acme") for i in range(3)]
+    tracker.seen(devices[0], now - 120)
+    tracker.seen(devices[1], now - 100)
+    tracker.seen(devices[2], now - 90)
+    tracker.seen(devices[0], now)
+    assert events == [(EVENT_JOIN, f"00:00:00:00:00:0{i}") for i in range(3)]
+    assert tracker.next_expiry() == 0
+
+    assert [str(session.mac) for session in tracker.expire()] == ["00:00:00:00:00:01", "00:00:00:00:00:02"]
+    assert events[3:] == [(EVENT_LEAVE, "00:00:00:00:00:01"), (EVENT_LEAVE, "00:00:00:00:00:02")]
+    assert MacAddress(0) in tracker
+    assert 0 < tracker.next_expiry() <= 60
+
+    sessions = list(NetconMonSessionHistory(config).sessions(MacAddress(1)))
+    assert [(session.start, session.end) for session in sessions] == [(now - 100, now - 100)]
+
+
+def test_session_history_retention(tmp_path):
+    config = {"DATABASE_PATH": str(tmp_path), "PRESENCE_HISTORY_MAX_SESSIONS": 3, "PRESENCE_HISTORY_RETENTION_SECS": 60}
+    history = NetconMonSessionHistory(config)
+    now = time.time()
+    history.append([NetconMonPresenceSession(MacAddress(0), now - 200, now - 100)])
+    history.append([NetconMonPresenceSession(MacAddress(i), now - 10, now) for i in range(1, 5)])
+    assert len(history) == 5
+
+    history = NetconMonSessionHistory(config)
+    assert len(history) == 3
+    assert [int(session.mac) for session in history.sessions()] == [2, 3, 4]
@@ -0,0 +1,62 @@
+import time
+from ipaddress import ip_address
+
+from netcon_monitor.monitor.input import (
+    MacAddress,
+    NetconMonAsusCommandResolver,
+    NetconMonCommand,
+    NetconMonIpCommandInput,
+)
+from netcon_monitor.monitor.replay import (
+    NetconMonCommandRecorder,
+    NetconMonReplayInput,
+    NetconMonReplayResolver,
+    replay_class,
+)
+
+
+def _config(path, speed=0):
+    return {
+        "REMOTE_HOSTNAME": "router",
+        "MONITORED_NETWORKS": ["192.168.0.0/24"],
+        "REPLAY_FILE": str(path),
+        "REPLAY_SPEED": speed,
+        "REPLAY_INPUT_CLASS": NetconMonIpCommandInput,
+        "REPLAY_RESOLVER_CLASS": NetconMonAsusCommandResolver,
+    }
+
+
+def test_record_and_replay(tmp_path, monkeypatch):
+    path = tmp_path / "recording.jsonl.gz"
+    recorder = NetconMonCommandRecorder(str(path))
+    monkeypatch.setattr(NetconMonCommand, "recorder", recorder)
+    assert NetconMonCommand({"REMOTE_HOSTNAME": ""}).run_command(["echo", "hello"]) == ("hello\n", "")
+    monkeypatch.setattr(NetconMonCommand, "recorder", None)
+    recorder.close()
+
+    command = replay_class(NetconMonCommand)({"REMOTE_HOSTNAME": "", "REPLAY_FILE": str(path), "REPLAY_SPEED": 0})
+    assert command.run_command(["echo", "hello"]) == ("hello\n", "")
+
+
+def test_replay_input_and_resolver(tmp_path):
+    path = tmp_path / "recording.jsonl.gz"
+    recorder = NetconMonCommandRecorder(str(path))
+    now = time.time()
+    for delay, mac in [(0, "aa:bb:cc:dd:ee:01"), (0.2, "aa:bb:cc:dd:ee:02")]:
+        neigh = f"192.168.0.1 dev br0 lladdr {mac} REACHABLE\n"
+        recorder.record("router", ["ip", "neigh"], now + delay, 0.1, neigh, "")
+    recorder.record("router", NetconMonAsusCommandResolver.SHELL_COMMAND_NMP, now, 0, '{"x": {"name": ""}}', "")
+    recorder.record("router", NetconMonAsusCommandResolver.SHELL_COMMAND_DNS_CFG, now, 0, "", "")
+    recorder.record("router", NetconMonAsusCommandResolver.SHELL_COMMAND_CLI_CFG, now, 0, "<tv>aa:bb:cc:dd:ee:02>>", "")
+    recorder.close()
+
+    fetcher = NetconMonReplayInput(_config(path, speed=2))
+    start = time.monotonic()
+    assert list(fetcher.get_monitored_devices()) == [(ip_address("192.168.0.1"), MacAddress("aa:bb:cc:dd:ee:01"))]
+    assert list(fetcher.get_monitored_devices()) == [(ip_address("192.168.0.1"), MacAddress("aa:bb:cc:dd:ee:02"))]
+    # Replayed at twice the recorded pace, the last output is kept once all are replayed
+    assert 0.15 <= time.monotonic() - start < 1
+    assert list(fetcher.get_monitored_devices())[0][1] == MacAddress("aa:bb:cc:dd:ee:02")
+
+    resolver = NetconMonReplayResolver(_config(path))
+    assert resolver.get_hostname_mapping() == {MacAddress("aa:bb:cc:dd:ee:02"): "tv"}
@@ -0,0 +1,49 @@
+from datetime import datetime
+
+from netcon_monitor.dashboard.table import NetconMonDeviceTable, NetconMonSearchIndex
+from netcon_monitor.monitor.db import NetconMonDb
+from netcon_monitor.monitor.input import MacAddress
+
+
+def test_device_table_query(tmp_path):
+    db = NetconMonDb({"DATABASE_PATH": str(tmp_path), "MONITOR_DELAY_SECS": 600})
+    with db.transaction():
+        for i in range(30):
+            db.add(mac=MacAddress(i), ip=f"10.0.0.{i}", hostname=f"host-{i}", manufacturer="acme")
+        db.add(mac=MacAddress(30), ip="10.0.0.30", hostname="old", last_seen=datetime(2020, 1, 1))
+    table = NetconMonDeviceTable(db)
+
+    _, count, devices = table.query(start=0, length=10, column=0, descending=True, search="", show_offline=False)
+    assert count == 30
+    assert [str(dev.ip) for dev in devices[:2]] == ["10.0.0.29", "10.0.0.28"]
+
+    _, count, devices = table.query(start=0, length=10, column=1, descending=False, search="", show_offline=True)
+    assert count == 31
+    assert [int(dev.mac) for dev in devices] == list(range(10))
+
+    _, count, devices = table.query(start=0, length=10, column=2, descending=False, search="HOST-2", show_offline=True)
+    assert [dev.hostname for dev in devices] == ["host-2"] + [f"host-2{i}" for i in range(9)]
+    assert count == 11
+
+    db.get(MacAddress(5)).hostname = "renamed"
+    db.add_item(db.get(MacAddress(5)))
+    _, count, devices = table.query(start=0, length=10, column=2, descending=False, search="renamed", show_offline=True)
+    assert count == 1
+
+
+def test_search_index():
+    index = NetconMonSearchIndex()
+    index.update(MacAddress(1), "10.0.0.1 host-1 acme")
+    index.update(MacAddress(2), "10.0.0.2 host-2 acme")
+    assert sorted(index.search("acme")) == [MacAddress(1), MacAddress(2)]
+    assert list(index.search("host-2")) == [MacAddress(2)]
+    assert sorted(index.search("-")) == [MacAddress(1), MacAddress(2)]
+    # All the trigrams match, but not the substring
+    assert list(index.search("acme host")) == []
+
+    index.update(MacAddress(2), "10.0.0.2 renamed")
+    assert list(index.search("acme")) == [MacAddress(1)]
+    index.update(MacAddress(1), None)
+    assert list(index.search("acme")) == []
+    assert len(index) == 1
+    assert index._postings.keys() == NetconMonSearchIndex._grams("10.0.0.2 renamed")
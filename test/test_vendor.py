@@ -0,0 +1,101 @@
+import time
+
+from netcon_monitor.monitor.input import MacAddress
+from netcon_monitor.monitor import metrics, vendor
+from netcon_monitor.monitor.vendor import NetconMonOuiRegistry, NetconMonVendorCache
+
+CSV_HEADER = "Registry,Assignment,Organization Name,Organization Address\n"
+
+
+def test_oui_registry(tmp_path):
+    oui_file = tmp_path / "oui.csv"
+    oui_file.write_text(CSV_HEADER + 'MA-L,001122,"Acme, Inc.",Somewhere\nMA-L,F0F0F0,Widgets,Elsewhere\n')
+    mam_file = tmp_path / "mam.csv"
+    mam_file.write_text(CSV_HEADER + "MA-M,0011223,Acme Sub,Somewhere\n")
+
+    registry = NetconMonOuiRegistry()
+    registry.load_csv(oui_file)
+    registry.load_csv(mam_file)
+    assert len(registry) == 3
+    assert registry.lookup(int(MacAddress("00:11:22:30:44:55"))) == "Acme Sub"
+    assert registry.lookup(int(MacAddress("00:11:22:43:44:55"))) == "Acme, Inc."
+    assert registry.lookup(int(MacAddress("F0:F0:F0:00:00:00"))) == "Widgets"
+    assert registry.lookup(int(MacAddress("00:11:23:00:00:00"))) is None
+
+    MacAddress.set_vendor_lookup(registry)
+    try:
+        assert MacAddress("f0:f0:f0:01:02:03").get_manufacturer() == "Widgets"
+        assert MacAddress("f0:f0:f1:01:02:03").get_manufacturer() is None
+    finally:
+        MacAddress.set_vendor_lookup()
+
+
+class _Response:
+    def __init__(self, status_code, content=b""):
+        self.status_code = status_code
+        self.content = content
+
+
+def test_vendor_cache(tmp_path, monkeypatch):
+    requested = []
+    responses = {"00:11:22": _Response(200, b"Acme"), "30:44:55": _Response(404), "60:77:88": _Response(429)}
+    monkeypatch.setattr(
+        vendor.requests, "get", lambda url, timeout: requested.append(url[-8:]) or responses[url[-8:]]
+    )
+    config = {"DATABASE_PATH": str(tmp_path), "VENDOR_LOOKUP_RATE_SECS": 0}
+    counts = {result: metrics.VENDOR_FETCHES.value(result=result) for result in ("found", "unknown", "error")}
+    fetches = metrics.VENDOR_FETCH_SECONDS.count()
+    cache = NetconMonVendorCache(config)
+    assert cache.lookup(int(MacAddress("00:11:22:00:00:01"))) is None
+    assert cache.lookup(int(MacAddress("00:11:22:00:00:02"))) is None
+    assert cache.lookup(int(MacAddress("30:44:55:00:00:01"))) is None
+    assert cache.lookup(int(MacAddress("60:77:88:00:00:01"))) is None
+    cache.process_batch(["00:11:22", "30:44:55", "60:77:88"])
+    assert requested == ["00:11:22", "30:44:55", "60:77:88"]
+    assert {result: metrics.VENDOR_FETCHES.value(result=result) - count for result, count in counts.items()} == {
+        "found": 1, "unknown": 1, "error": 1
+    }
+    assert metrics.VENDOR_FETCH_SECONDS.count() == fetches + 3
+
+    cache = NetconMonVendorCache(config)
+    hits, misses = metrics.VENDOR_LOOKUPS.value(result="hit"), metrics.VENDOR_LOOKUPS.value(result="miss")
+    assert cache.lookup(int(MacAddress("00:11:22:00:00:03"))) == "Acme"
+    assert cache.lookup(int(MacAddress("30:44:55:00:00:03"))) is None
+    assert cache.lookup(int(MacAddress("60:77:88:00:00:03"))) is None
+    assert list(cache._pending) == ["60:77:88"]
+    assert metrics.VENDOR_LOOKUPS.value(result="hit") == hits + 2
+    assert metrics.VENDOR_LOOKUPS.value(result="miss") == misses + 1
+
+
+def test_vendor_cache_rate_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(vendor.requests, "get", lambda url, timeout: _Response(200, b"Acme"))
+    cache = NetconMonVendorCache({"DATABASE_PATH": str(tmp_path), "VENDOR_LOOKUP_RATE_SECS": 0.05})
+    # Locally administered addresses are never looked up
+    assert cache.lookup(int(MacAddress("02:11:22:00:00:01"))) is None
+    assert not cache._pending
+
+    macs = [int(MacAddress(f"00:11:{i:02x}:00:00:01")) for i in range(5)]
+    for mac in macs:
+        cache.lookup(mac)
+    cache.start()
+    start = time.monotonic()
+    # New lookups wake up the cache thread, without shortening the delay between requests
+    while cache._pending and time.monotonic() - start < 5:
+        cache.lookup(int(MacAddress("00:22:00:00:00:01")))
+    elapsed = time.monotonic() - start
+    cache.stop()
+    assert elapsed >= 0.05 * 5
+
+
+def test_vendor_cache_save_error(tmp_path, monkeypatch):
+    monkeypatch.setattr(vendor.requests, "get", lambda url, timeout: _Response(200, b"Acme"))
+    cache = NetconMonVendorCache({"DATABASE_PATH": str(tmp_path / "missing"), "VENDOR_LOOKUP_RATE_SECS": 0})
+    cache.start()
+    cache.lookup(int(MacAddress("00:11:22:00:00:01")))
+    start = time.monotonic()
+    while cache._pending and time.monotonic() - start < 5:
+        time.sleep(0.01)
+    # The save failed, the thread is still running
+    assert cache.is_alive()
+    assert not cache._pending
+    cache.stop()